@@ -0,0 +1,38 @@
+"""
+COMPARE -
+Print latency and throughput deltas between two load_test.py reports.
+
+    python benchmarks/compare.py base.json head.json
+"""
+import json
+import sys
+
+
+def doDelta(base, head) -> str:
+    if base in (None, 0) or head is None:
+        return '   n/a'
+    return f'{(head - base) / base * 100:+6.1f}%'
+
+
+def main():
+    if len(sys.argv) != 3:
+        raise SystemExit(__doc__)
+    with open(sys.argv[1]) as f:
+        base = json.load(f)
+    with open(sys.argv[2]) as f:
+        head = json.load(f)
+    print(f'base: {base["meta"].get("commit")}  head: {head["meta"].get("commit")}')
+    print(f'{"scenario":32} {"p50 ms":>16} {"p95 ms":>16} {"p99 ms":>16} {"rps":>16} {"errors":>8}')
+    for name, h in head["scenarios"].items():
+        b = base["scenarios"].get(name)
+        if b is None:
+            print(f'{name:32} (new)')
+            continue
+        cols = [
+            f'{h[k]!s:>8} {doDelta(b[k], h[k])}' for k in ('p50_ms', 'p95_ms', 'p99_ms', 'throughput_rps')
+        ]
+        print(f'{name:32} ' + ' '.join(cols) + f' {sum(h["errors"].values()):>8}')
+
+
+if __name__ == '__main__':
+    main()
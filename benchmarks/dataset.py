@@ -0,0 +1,292 @@
+"""
+SYNTHETIC DATASET -
+NYC-like documents for benchmarks and scaling tests: restaurants (with grades history),
+neighborhoods and boroughs. Generation is deterministic for a given seed and size,
+so that reports can be compared between commits.
+
+Restaurant coordinates are drawn inside the real borough polygons of
+src/app/database/NY_BOROUGHS_GEOJSON.geojson (approximate envelopes when the file is missing),
+neighborhoods are a square tessellation of each borough.
+
+From root of the project, 1M restaurants written by 8 processes:
+    python benchmarks/dataset.py --size 1000000 --workers 8 --mongo-uri mongodb://127.0.0.1:27017
+or dumped to files (mongorestore .bson or mongoimport .ndjson):
+    python benchmarks/dataset.py --size 10000000 --workers 8 --dump ./dump --format bson
+"""
+import argparse
+from bisect import bisect
+from itertools import accumulate
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+
+import bson
+from bson import json_util
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+from app.modules.point.geospatial import doContainPoint, doGetBounds  # noqa: E402
+
+NY_BOROUGHS_GEOJSON = os.path.join(ROOT, 'src', 'app', 'database', 'NY_BOROUGHS_GEOJSON.geojson')
+
+# rough NYC extent [min_lon, min_lat, max_lon, max_lat]
+NYC_BOUNDS = (-74.25, 40.50, -73.70, 40.91)
+
+# approximate borough envelopes, used when NY_BOROUGHS_GEOJSON.geojson is not available
+BOROUGH_ENVELOPES = {
+    "Manhattan": [[-74.02, 40.70], [-73.97, 40.70], [-73.91, 40.80], [-73.93, 40.88], [-74.02, 40.76], [-74.02, 40.70]],
+    "Bronx": [[-73.93, 40.80], [-73.78, 40.80], [-73.77, 40.91], [-73.91, 40.91], [-73.93, 40.80]],
+    "Brooklyn": [[-74.04, 40.57], [-73.86, 40.57], [-73.86, 40.70], [-73.97, 40.70], [-74.04, 40.64], [-74.04, 40.57]],
+    "Queens": [[-73.96, 40.70], [-73.86, 40.57], [-73.70, 40.60], [-73.70, 40.80], [-73.91, 40.80], [-73.96, 40.70]],
+    "Staten Island": [[-74.26, 40.50], [-74.05, 40.50], [-74.05, 40.65], [-74.26, 40.65], [-74.26, 40.50]],
+}
+# share of restaurants by borough and zipcode ranges, close to sample_restaurants
+BOROUGH_WEIGHTS = {"Manhattan": 41, "Brooklyn": 24, "Queens": 22, "Bronx": 9, "Staten Island": 4}
+BOROUGH_ZIPCODES = {
+    "Manhattan": (10001, 10282),
+    "Bronx": (10451, 10475),
+    "Brooklyn": (11201, 11256),
+    "Queens": (11354, 11436),
+    "Staten Island": (10301, 10314),
+}
+
+CUISINES = [
+    "American", "Chinese", "Pizza", "Italian", "Mexican", "Japanese", "Caribbean", "Bakery",
+    "Spanish", "Café/Coffee/Tea", "Chicken", "Indian", "Thai", "Korean", "French", "Greek",
+    "Jewish/Kosher", "Delicatessen", "Hamburgers", "Donuts", "Seafood", "Mediterranean",
+]
+# frequency weights, long tail like the real dataset
+CUISINE_WEIGHTS = [60, 24, 12, 11, 8, 8, 7, 7, 6, 6, 5, 4, 3, 3, 3, 2, 3, 3, 3, 5, 2, 2]
+STREETS = [
+    "Broadway", "Avenue A", "Flatbush Avenue", "Atlantic Avenue", "Queens Boulevard", "Lexington Avenue",
+    "Bedford Avenue", "Grand Concourse", "Steinway Street", "Victory Boulevard", "Canal Street", "Main Street",
+]
+GRADES = ["A", "B", "C", "Z", "P", "Not Yet Graded"]
+GRADE_WEIGHTS = [70, 12, 5, 3, 2, 1]
+# score range by grade (lower is better)
+GRADE_SCORES = {"A": (0, 13), "B": (14, 27), "C": (28, 60)}
+# cumulative weights, computed once (random.choices would rebuild them at each call)
+CUISINE_CUM = list(accumulate(CUISINE_WEIGHTS))
+GRADE_CUM = list(accumulate(GRADE_WEIGHTS))
+
+
+def doGrades(rnd: random.Random) -> list[dict]:
+    """
+    Inspection history, most recent first (as in sample_restaurants).
+    """
+    rand = rnd.random
+    date = datetime(2015, 1, 20) - timedelta(days=int(rand() * 121))
+    l_grades = []
+    for _ in range(1 + int(rand() * 8)):
+        grade = GRADES[bisect(GRADE_CUM, rand() * GRADE_CUM[-1])]
+        low, high = GRADE_SCORES.get(grade, (0, 40))
+        l_grades.append({"date": date, "grade": grade, "score": low + int(rand() * (high - low + 1))})
+        date -= timedelta(days=60 + int(rand() * 341))
+    return l_grades
+
+
+def doLoadBoroughs(path: str = NY_BOROUGHS_GEOJSON) -> list[dict]:
+    """
+    Borough documents {name, geometry} from NYC Borough Boundaries geojson, or approximate envelopes.
+    """
+    if os.path.exists(path):
+        with open(path) as f:
+            features = json.load(f).get("features", [])
+        return [
+            {"name": feat.get("properties", {}).get("boro_name", f"Borough {i}"), "geometry": feat["geometry"]}
+            for i, feat in enumerate(features)
+        ]
+    return [
+        {"name": name, "geometry": {"type": "Polygon", "coordinates": [ring]}}
+        for name, ring in BOROUGH_ENVELOPES.items()
+    ]
+
+
+class BoroughSampler():
+    """
+    Draw random points inside borough polygons (rejection sampling in polygon bounding box).
+    """
+    def __init__(self, boroughs: list[dict]):
+        self.boroughs = boroughs
+        self.bounds = [doGetBounds(b["geometry"]) for b in boroughs]
+        self.weights = [BOROUGH_WEIGHTS.get(b["name"], 10) for b in boroughs]
+
+    def doPoint(self, rnd: random.Random, idx: int) -> list[float]:
+        min_lon, min_lat, max_lon, max_lat = self.bounds[idx]
+        geometry = self.boroughs[idx]["geometry"]
+        for _ in range(1000):
+            lon, lat = rnd.uniform(min_lon, max_lon), rnd.uniform(min_lat, max_lat)
+            if doContainPoint(geometry, lon, lat):
+                return [round(lon, 7), round(lat, 7)]
+        return [round((min_lon + max_lon) / 2, 7), round((min_lat + max_lat) / 2, 7)]
+
+    def doPick(self, rnd: random.Random) -> tuple[str, list[float]]:
+        idx = rnd.choices(range(len(self.boroughs)), self.weights)[0]
+        return self.boroughs[idx]["name"], self.doPoint(rnd, idx)
+
+
+def doRestaurant(rnd: random.Random, idx: int, borough: str, coord: list[float]) -> dict:
+    zip_min, zip_max = BOROUGH_ZIPCODES.get(borough, (10001, 11697))
+    return {
+        "address": {
+            "building": str(rnd.randint(1, 9999)),
+            "coord": coord,
+            "street": rnd.choice(STREETS),
+            "zipcode": str(rnd.randint(zip_min, zip_max)),
+        },
+        "borough": borough,
+        "cuisine": CUISINES[bisect(CUISINE_CUM, rnd.random() * CUISINE_CUM[-1])],
+        "grades": doGrades(rnd),
+        "name": f"{rnd.choice(['Joe', 'Golden', 'Happy', 'New', 'Little', 'Big', 'Royal', 'Sunny'])} {rnd.choice(CUISINES)} {idx}",
+        "restaurant_id": str(30000000 + idx),
+    }
+
+
+# restaurants sharing one random stream
+CHUNK = 10000
+
+
+def doIterRestaurants(start: int, stop: int, seed: int = 42, sampler: BoroughSampler = None):
+    """
+    Restaurants of index [start, stop[. Each chunk of CHUNK indexes has its own random stream,
+    so that any range is generated identically whatever the number of workers.
+    """
+    sampler = sampler or BoroughSampler(doLoadBoroughs())
+    for chunk in range(start - start % CHUNK, stop, CHUNK):
+        rnd = random.Random(f'{seed}-{chunk}')
+        for idx in range(chunk, min(chunk + CHUNK, stop)):
+            borough, coord = sampler.doPick(rnd)
+            doc = doRestaurant(rnd, idx, borough, coord)
+            if idx >= start:
+                yield doc
+
+
+def doGenerateRestaurants(size: int, seed: int = 42) -> list[dict]:
+    return list(doIterRestaurants(0, size, seed))
+
+
+def doGenerateBoroughs() -> list[dict]:
+    return doLoadBoroughs()
+
+
+def doGenerateNeighborhoods(cell_deg: float = 0.02, boroughs: list[dict] = None) -> list[dict]:
+    """
+    Square tessellation of each borough: cells of <cell_deg> degrees whose center is inside the borough.
+    0.02 gives ~200 neighborhoods (as sample_restaurants), 0.002 ~20k.
+    """
+    l_docs = []
+    for borough in boroughs or doLoadBoroughs():
+        min_lon, min_lat, max_lon, max_lat = doGetBounds(borough["geometry"])
+        i = 0
+        x = min_lon
+        while x < max_lon:
+            y = min_lat
+            j = 0
+            while y < max_lat:
+                center = [x + cell_deg / 2, y + cell_deg / 2]
+                if doContainPoint(borough["geometry"], *center):
+                    ring = [[x, y], [x + cell_deg, y], [x + cell_deg, y + cell_deg], [x, y + cell_deg], [x, y]]
+                    l_docs.append({
+                        "name": f"{borough['name']} {i}-{j}",
+                        "geometry": {"type": "Polygon", "coordinates": [ring], "centroid": center},
+                    })
+                y += cell_deg
+                j += 1
+            x += cell_deg
+            i += 1
+    return l_docs
+
+
+### Writers #
+def doWriteChunkMongo(uri: str, db_name: str, start: int, stop: int, seed: int, batch: int) -> int:
+    from pymongo import MongoClient
+    client = MongoClient(uri)
+    coll = client[db_name]["restaurants"]
+    sampler = BoroughSampler(doLoadBoroughs())
+    count, l_batch = 0, []
+    for doc in doIterRestaurants(start, stop, seed, sampler):
+        l_batch.append(doc)
+        if len(l_batch) >= batch:
+            count += len(coll.insert_many(l_batch, ordered=False).inserted_ids)
+            l_batch = []
+    if l_batch:
+        count += len(coll.insert_many(l_batch, ordered=False).inserted_ids)
+    client.close()
+    return count
+
+
+def doWriteChunkFile(path: str, fmt: str, start: int, stop: int, seed: int) -> int:
+    count = 0
+    sampler = BoroughSampler(doLoadBoroughs())
+    with open(path, 'wb') as f:
+        for doc in doIterRestaurants(start, stop, seed, sampler):
+            if fmt == 'bson':
+                f.write(bson.encode(doc))
+            else:
+                f.write(json_util.dumps(doc, json_options=json_util.RELAXED_JSON_OPTIONS).encode() + b'\n')
+            count += 1
+    return count
+
+
+def doRunParallel(fn, tasks: list[tuple], workers: int) -> int:
+    total, start = 0, time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(fn, *task) for task in tasks]
+        for future in as_completed(futures):
+            total += future.result()
+            rate = total / (time.perf_counter() - start)
+            print(f'{total} restaurants ({rate:.0f}/s)', flush=True)
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic NYC restaurants dataset.')
+    parser.add_argument('--size', type=int, default=10000, help='restaurants (10k to 10M)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--chunk', type=int, default=100000, help='restaurants per worker task')
+    parser.add_argument('--batch', type=int, default=5000, help='insert_many batch size')
+    parser.add_argument('--neighborhood-cell', type=float, default=0.02, help='neighborhood cell size (degrees)')
+    parser.add_argument('--mongo-uri', default=os.getenv('MONGO_URI'))
+    parser.add_argument('--db', default=os.getenv('DB_NAME', 'sample_restaurants'))
+    parser.add_argument('--drop', action='store_true', help='drop collections before insert')
+    parser.add_argument('--dump', help='output directory instead of mongo')
+    parser.add_argument('--format', choices=['bson', 'ndjson'], default='bson')
+    args = parser.parse_args()
+
+    boroughs = doLoadBoroughs()
+    neighborhoods = doGenerateNeighborhoods(args.neighborhood_cell, boroughs)
+    ranges = [(s, min(s + args.chunk, args.size)) for s in range(0, args.size, args.chunk)]
+    start = time.perf_counter()
+    if args.dump:
+        os.makedirs(args.dump, exist_ok=True)
+        ext = 'bson' if args.format == 'bson' else 'ndjson'
+        for name, docs in (('boroughs', boroughs), ('neighborhoods', neighborhoods)):
+            with open(os.path.join(args.dump, f'{name}.{ext}'), 'wb') as f:
+                for doc in docs:
+                    f.write(bson.encode(doc) if ext == 'bson' else json_util.dumps(doc).encode() + b'\n')
+        tasks = [(os.path.join(args.dump, f'restaurants.part-{i:05d}.{ext}'), args.format, s, e, args.seed) for i, (s, e) in enumerate(ranges)]
+        total = doRunParallel(doWriteChunkFile, tasks, args.workers)
+    else:
+        from pymongo import MongoClient
+        client = MongoClient(args.mongo_uri)
+        db = client[args.db]
+        if args.drop:
+            for name in ('restaurants', 'neighborhoods', 'boroughs'):
+                db[name].drop()
+        db.boroughs.insert_many(boroughs)
+        db.neighborhoods.insert_many(neighborhoods)
+        client.close()
+        tasks = [(args.mongo_uri, args.db, s, e, args.seed, args.batch) for s, e in ranges]
+        total = doRunParallel(doWriteChunkMongo, tasks, args.workers)
+    elapsed = time.perf_counter() - start
+    print(f'{total} restaurants, {len(neighborhoods)} neighborhoods, {len(boroughs)} boroughs in {elapsed:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
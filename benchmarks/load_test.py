@@ -0,0 +1,294 @@
+"""
+LOAD TEST -
+Drive every router of the api at fixed concurrency against a local database,
+and record p50/p95/p99 latency, throughput, errors and RSS into a json report.
+
+Backends:
+    --backend mongod      start a throwaway local mongod (binary in PATH), load synthetic dataset.
+    --backend inprocess   mongomock in-process stand-in (unit-level runs, no geo operators:
+                          geo routes are reported with errors).
+    --backend uri         use MONGO_URI as is (dataset loaded unless --no-load).
+
+The api runs in-process (httpx ASGITransport, same code path as uvicorn minus sockets),
+or is reached at --url when already served.
+
+From root of the project:
+    pip install -r benchmarks/requirements.txt
+    python benchmarks/load_test.py --backend mongod --size 25000 --concurrency 16 --output report.json
+    python benchmarks/compare.py base.json report.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from dataset import (  # noqa: E402
+    CUISINES,
+    NYC_BOUNDS,
+    doGenerateBoroughs,
+    doGenerateNeighborhoods,
+    doGenerateRestaurants,
+)
+
+
+### Backends #
+def doFreePort() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def doStartMongod() -> tuple[subprocess.Popen, str, str]:
+    """
+    Start mongod on a free port with a temporary dbpath. Return (process, uri, dbpath).
+    """
+    binary = shutil.which('mongod')
+    if binary is None:
+        raise SystemExit('mongod binary not found in PATH - use --backend inprocess or --backend uri')
+    dbpath = tempfile.mkdtemp(prefix='bench_mongod_')
+    port = doFreePort()
+    proc = subprocess.Popen(
+        [binary, '--dbpath', dbpath, '--port', str(port), '--bind_ip', '127.0.0.1', '--quiet'],
+        stdout=subprocess.DEVNULL,
+    )
+    uri = f'mongodb://127.0.0.1:{port}'
+    from pymongo import MongoClient
+    client = MongoClient(uri, serverSelectionTimeoutMS=20000)
+    client.admin.command('ping')
+    client.close()
+    return proc, uri, dbpath
+
+
+def doLoadDataset(db, size: int, seed: int):
+    for name in ('restaurants', 'neighborhoods', 'boroughs'):
+        db[name].drop()
+    l_docs = doGenerateRestaurants(size, seed)
+    for i in range(0, len(l_docs), 5000):
+        db.restaurants.insert_many(l_docs[i:i + 5000])
+    db.neighborhoods.insert_many(doGenerateNeighborhoods())
+    db.boroughs.insert_many(doGenerateBoroughs())
+
+
+### Scenarios #
+def doPoint(rnd: random.Random) -> dict:
+    min_lon, min_lat, max_lon, max_lat = NYC_BOUNDS
+    return {"longitude": rnd.uniform(min_lon + 0.1, max_lon - 0.1), "latitude": rnd.uniform(min_lat + 0.1, max_lat - 0.1)}
+
+
+def doScenarios(size: int) -> list[tuple[str, str, str, callable]]:
+    """
+    (name, method, path, body_factory(rnd, i)) for each route.
+    Write scenarios work on restaurants created by "restaurant_create".
+    """
+    def bench_id(i):
+        return f'bench-{i}'
+
+    def restaurant(rnd, i):
+        coord = doPoint(rnd)
+        return {
+            "address": {"building": "1", "coord": [coord["longitude"], coord["latitude"]], "street": "Broadway", "zipcode": "10001"},
+            "borough": "Manhattan", "cuisine": rnd.choice(CUISINES),
+            "grades": [{"date": "2015-01-01T00:00:00", "grade": "A", "score": 5}],
+            "name": f"Bench {i}", "restaurant_id": bench_id(i),
+        }
+
+    def eq(field, value):
+        return {"field": field, "operator_field": "$eq", "value": value}
+
+    pages = max(1, size // 20)
+    # update targets taken from generated polygons (names depend on borough and tessellation)
+    neighborhood = doGenerateNeighborhoods()[0]["name"]
+    borough = doGenerateBoroughs()[0]["name"]
+    return [
+        ("restaurant_one", "POST", "/one", lambda rnd, i: {"params": {"nbr": 1, "page_nbr": rnd.randint(1, 50)}}),
+        ("restaurant_list", "POST", "/list", lambda rnd, i: {"params": {"nbr": 20, "page_nbr": rnd.randint(1, min(pages, 50)), "filters": eq("cuisine", rnd.choice(CUISINES))}}),
+        ("restaurant_list_contain", "POST", "/list", lambda rnd, i: {"params": {"nbr": 20, "page_nbr": 1, "filters": {"field": "name", "operator_field": "$regex", "value": rnd.choice(["golden", "pizza", "royal"])}}}),
+        ("restaurant_distinct_cuisine", "POST", "/distinct", lambda rnd, i: {"params": {"sort": {"field": "cuisine", "way": 1}}}),
+        ("restaurant_distinct_name", "POST", "/distinct", lambda rnd, i: {"params": {"nbr": 50, "page_nbr": rnd.randint(1, 20), "sort": {"field": "name", "way": 1}}}),
+        ("point_to_restaurant", "POST", "/point/to_restaurant", lambda rnd, i: {"coord": doPoint(rnd), "dist": {"min": 0, "max": 1000}, "params": {"nbr": 20, "page_nbr": 1, "filters": {}}}),
+        ("point_from_neighborhood", "POST", "/point/from_neighborhood", lambda rnd, i: {"coord": doPoint(rnd), "params": {}}),
+        ("point_in_bbox", "POST", "/point/in_bbox", lambda rnd, i: (lambda p: {"bbox": {"min_longitude": p["longitude"] - 0.02, "min_latitude": p["latitude"] - 0.01, "max_longitude": p["longitude"] + 0.02, "max_latitude": p["latitude"] + 0.01}, "params": {"nbr": 100, "page_nbr": 1}, "zoom": 15})(doPoint(rnd))),
+        ("point_to_restaurant_within", "POST", "/point/to_restaurant_within", lambda rnd, i: {"params": {"nbr": 20, "page_nbr": 1, "filters": {}}}),
+        ("borough_one", "POST", "/borough/one", lambda rnd, i: {"params": {}}),
+        ("borough_list", "POST", "/borough/list", lambda rnd, i: {"params": {"nbr": 5, "page_nbr": 1}}),
+        ("borough_contain", "POST", "/borough/contain", lambda rnd, i: {"coord": doPoint(rnd)}),
+        ("neighborhood_one", "POST", "/neighborhood/one", lambda rnd, i: {"params": {}}),
+        ("neighborhood_list", "POST", "/neighborhood/list", lambda rnd, i: {"params": {"nbr": 50, "page_nbr": rnd.randint(1, 3)}}),
+        ("neighborhood_distinct", "POST", "/neighborhood/distinct", lambda rnd, i: {"params": {"sort": {"field": "name", "way": 1}}}),
+        # writes
+        ("restaurant_create", "POST", "/create", lambda rnd, i: {"restaurant": restaurant(rnd, i), "params": {}}),
+        ("restaurant_update", "PUT", "/update", lambda rnd, i: {"id": bench_id(i), "changes": {"cuisine": rnd.choice(CUISINES)}, "params": {}}),
+        ("restaurant_field_set", "PUT", "/update/field/set", lambda rnd, i: {"new_item": {"bench_flag": i}, "params": {"filters": eq("restaurant_id", bench_id(i))}}),
+        ("restaurant_field_rename", "PUT", "/update/field/name", lambda rnd, i: {"field": "bench_flag", "new_field": "bench_flag2", "params": {"filters": eq("restaurant_id", bench_id(i))}}),
+        ("restaurant_field_unset", "DELETE", "/update/field/unset", lambda rnd, i: {"field": "bench_flag2", "params": {"filters": eq("restaurant_id", bench_id(i))}}),
+        ("neighborhood_update", "PUT", "/neighborhood/update", lambda rnd, i: {"name": neighborhood, "changes": {"bench_flag": i}, "params": {}}),
+        ("borough_update", "PUT", "/borough/update", lambda rnd, i: {"name": borough, "changes": {"bench_flag": i}, "params": {}}),
+        ("restaurant_delete", "DELETE", "/delete", lambda rnd, i: {"id": bench_id(i), "params": {}}),
+    ]
+
+
+### Runner #
+def doRss() -> dict:
+    with open('/proc/self/statm') as f:
+        rss_pages = int(f.read().split()[1])
+    return {
+        "rss_mb": round(rss_pages * os.sysconf('SC_PAGE_SIZE') / 2**20, 1),
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def doPercentile(values: list[float], pct: float) -> float:
+    if not values:
+        return None
+    values = sorted(values)
+    k = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return round(values[k] * 1000, 2)
+
+
+async def doRunScenario(client: httpx.AsyncClient, scenario, requests: int, concurrency: int, seed: int) -> dict:
+    name, method, path, body = scenario
+    latencies: list[float] = []
+    errors: dict[str, int] = {}
+    counter = iter(range(requests))
+
+    async def worker(wid: int):
+        rnd = random.Random(f'{seed}-{name}-{wid}')
+        for i in counter:
+            start = time.perf_counter()
+            try:
+                resp = await client.request(method, path, json=body(rnd, i))
+                status = resp.status_code
+            except Exception as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - start)
+            if not (isinstance(status, int) and status < 400):
+                errors[str(status)] = errors.get(str(status), 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(w) for w in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        "route": f'{method} {path}',
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": doPercentile(latencies, 50),
+        "p95_ms": doPercentile(latencies, 95),
+        "p99_ms": doPercentile(latencies, 99),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 2) if latencies else None,
+        **doRss(),
+    }
+
+
+async def doRun(args, base_url: str = None) -> dict:
+    l_results = {}
+    scenarios = [s for s in doScenarios(args.size) if not args.only or s[0] in args.only]
+    if base_url:
+        client = httpx.AsyncClient(base_url=base_url, timeout=args.timeout)
+        async with client:
+            for scenario in scenarios:
+                l_results[scenario[0]] = await doRunScenario(client, scenario, args.requests, args.concurrency, args.seed)
+                print(scenario[0], l_results[scenario[0]], flush=True)
+        return l_results
+
+    from app.main import app
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://bench', timeout=args.timeout) as client:
+            # wait for warmup tasks (indexes)
+            for _ in range(600):
+                if (await client.get('/readyz')).status_code == 200:
+                    break
+                await asyncio.sleep(0.1)
+            for scenario in scenarios:
+                l_results[scenario[0]] = await doRunScenario(client, scenario, args.requests, args.concurrency, args.seed)
+                print(scenario[0], l_results[scenario[0]], flush=True)
+    return l_results
+
+
+def doGitCommit() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True).strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test every api router.')
+    parser.add_argument('--backend', choices=['mongod', 'inprocess', 'uri'], default='mongod')
+    parser.add_argument('--url', help='benchmark an already served api instead of in-process app')
+    parser.add_argument('--size', type=int, default=25000, help='number of synthetic restaurants')
+    parser.add_argument('--requests', type=int, default=500, help='requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--only', nargs='*', help='scenario names to run')
+    parser.add_argument('--no-load', action='store_true', help='keep existing data (uri backend)')
+    parser.add_argument('--output', help='json report path')
+    args = parser.parse_args()
+
+    mongod = None
+    dbpath = None
+    db_name = os.getenv('DB_NAME', 'sample_restaurants')
+    try:
+        if args.backend == 'mongod':
+            mongod, uri, dbpath = doStartMongod()
+            os.environ['MONGO_URI'] = uri
+        if args.backend == 'inprocess':
+            import mongomock
+            shared = mongomock.MongoClient()
+            import app.main as app_main
+            app_main.MongoClient = lambda *a, **k: shared
+            doLoadDataset(shared[db_name], args.size, args.seed)
+        elif not args.no_load:
+            from pymongo import MongoClient
+            client = MongoClient(os.getenv('MONGO_URI'))
+            doLoadDataset(client[db_name], args.size, args.seed)
+            client.close()
+
+        started = time.time()
+        results = asyncio.run(doRun(args, args.url))
+        report = {
+            "meta": {
+                "commit": doGitCommit(),
+                "date": datetime.now().isoformat(timespec='seconds'),
+                "duration_s": round(time.time() - started, 1),
+                "backend": args.backend,
+                "url": args.url,
+                "size": args.size,
+                "requests": args.requests,
+                "concurrency": args.concurrency,
+                "seed": args.seed,
+                "python": sys.version.split()[0],
+            },
+            "scenarios": results,
+        }
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(report, f, indent=2)
+            print(f'Report written to {args.output}')
+    finally:
+        if mongod:
+            mongod.terminate()
+            mongod.wait()
+            shutil.rmtree(dbpath, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
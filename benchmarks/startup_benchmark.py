@@ -0,0 +1,69 @@
+"""
+STARTUP BENCHMARK -
+Spawn the api with uvicorn and measure:
+    * time to liveness: first 200 on /healthz (app serves requests).
+    * time to readiness: first 200 on /readyz (warmup tasks done).
+    * per-task warmup durations, as reported by /readyz.
+
+Run from root of the project (MONGO_URI taken from .env or environment):
+    python benchmarks/startup_benchmark.py --runs 5
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+
+def doPoll(url: str, start: float, timeout: float) -> tuple[float, dict]:
+    """
+    Poll url until 200, return (elapsed seconds, json body).
+    """
+    while time.perf_counter() - start < timeout:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as resp:
+                return time.perf_counter() - start, json.loads(resp.read())
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.01)
+    raise TimeoutError(f'{url} not available after {timeout}s')
+
+
+def doRun(port: int, timeout: float) -> dict:
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'src.app.main:app', '--port', str(port), '--log-level', 'warning'],
+    )
+    try:
+        live, _ = doPoll(f'http://127.0.0.1:{port}/healthz', start, timeout)
+        ready, body = doPoll(f'http://127.0.0.1:{port}/readyz', start, timeout)
+        return {"liveness_s": live, "readiness_s": ready, "tasks": body.get("tasks", {})}
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure api startup time.')
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--output', help='json report path')
+    args = parser.parse_args()
+
+    runs = [doRun(args.port, args.timeout) for _ in range(args.runs)]
+    report = {
+        "runs": runs,
+        "liveness_median_s": statistics.median(r["liveness_s"] for r in runs),
+        "readiness_median_s": statistics.median(r["readiness_s"] for r in runs),
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+TRANSCODE BENCHMARK -
+Serialization cost of a /list response of N restaurants, from the raw BSON reply of Mongo
+to the JSON body, without database nor http:
+    * models: bson decode > cursor_to_object > response_model validation > json (route response_model path).
+    * raw: raw_to_json (bson.decode_all + in place field filter + orjson), used by doAggregateRaw routes.
+Reports median time and peak of traced memory allocations (tracemalloc) per page size.
+
+Run from root of the project:
+    python benchmarks/transcode_benchmark.py --sizes 20 100 1000 --runs 20
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+import bson
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+from dataset import doGenerateRestaurants  # noqa: E402
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from pydantic import TypeAdapter  # noqa: E402
+from app.middleware.cursor_middleware import cursor_to_object, doModelFields, orjson, raw_to_json  # noqa: E402
+from app.models.models import ListResponse, Restaurant  # noqa: E402
+
+LIST_RESPONSE = TypeAdapter(ListResponse)
+FIELDS = doModelFields(Restaurant)
+
+
+def doModels(raw: bytes) -> bytes:
+    l_docs = cursor_to_object(bson.decode_all(raw))
+    model = LIST_RESPONSE.validate_python({"data": l_docs, "page_nbr": 1})
+    return json.dumps(jsonable_encoder(model), separators=(',', ':')).encode()
+
+
+def doRaw(raw: bytes) -> bytes:
+    return b'{"data":' + raw_to_json(raw, FIELDS) + b',"page_nbr":1}'
+
+
+def doMeasure(fn, raw: bytes, runs: int) -> dict:
+    fn(raw)
+    l_times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn(raw)
+        l_times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    fn(raw)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"median_ms": round(statistics.median(l_times) * 1000, 3), "peak_kib": round(peak / 1024, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare response serialization paths.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[20, 100, 1000])
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--output', help='json report path')
+    args = parser.parse_args()
+
+    l_restaurants = doGenerateRestaurants(max(args.sizes))
+    report = {"meta": {"orjson": orjson is not None}, "sizes": {}}
+    for size in args.sizes:
+        raw = b''.join(bson.encode(doc) for doc in l_restaurants[:size])
+        models, fast = doMeasure(doModels, raw, args.runs), doMeasure(doRaw, raw, args.runs)
+        report["sizes"][size] = {
+            "bson_kib": round(len(raw) / 1024, 1),
+            "models": models,
+            "raw": fast,
+            "speedup": round(models["median_ms"] / fast["median_ms"], 1) if fast["median_ms"] else None,
+        }
+        print(f'{size:>6} docs  models {models["median_ms"]:>9.3f} ms {models["peak_kib"]:>9.1f} KiB'
+              f'  raw {fast["median_ms"]:>9.3f} ms {fast["peak_kib"]:>9.1f} KiB')
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""
+WRITE BENCHMARK -
+Latency of single document writes, read back in a second round trip (previous routes) or
+returned by the write itself (database/query.py doUpdateOne, doInsertOne):
+    * update: update_one + find_one  vs  find_one_and_update(ReturnDocument.AFTER)
+    * create: insert_one + find_one  vs  insert_one (document returned as sent)
+Median latencies are measured against the chosen backend; as each round trip pays the network
+latency to the server, --rtt-ms projects them over a WAN link (ex: 30 ms to Atlas).
+
+From root of the project:
+    python benchmarks/write_benchmark.py --backend mongod --requests 2000 --rtt-ms 30
+    python benchmarks/write_benchmark.py --backend uri --mongo-uri "$MONGO_URI" --write-concern '{"w": 1}'
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from pymongo import MongoClient, ReturnDocument  # noqa: E402
+from pymongo.write_concern import WriteConcern  # noqa: E402
+from dataset import doGenerateRestaurants  # noqa: E402
+from load_test import doStartMongod  # noqa: E402
+
+
+### Scenarios: (round trips, write function) #
+def doUpdateTwoTrips(coll, i: int) -> dict:
+    restaurant_id = str(i)
+    coll.update_one({"restaurant_id": restaurant_id}, {"$set": {"name": f'bench {i}'}})
+    return coll.find_one({"restaurant_id": restaurant_id})
+
+
+def doUpdateOneTrip(coll, i: int) -> dict:
+    return coll.find_one_and_update(
+        {"restaurant_id": str(i)}, {"$set": {"name": f'bench {i}'}}, return_document=ReturnDocument.AFTER
+    )
+
+
+def doCreateTwoTrips(coll, i: int) -> dict:
+    doc = {"restaurant_id": f'new-{i}', "name": f'bench {i}', "grades": []}
+    result = coll.insert_one(doc)
+    return coll.find_one({"_id": result.inserted_id})
+
+
+def doCreateOneTrip(coll, i: int) -> dict:
+    doc = {"restaurant_id": f'new-{i}', "name": f'bench {i}', "grades": []}
+    coll.insert_one(doc)
+    return doc
+
+
+SCENARIOS = {
+    "update": {"before": (2, doUpdateTwoTrips), "after": (1, doUpdateOneTrip)},
+    "create": {"before": (2, doCreateTwoTrips), "after": (1, doCreateOneTrip)},
+}
+
+
+def doMeasure(coll, fn, requests: int, size: int) -> list[float]:
+    l_times = []
+    for i in range(requests):
+        start = time.perf_counter()
+        fn(coll, i % size)
+        l_times.append(time.perf_counter() - start)
+    return l_times
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare write routes round trips.')
+    parser.add_argument('--backend', choices=['mongod', 'uri', 'inprocess'], default='mongod')
+    parser.add_argument('--mongo-uri', default=os.getenv('MONGO_URI'))
+    parser.add_argument('--size', type=int, default=5000, help='restaurants loaded')
+    parser.add_argument('--requests', type=int, default=1000, help='writes per scenario and variant')
+    parser.add_argument('--rtt-ms', type=float, default=30, help='network round trip used for projections')
+    parser.add_argument('--write-concern', default=None, help='json, ex: {"w": 1, "j": false}')
+    parser.add_argument('--output', help='json report path')
+    args = parser.parse_args()
+
+    proc = dbpath = None
+    if args.backend == 'mongod':
+        proc, uri, dbpath = doStartMongod()
+        client = MongoClient(uri)
+    elif args.backend == 'uri':
+        client = MongoClient(args.mongo_uri)
+    else:
+        import mongomock
+        client = mongomock.MongoClient()
+    try:
+        coll = client['bench_writes']['restaurants']
+        coll.drop()
+        coll.insert_many(doGenerateRestaurants(args.size))
+        coll.create_index('restaurant_id')
+        if args.write_concern:
+            coll = coll.with_options(write_concern=WriteConcern(**json.loads(args.write_concern)))
+
+        report = {"meta": {"backend": args.backend, "write_concern": args.write_concern, "rtt_ms": args.rtt_ms}, "scenarios": {}}
+        for name, variants in SCENARIOS.items():
+            result = {}
+            for variant, (round_trips, fn) in variants.items():
+                median_ms = statistics.median(doMeasure(coll, fn, args.requests, args.size)) * 1000
+                result[variant] = {
+                    "round_trips": round_trips,
+                    "median_ms": round(median_ms, 3),
+                    "projected_ms": round(median_ms + round_trips * args.rtt_ms, 1),
+                }
+            before, after = result["before"]["projected_ms"], result["after"]["projected_ms"]
+            result["projected_reduction"] = f'{(before - after) / before * 100:.0f}%'
+            report["scenarios"][name] = result
+            print(f'{name:8} before {result["before"]["median_ms"]:>8.3f} ms ({before:>6.1f} ms projected)'
+                  f'  after {result["after"]["median_ms"]:>8.3f} ms ({after:>6.1f} ms projected)  -{result["projected_reduction"]}')
+        client['bench_writes']['restaurants'].drop()
+    finally:
+        client.close()
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+            shutil.rmtree(dbpath, ignore_errors=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+import os
+from dotenv import load_dotenv
+
+"""
+CONFIG -
+Environment driven settings shared by routes and modules.
+.env file is loaded here so that values are available at import time,
+before main.py runs its own setup.
+"""
+load_dotenv()
+
+MODE = os.getenv('MODE', 'dev')
+MONGO_URI = os.getenv('MONGO_URI')
+DB_NAME = os.getenv('DB_NAME', 'sample_restaurants')
+# client timeouts (ms): fail fast when Atlas is unreachable instead of driver 30s default,
+# socket timeout stays over the guardrails maxTimeMS
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', 3000))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv('MONGO_CONNECT_TIMEOUT_MS', 3000))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv('MONGO_SOCKET_TIMEOUT_MS', 15000))
+
+### Server #
+# prod mode: number of uvicorn workers run by gunicorn (default: 1 per core, min 2)
+WORKERS = int(os.getenv('WEB_CONCURRENCY', max(2, os.cpu_count() or 1)))
+# threadpool size of each worker, running sync routes (pymongo calls, validation)
+THREADS = int(os.getenv('THREADS', 40))
+# seconds to keep idle connections open (behind nginx)
+KEEP_ALIVE = int(os.getenv('KEEP_ALIVE', 5))
+HOST = os.getenv('HOST', '0.0.0.0')
+PORT = int(os.getenv('PORT', 8000))
+
+### Admin #
+# token required by admin features (X-Admin-Token, X-Profile headers) - disabled when empty
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', '')
+
+### Profiling #
+# Server-Timing header on every response (phases, Mongo round trips and bytes)
+SERVER_TIMING = os.getenv('SERVER_TIMING', 'on') == 'on'
+# X-Profile output directory
+PROFILE_DIR = os.getenv('PROFILE_DIR', '/tmp/ny_restaurants_profiles')
+
+### Guardrails (see middleware/guardrails.py for per class limits) #
+# explain pre-check rejecting COLLSCAN plans
+GUARD_EXPLAIN = os.getenv('GUARD_EXPLAIN', 'off') == 'on'
+# collections smaller than this are never rejected
+GUARD_COLLSCAN_MIN_DOCS = int(os.getenv('GUARD_COLLSCAN_MIN_DOCS', 100000))
+# per route json overrides, ex: {"/distinct": {"max_nbr": 20000, "cache_ttl": 600}}
+GUARD_OVERRIDES = os.getenv('GUARD_OVERRIDES', '')
+
+### Coalescing #
+# identical concurrent read requests share one in-flight query and response
+COALESCE = os.getenv('COALESCE', 'on') == 'on'
+
+### Result cache (see database/cache.py, ttl by route in middleware/guardrails.py) #
+# memory | redis | off
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'memory')
+# memory backend size and eviction policy (lru | lfu)
+CACHE_MAX_BYTES = int(os.getenv('CACHE_MAX_BYTES', 64 * 1024 * 1024))
+CACHE_POLICY = os.getenv('CACHE_POLICY', 'lru')
+CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+# entries are kept CACHE_STALE_MAX seconds after their ttl: served when Mongo fails,
+# and with CACHE_SWR=on served at once while refreshed in background (stale-while-revalidate)
+CACHE_STALE_MAX = int(os.getenv('CACHE_STALE_MAX', 3600))
+CACHE_SWR = os.getenv('CACHE_SWR', 'on') == 'on'
+
+### Import (see modules/importer/importer.py) #
+# parsing processes, records per parsing task, bulk_write batch size
+IMPORT_WORKERS = int(os.getenv('IMPORT_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+IMPORT_CHUNK_ROWS = int(os.getenv('IMPORT_CHUNK_ROWS', 20000))
+IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', 1000))
+
+### Write-behind (see database/write_behind.py) #
+# on: /update and per restaurant /update/field/set answer 202 and are written by batches
+WRITE_BEHIND = os.getenv('WRITE_BEHIND', 'off') == 'on'
+# flush every WRITE_BEHIND_FLUSH_MS, or at once when WRITE_BEHIND_MAX_OPS restaurants are pending,
+# updates are written synchronously when WRITE_BEHIND_MAX_PENDING are (Mongo too slow or down)
+WRITE_BEHIND_FLUSH_MS = int(os.getenv('WRITE_BEHIND_FLUSH_MS', 200))
+WRITE_BEHIND_MAX_OPS = int(os.getenv('WRITE_BEHIND_MAX_OPS', 500))
+WRITE_BEHIND_MAX_PENDING = int(os.getenv('WRITE_BEHIND_MAX_PENDING', 10000))
+
+### Jobs (see modules/jobs/jobs.py) #
+# collection-wide admin mutations: documents per batch, pause between batches,
+# seconds without heartbeat after which a job of a stopped worker is taken over
+JOB_BATCH_SIZE = int(os.getenv('JOB_BATCH_SIZE', 1000))
+JOB_THROTTLE_MS = int(os.getenv('JOB_THROTTLE_MS', 100))
+JOB_LEASE_S = float(os.getenv('JOB_LEASE_S', 30))
+
+### Geo indexes (see modules/point/geospatial.py) #
+# polygons changed by another worker are loaded again within GEO_INDEX_CHECK_S (0: never)
+GEO_INDEX_CHECK_S = int(os.getenv('GEO_INDEX_CHECK_S', 30))
+
+### Spatial join (see modules/point/spatial_join.py) #
+# processes tagging restaurants with their neighborhood and borough in spatial_join jobs
+SPATIAL_JOIN_PROCESSES = int(os.getenv('SPATIAL_JOIN_PROCESSES', max(1, (os.cpu_count() or 2) // 2)))
+
+### Choropleth stats (see modules/point/choropleth.py) #
+# dirty neighborhoods and boroughs are recomputed at most every CHOROPLETH_REFRESH_MS,
+# all of them every CHOROPLETH_FULL_REFRESH_S (0: never)
+CHOROPLETH_REFRESH_MS = int(os.getenv('CHOROPLETH_REFRESH_MS', 5000))
+CHOROPLETH_FULL_REFRESH_S = int(os.getenv('CHOROPLETH_FULL_REFRESH_S', 3600))
+
+### Rankings #
+# restaurants kept by each ranking (max k of /rankings), rankings of changed restaurants are recomputed
+# at most every RANKING_REFRESH_MS, all of them every RANKING_FULL_REFRESH_S (0: never)
+RANKING_SIZE = int(os.getenv('RANKING_SIZE', 50))
+RANKING_REFRESH_MS = int(os.getenv('RANKING_REFRESH_MS', 5000))
+RANKING_FULL_REFRESH_S = int(os.getenv('RANKING_FULL_REFRESH_S', 3600))
+
+### Facets #
+# cache ttl of /list facet counts, shared by every page and sort of a filter
+FACETS_CACHE_TTL = float(os.getenv('FACETS_CACHE_TTL', 300))
+
+### Batch #
+# sub-requests of one /batch, and default (and max) deadline of the whole batch
+BATCH_MAX_REQUESTS = int(os.getenv('BATCH_MAX_REQUESTS', 20))
+BATCH_DEADLINE_MS = int(os.getenv('BATCH_DEADLINE_MS', 5000))
+
+### Export #
+# documents per raw batch (cursor batchSize), one batch is written at a time
+EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', 2000))
+
+### Viewport (bbox) queries #
+# max number of restaurants returned for one viewport
+BBOX_MAX_RESULTS = int(os.getenv('BBOX_MAX_RESULTS', 500))
+# under this zoom level, results are randomly sampled over the viewport
+BBOX_SAMPLE_ZOOM = int(os.getenv('BBOX_SAMPLE_ZOOM', 14))
@@ -0,0 +1,143 @@
+import logging
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+from ..config import CACHE_BACKEND, CACHE_MAX_BYTES, CACHE_POLICY, CACHE_REDIS_URL
+from ..modules.metrics.metrics import CACHE_EVICTIONS, CACHE_SIZE_BYTES
+
+"""
+CACHE -
+Result cache of route pipelines (see database/query.py), values are BSON encoded results.
+Backends:
+    * memory: per worker, bounded by CACHE_MAX_BYTES with lru or lfu eviction (CACHE_POLICY).
+    * redis: shared by every worker (CACHE_REDIS_URL), eviction is left to redis maxmemory-policy.
+Invalidation is done by collection: a write bumps the collection generation, which is part of
+every key, so that older entries are never read again (and get evicted or expire).
+get() returns the entry age with its value: freshness (route ttl) is decided by the caller,
+entries live for the lifetime given to set() (ttl + max stale age).
+"""
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+class CacheEntry():
+    __slots__ = ('value', 'stored_at', 'expires_at', 'hits')
+
+    def __init__(self, value: bytes, lifetime: float):
+        self.value = value
+        self.stored_at = time.monotonic()
+        self.expires_at = self.stored_at + lifetime
+        self.hits = 0
+
+
+class MemoryCache():
+    """
+    In-process cache with byte size accounting.
+
+    @param policy:\n
+        lru - evict least recently used entry.\n
+        lfu - evict least hit entry among the LFU_SAMPLE least recently used ones (approximated lfu).
+    """
+    LFU_SAMPLE = 8
+
+    def __init__(self, max_bytes: int, policy: str = 'lru'):
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.entries: OrderedDict[str, CacheEntry] = OrderedDict()
+        self.generations: dict[str, int] = {}
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def get(self, key: str) -> tuple[bytes, float]|None:
+        """
+        Return (value, age in seconds), None if missing or expired.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            now = time.monotonic()
+            if entry.expires_at < now:
+                self.doRemove(key)
+                return None
+            entry.hits += 1
+            self.entries.move_to_end(key)
+            return entry.value, now - entry.stored_at
+
+    def set(self, key: str, value: bytes, lifetime: float):
+        if len(value) > self.max_bytes:
+            return
+        with self.lock:
+            key in self.entries and self.doRemove(key)
+            while self.entries and self.size + len(value) > self.max_bytes:
+                self.doRemove(self.doVictim())
+                CACHE_EVICTIONS.labels('pipeline').inc()
+            self.entries[key] = CacheEntry(value, lifetime)
+            self.size += len(value)
+            CACHE_SIZE_BYTES.labels('pipeline').set(self.size)
+
+    def doVictim(self) -> str:
+        if self.policy == 'lfu':
+            sample = []
+            for key in self.entries:
+                sample.append(key)
+                if len(sample) == self.LFU_SAMPLE:
+                    break
+            return min(sample, key=lambda k: self.entries[k].hits)
+        return next(iter(self.entries))
+
+    def doRemove(self, key: str):
+        entry = self.entries.pop(key)
+        self.size -= len(entry.value)
+        CACHE_SIZE_BYTES.labels('pipeline').set(self.size)
+
+    def generation(self, collection: str) -> int:
+        return self.generations.get(collection, 0)
+
+    def invalidate(self, collection: str):
+        with self.lock:
+            self.generations[collection] = self.generation(collection) + 1
+
+
+class RedisCache():
+    """
+    Cache shared by every worker. Generations are redis counters, so that a write in one
+    worker invalidates the entries of every worker.
+    """
+    def __init__(self, url: str):
+        self.client = redis.Redis.from_url(url, socket_timeout=0.2, socket_connect_timeout=0.2)
+
+    def get(self, key: str) -> tuple[bytes, float]|None:
+        raw = self.client.get(f'cache:{key}')
+        if raw is None:
+            return None
+        stored_at, = struct.unpack_from('!d', raw)
+        return raw[8:], max(0, time.time() - stored_at)
+
+    def set(self, key: str, value: bytes, lifetime: float):
+        # wall clock store time (shared by processes) prefixed to value
+        self.client.set(f'cache:{key}', struct.pack('!d', time.time()) + value, px=int(lifetime * 1000))
+
+    def generation(self, collection: str) -> int:
+        return int(self.client.get(f'generation:{collection}') or 0)
+
+    def invalidate(self, collection: str):
+        self.client.incr(f'generation:{collection}')
+
+
+def doCreateCache() -> MemoryCache|RedisCache|None:
+    if CACHE_BACKEND == 'off':
+        return None
+    if CACHE_BACKEND == 'redis':
+        if redis is None:
+            logging.warning(msg='CACHE_BACKEND=redis requires redis package - falling back to memory cache.')
+        else:
+            return RedisCache(CACHE_REDIS_URL)
+    return MemoryCache(CACHE_MAX_BYTES, CACHE_POLICY)
+
+
+CACHE = doCreateCache()
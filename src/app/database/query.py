@@ -0,0 +1,265 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+import bson
+from pymongo import ReturnDocument
+from pymongo.collection import Collection
+from pymongo.command_cursor import CommandCursor
+from pymongo.errors import ConnectionFailure, ExecutionTimeout
+from pymongo.write_concern import WriteConcern
+
+from ..config import CACHE_STALE_MAX, CACHE_SWR, GUARD_COLLSCAN_MIN_DOCS
+from ..middleware.guardrails import Guard, GuardrailError
+from ..modules.metrics.metrics import doCountCache
+from ..modules.point.geospatial import GeoIndex
+from ..modules.profiling.trace import TRACE
+from .cache import CACHE
+
+"""
+QUERY -
+Single execution point of route queries, applying guardrails (maxTimeMS, COLLSCAN pre-check)
+and result cache (guard.cache_ttl), and of single document writes (one round trip each,
+route write concern, cache invalidation).
+"""
+
+# collection name > (estimated count, timestamp)
+COUNTS: dict[str, tuple[int, float]] = {}
+# pipeline > has COLLSCAN, bounded
+PLANS: dict[str, bool] = {}
+COUNT_TTL = 60
+PLANS_MAX = 1000
+# stale entries being refreshed (stale-while-revalidate)
+REFRESHING: set[str] = set()
+REFRESHING_LOCK = threading.Lock()
+REFRESH_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix='cache-refresh')
+
+
+def doAggregate(coll: Collection, pipeline: list, guard: Guard, **kwargs) -> CommandCursor|list:
+    """
+    Run pipeline. Cached routes get a list of documents instead of a cursor.
+    """
+    if not guard.cache_ttl or CACHE is None:
+        guard.reject_collscan and doCheckPlan(coll, pipeline, guard)
+        return coll.aggregate(pipeline, maxTimeMS=guard.max_time_ms, **kwargs)
+
+    def run() -> bytes:
+        return bson.encode({"data": list(coll.aggregate(pipeline, maxTimeMS=guard.max_time_ms, **kwargs))})
+    return bson.decode(doCachedRun(coll, pipeline, guard, run, 'docs'))["data"]
+
+
+def doRawBatches(coll: Collection, pipeline: list, **kwargs) -> bytes:
+    """
+    Documents of pipeline as concatenated BSON, read by raw batches (aggregate_raw_batches kwargs).
+    """
+    try:
+        return b"".join(coll.aggregate_raw_batches(pipeline, **kwargs))
+    except NotImplementedError:
+        # client without raw batches (mongomock stand-in of benchmarks): documents are encoded back
+        kwargs.pop("batchSize", None)
+        return b"".join(bson.encode(doc) for doc in coll.aggregate(pipeline, **kwargs))
+
+
+def doAggregateRaw(coll: Collection, pipeline: list, guard: Guard) -> bytes:
+    """
+    Run pipeline and return its documents as concatenated BSON (raw batches, no python dict
+    materialization), to be transcoded by raw_to_json. Cached the same way as doAggregate.
+    """
+    def run() -> bytes:
+        return doRawBatches(coll, pipeline, maxTimeMS=guard.max_time_ms)
+    if not guard.cache_ttl or CACHE is None:
+        guard.reject_collscan and doCheckPlan(coll, pipeline, guard)
+        return run()
+    return doCachedRun(coll, pipeline, guard, run, 'raw')
+
+
+def doCachedRun(coll: Collection, pipeline: list, guard: Guard, run: Callable[[], bytes], namespace: str) -> bytes:
+    """
+    Cached value of run(). Values past route ttl are served at once and refreshed in background
+    (CACHE_SWR), or served when Mongo is unreachable or too slow, with Age and Warning headers.
+
+    @param namespace:\n
+        str - encoding of cached value (docs: BSON {data: list}, raw: concatenated BSON documents).
+    """
+    key = doCacheKey(coll, pipeline, namespace)
+    cached = doCacheGet(key) if key is not None else None
+    if cached is not None:
+        value, age = cached
+        if age <= guard.cache_ttl:
+            doCountCache('pipeline', True)
+            return value
+        if CACHE_SWR:
+            doCountCache('pipeline', True, stale=True)
+            doRefresh(coll, guard, key, run)
+            doStaleHeaders(age, '110 - "Response is Stale"')
+            return value
+    doCountCache('pipeline', False)
+    try:
+        guard.reject_collscan and doCheckPlan(coll, pipeline, guard)
+        value = run()
+    except (ConnectionFailure, ExecutionTimeout):
+        if cached is None:
+            raise
+        logging.warning(msg=f'Mongo unavailable - stale result served for {coll.full_name}')
+        doCountCache('pipeline', True, stale=True)
+        doStaleHeaders(cached[1], '111 - "Revalidation Failed"')
+        return cached[0]
+    key is not None and doCacheSet(key, value, guard.cache_ttl + CACHE_STALE_MAX)
+    return value
+
+
+def doRefresh(coll: Collection, guard: Guard, key: str, run: Callable[[], bytes]):
+    """
+    Refresh a stale cache entry in background, once per key at a time.
+    """
+    with REFRESHING_LOCK:
+        if key in REFRESHING:
+            return
+        REFRESHING.add(key)
+
+    def refresh():
+        try:
+            doCacheSet(key, run(), guard.cache_ttl + CACHE_STALE_MAX)
+        except Exception as e:
+            logging.warning(msg=f'Background refresh of {coll.full_name} failed: {e!r}')
+        finally:
+            with REFRESHING_LOCK:
+                REFRESHING.discard(key)
+    REFRESH_EXECUTOR.submit(refresh)
+
+
+def doStaleHeaders(age: float, warning: str):
+    trace = TRACE.get()
+    if trace is not None:
+        trace.headers["Age"] = str(int(age))
+        trace.headers["Warning"] = warning
+
+
+def doFindOne(coll: Collection, filter: dict, guard: Guard, *args, **kwargs) -> dict|None:
+    return coll.find_one(filter, *args, max_time_ms=guard.max_time_ms, **kwargs)
+
+
+def doLocate(coll: Collection, index: GeoIndex, point: dict, guard: Guard) -> dict|None:
+    """
+    Polygon document (borough, neighborhood) containing GeoJSON point, without _id: from the
+    in-memory index when built (no round trip), $geoIntersects query otherwise.
+    """
+    if index.ready:
+        return index.locate(*point["coordinates"])
+    return doFindOne(coll, {"geometry": {"$geoIntersects": {"$geometry": point}}}, guard, {"_id": 0})
+
+
+### Writes #
+def doWriteColl(coll: Collection, guard: Guard) -> Collection:
+    """
+    Collection with the route write concern (guard.write_concern), client default when None.
+    """
+    if not guard.write_concern:
+        return coll
+    return coll.with_options(write_concern=WriteConcern(**guard.write_concern))
+
+
+def doUpdateOne(coll: Collection, filter: dict, update: dict, guard: Guard, **kwargs) -> dict|None:
+    """
+    Update first matching document and return it as it is after update, in one round trip
+    (findAndModify) - the document is found by _id, so that changes of the filtered fields
+    (ex: restaurant_id) are returned too. None when nothing matched.
+    Requires an acknowledged write concern (w >= 1).
+    """
+    doc = doWriteColl(coll, guard).find_one_and_update(
+        filter, update, return_document=ReturnDocument.AFTER, maxTimeMS=guard.max_time_ms, **kwargs
+    )
+    doc is not None and doInvalidate(coll)
+    return doc
+
+
+def doInsertOne(coll: Collection, doc: dict, guard: Guard) -> dict:
+    """
+    Insert doc and return it with its new _id: the stored document is the one sent, it is not read back.
+    """
+    doWriteColl(coll, guard).insert_one(doc)
+    doInvalidate(coll)
+    return doc
+
+
+### Result cache #
+def doCacheKey(coll: Collection, pipeline: list, namespace: str = 'docs') -> str|None:
+    """
+    Key of the final pipeline (BSON keeps stage and $sort keys order), collection generation
+    and value encoding.
+    """
+    try:
+        generation = CACHE.generation(coll.full_name)
+    except Exception:
+        logging.exception('Cache generation lookup failed')
+        return None
+    digest = hashlib.sha256(bson.encode({"pipeline": pipeline})).hexdigest()
+    return f'{coll.full_name}:{generation}:{namespace}:{digest}'
+
+
+def doCacheGet(key: str) -> tuple[bytes, float]|None:
+    try:
+        return CACHE.get(key)
+    except Exception:
+        logging.exception('Cache get failed')
+        return None
+
+
+def doCacheSet(key: str, value: bytes, lifetime: float):
+    try:
+        CACHE.set(key, value, lifetime)
+    except Exception:
+        logging.exception('Cache set failed')
+
+
+def doInvalidate(coll: Collection):
+    """
+    Drop cached results of collection, to be called by write routes.
+    """
+    if CACHE is None:
+        return
+    try:
+        CACHE.invalidate(coll.full_name)
+    except Exception:
+        logging.exception('Cache invalidation failed')
+
+
+def doEstimatedCount(coll: Collection) -> int:
+    count, at = COUNTS.get(coll.name, (None, 0))
+    if count is None or time.monotonic() - at > COUNT_TTL:
+        count = coll.estimated_document_count()
+        COUNTS[coll.name] = (count, time.monotonic())
+    return count
+
+
+def doHasCollscan(plan) -> bool:
+    if isinstance(plan, dict):
+        if plan.get("stage") == "COLLSCAN":
+            return True
+        return any(doHasCollscan(v) for v in plan.values())
+    if isinstance(plan, list):
+        return any(doHasCollscan(v) for v in plan)
+    return False
+
+
+def doCheckPlan(coll: Collection, pipeline: list, guard: Guard):
+    """
+    Explain pipeline (queryPlanner only, no execution) and reject COLLSCAN on large collections.
+    Verdicts are cached by pipeline.
+    """
+    if doEstimatedCount(coll) < GUARD_COLLSCAN_MIN_DOCS:
+        return
+    key = f'{coll.name}:{json.dumps(pipeline, sort_keys=True, default=str)}'
+    if key not in PLANS:
+        explain = coll.database.command(
+            "explain", {"aggregate": coll.name, "pipeline": pipeline, "cursor": {}}, verbosity="queryPlanner"
+        )
+        if len(PLANS) >= PLANS_MAX:
+            PLANS.clear()
+        PLANS[key] = doHasCollscan(explain)
+    if PLANS[key]:
+        raise GuardrailError({"guardrail": "Query would scan the whole collection, add a filter on an indexed field.", "collection": coll.name})
@@ -0,0 +1,95 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+
+class WarmupTask():
+    """
+    One background startup task (index check, reference data loading, ...).
+    status: pending | running | done | failed
+    """
+    def __init__(self, name: str, fn: Callable, after: list[str] = None, critical: bool = True):
+        self.name = name
+        self.fn = fn
+        self.after = after or []
+        self.critical = critical
+        self.status = 'pending'
+        self.error: str = None
+        self.duration: float = None
+        self.done = threading.Event()
+
+    def report(self) -> dict:
+        return {
+            "status": self.status,
+            "critical": self.critical,
+            "duration_ms": round(self.duration * 1000, 1) if self.duration is not None else None,
+            "error": self.error,
+        }
+
+
+class Warmup():
+    """
+    Run startup tasks in background threads, so that app serves requests
+    (liveness) while indexes and reference data are processed (readiness).
+
+    Tasks may depend on other tasks by name with "after" param.
+    """
+    def __init__(self, max_workers: int = 4):
+        self.tasks: dict[str, WarmupTask] = {}
+        self.max_workers = max_workers
+        self.executor: ThreadPoolExecutor = None
+        self.started_at: float = None
+
+    def add(self, name: str, fn: Callable, after: list[str] = None, critical: bool = True):
+        self.tasks[name] = WarmupTask(name, fn, after, critical)
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='warmup')
+        for task in self.tasks.values():
+            self.executor.submit(self.doRun, task)
+
+    def doRun(self, task: WarmupTask):
+        for dep in task.after:
+            self.tasks[dep].done.wait()
+            if self.tasks[dep].status != 'done':
+                task.status = 'failed'
+                task.error = f'dependency {dep} failed'
+                task.done.set()
+                return
+        task.status = 'running'
+        start = time.perf_counter()
+        try:
+            task.fn()
+            task.status = 'done'
+        except Exception as e:
+            task.status = 'failed'
+            task.error = repr(e)
+            logging.exception(f'Warmup task {task.name} failed')
+        finally:
+            task.duration = time.perf_counter() - start
+            task.done.set()
+        logging.info(msg=f'Warmup task {task.name}: {task.status} in {task.duration:.3f}s')
+
+    def is_ready(self) -> bool:
+        return all(t.status == 'done' for t in self.tasks.values() if t.critical)
+
+    def wait(self, timeout: float = None) -> bool:
+        """
+        Block until every task is over (done or failed). Return readiness.
+        """
+        deadline = time.perf_counter() + timeout if timeout is not None else None
+        for task in self.tasks.values():
+            remaining = None if deadline is None else max(0, deadline - time.perf_counter())
+            if not task.done.wait(remaining):
+                return False
+        return self.is_ready()
+
+    def report(self) -> dict:
+        return {name: task.report() for name, task in self.tasks.items()}
+
+    def shutdown(self):
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
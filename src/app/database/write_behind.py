@@ -0,0 +1,190 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from pymongo import UpdateOne
+from pymongo.collection import Collection
+from pymongo.errors import BulkWriteError, ConnectionFailure
+
+from ..config import WRITE_BEHIND_FLUSH_MS, WRITE_BEHIND_MAX_OPS, WRITE_BEHIND_MAX_PENDING
+from ..modules.metrics.metrics import WRITE_BEHIND_FLUSH, WRITE_BEHIND_OPERATIONS, WRITE_BEHIND_PENDING
+from .query import doInvalidate
+
+"""
+WRITE_BEHIND -
+Optional queue of small restaurant updates (WRITE_BEHIND=on): /update and /update/field/set on one
+restaurant_id answer 202 at once, their $set are merged by restaurant_id in memory and written by one
+unordered bulk_write every WRITE_BEHIND_FLUSH_MS, or as soon as WRITE_BEHIND_MAX_OPS restaurants are pending.
+
+Durability:
+    * pending updates live in the worker memory only: a crash (or kill -9) loses at most the last
+      WRITE_BEHIND_FLUSH_MS of accepted updates. Graceful shutdown flushes the queue (lifespan).
+    * Mongo unreachable at flush: updates are put back in the queue and retried at next flush;
+      over WRITE_BEHIND_MAX_PENDING pending restaurants, updates are written synchronously (and fail).
+    * updates rejected by Mongo (validation, duplicate key) are logged and counted as failed,
+      the client got its 202 already. An unknown restaurant_id is ignored (no upsert: a queued
+      update never brings back a restaurant deleted meanwhile).
+Ordering:
+    * one restaurant: updates are applied in arrival order within a worker (successive $set merged,
+      last value wins per field). Every restaurant write bypassing the queue (restaurant_id change,
+      full queue, delete, jobs, import) flushes it first (doFlushPending): a pending $set can't undo it.
+    * several restaurants: no order between them inside a flush (unordered bulk_write), flushes
+      are sequential.
+    * several workers: each one has its own queue, updates of one restaurant sent to different
+      workers are ordered by their flush times only.
+    * reads may not see an accepted update for up to WRITE_BEHIND_FLUSH_MS (plus cached results ttl).
+"""
+
+
+class PendingUpdate():
+    __slots__ = ('coll', 'restaurant_id', 'changes')
+
+    def __init__(self, coll: Collection, restaurant_id: str, changes: dict):
+        self.coll = coll
+        self.restaurant_id = restaurant_id
+        self.changes = changes
+
+
+class WriteBehindQueue():
+    """
+    Per worker queue, flushed by a background thread.
+    """
+    def __init__(self, flush_ms: int = WRITE_BEHIND_FLUSH_MS, max_ops: int = WRITE_BEHIND_MAX_OPS, max_pending: int = WRITE_BEHIND_MAX_PENDING):
+        self.flush_ms = flush_ms
+        self.max_ops = max_ops
+        self.max_pending = max_pending
+        self.pending: OrderedDict[tuple[str, str], PendingUpdate] = OrderedDict()
+        self.condition = threading.Condition()
+        # one flush at a time: flushes stay ordered
+        self.flush_lock = threading.Lock()
+        self.closed = False
+        self.thread: threading.Thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.doLoop, name='write-behind', daemon=True)
+        self.thread.start()
+
+    def enqueue(self, coll: Collection, restaurant_id: str, changes: dict) -> bool:
+        """
+        Queue a $set of one restaurant, merged with its pending one. False when queue is closed
+        or full: caller writes synchronously.
+
+        @param coll:\n
+            Collection - with route write concern (doWriteColl).
+        """
+        with self.condition:
+            if self.closed or len(self.pending) >= self.max_pending:
+                WRITE_BEHIND_OPERATIONS.labels('bypassed').inc()
+                return False
+            key = (coll.full_name, restaurant_id)
+            entry = self.pending.get(key)
+            if entry is None:
+                self.pending[key] = PendingUpdate(coll, restaurant_id, dict(changes))
+                WRITE_BEHIND_OPERATIONS.labels('queued').inc()
+            else:
+                entry.coll = coll
+                entry.changes.update(changes)
+                WRITE_BEHIND_OPERATIONS.labels('merged').inc()
+            WRITE_BEHIND_PENDING.set(len(self.pending))
+            if len(self.pending) >= self.max_ops:
+                self.condition.notify()
+        return True
+
+    def doLoop(self):
+        while True:
+            with self.condition:
+                if not self.closed:
+                    self.condition.wait(self.flush_ms / 1000)
+                closed = self.closed
+            try:
+                self.flush()
+            except Exception:
+                logging.exception('Write-behind flush failed')
+            if closed:
+                return
+
+    def flush(self):
+        """
+        Write pending updates, one unordered bulk_write per collection (and write concern).
+        """
+        with self.flush_lock:
+            with self.condition:
+                batch, self.pending = self.pending, OrderedDict()
+                WRITE_BEHIND_PENDING.set(0)
+            if not batch:
+                return
+            start = time.perf_counter()
+            groups: dict[tuple, list[PendingUpdate]] = {}
+            for entry in batch.values():
+                groups.setdefault((entry.coll.full_name, repr(entry.coll.write_concern.document)), []).append(entry)
+            for entries in groups.values():
+                self.doWrite(entries)
+            WRITE_BEHIND_FLUSH.observe(time.perf_counter() - start)
+
+    def doWrite(self, entries: list[PendingUpdate]):
+        coll = entries[0].coll
+        l_ops = [UpdateOne({"restaurant_id": e.restaurant_id}, {"$set": e.changes}) for e in entries]
+        try:
+            coll.bulk_write(l_ops, ordered=False)
+            WRITE_BEHIND_OPERATIONS.labels('written').inc(len(l_ops))
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            WRITE_BEHIND_OPERATIONS.labels('written').inc(len(l_ops) - len(errors))
+            WRITE_BEHIND_OPERATIONS.labels('failed').inc(len(errors))
+            for error in errors:
+                logging.error(msg=f'Write-behind update of restaurant_id {entries[error["index"]].restaurant_id} failed: {error["errmsg"]}')
+        except ConnectionFailure as e:
+            if self.closed:
+                WRITE_BEHIND_OPERATIONS.labels('failed').inc(len(l_ops))
+                logging.error(msg=f'Write-behind: {len(l_ops)} updates lost at shutdown, Mongo unavailable: {e!r}')
+                return
+            logging.warning(msg=f'Write-behind: Mongo unavailable, {len(l_ops)} updates queued again: {e!r}')
+            self.doRequeue(entries)
+            return
+        doInvalidate(coll)
+
+    def doRequeue(self, entries: list[PendingUpdate]):
+        """
+        Put back updates of a failed flush, under the ones queued meanwhile (newer values win).
+        """
+        with self.condition:
+            for entry in entries:
+                key = (entry.coll.full_name, entry.restaurant_id)
+                newer = self.pending.get(key)
+                if newer is not None:
+                    newer.changes = {**entry.changes, **newer.changes}
+                else:
+                    self.pending[key] = entry
+            WRITE_BEHIND_PENDING.set(len(self.pending))
+
+    def close(self, timeout: float = 10):
+        """
+        Flush-on-shutdown: refuse new updates, write pending ones and stop flushing thread.
+        """
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join(timeout)
+        self.flush()
+
+
+def doRestaurantId(match: dict) -> str|None:
+    """
+    restaurant_id of a find filter on exactly one restaurant ({restaurant_id: id} or {restaurant_id: {$eq: id}}).
+    """
+    if list(match) != ["restaurant_id"]:
+        return None
+    value = match["restaurant_id"]
+    if isinstance(value, dict):
+        value = value.get("$eq") if list(value) == ["$eq"] else None
+    return value if isinstance(value, str) else None
+
+
+def doFlushPending(queue: WriteBehindQueue|None):
+    """
+    Before a restaurant write bypassing the queue: pending updates are written first, so that they can't
+    undo it (delete, rename, unset, restaurant_id change).
+    """
+    queue is not None and queue.flush()
@@ -0,0 +1,50 @@
+"""
+GUNICORN CONFIG - production server (MODE=prod).
+N uvicorn workers under gunicorn master, settings from environment (see config.py):
+    WEB_CONCURRENCY: number of workers
+    THREADS: threadpool size of each worker (sync routes)
+    KEEP_ALIVE: idle keep-alive seconds
+    HOST, PORT: bind address
+
+The app is preloaded in master, and geo indexes are built there before fork,
+so workers share the same read-only memory pages (copy-on-write).
+"""
+import importlib
+import os
+
+PACKAGE = os.getenv('APP_PACKAGE', 'app')
+app_config = importlib.import_module(f'{PACKAGE}.config')
+
+bind = f'{app_config.HOST}:{app_config.PORT}'
+workers = app_config.WORKERS
+worker_class = 'uvicorn.workers.UvicornWorker'
+keepalive = app_config.KEEP_ALIVE
+timeout = int(os.getenv('TIMEOUT', 120))
+graceful_timeout = int(os.getenv('GRACEFUL_TIMEOUT', 30))
+preload_app = True
+accesslog = '-'
+errorlog = '-'
+loglevel = os.getenv('LOG_LEVEL', 'info')
+
+
+def on_starting(server):
+    """
+    Master hook, before forking workers: build shared geo indexes.
+    Workers skip the matching warmup tasks when indexes are ready.
+    """
+    geospatial = importlib.import_module(f'{PACKAGE}.modules.point.geospatial')
+    try:
+        geospatial.doPreloadGeoIndexes(app_config.MONGO_URI, app_config.DB_NAME)
+        server.log.info('Geo indexes preloaded in master.')
+    except Exception as e:
+        # workers will build their own indexes at warmup
+        server.log.warning(f'Geo indexes preload failed: {e!r}')
+
+
+def child_exit(server, worker):
+    """
+    Multiprocess prometheus metrics: drop live gauges of dead worker.
+    """
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
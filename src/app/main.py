@@ -1,6 +1,7 @@
 import json
 import logging
 import os
+from anyio import to_thread
 from fastapi import FastAPI, HTTPException
 from dotenv import load_dotenv
 from pymongo import MongoClient
@@ -10,19 +11,43 @@ from fastapi.middleware.cors import CORSMiddleware
 from pymongo.collection import Collection
 
 from .models.utils import MapUtils
+from .database.warmup import Warmup
+from .database.write_behind import WriteBehindQueue
+from .modules.importer.importer import ImportRun
+from .modules.jobs.jobs import JobRunner
+from .modules.point.choropleth import ChoroplethStats
+from .modules.point.geospatial import GEO_INDEXES, GeoIndexWatcher
+from .modules.point.spatial_join import SpatialJoinBatches
+from .modules.rankings.rankings import Rankings
+from .config import (
+    DB_NAME,
+    MONGO_CONNECT_TIMEOUT_MS,
+    MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    MONGO_SOCKET_TIMEOUT_MS,
+    MONGO_URI,
+    THREADS,
+    WRITE_BEHIND,
+)
 
+from .middleware.bulkhead_middleware import BulkheadMiddleware
+from .middleware.coalescing_middleware import CoalescingMiddleware
 from .middleware.http_middleware import CustomMiddleware
+from .middleware.metrics_middleware import MetricsMiddleware
+from .middleware.timing_middleware import TimingMiddleware
+from .modules.metrics.metrics import MongoCommandListener, MongoPoolListener
 from .demo.demo_routes import router as demo_router
 from .routes.router import router
+from .routes.admin_routes import doSpatialJoin
 
 NY_BOROUGHS_GEOJSON = './src/app/database/NY_BOROUGHS_GEOJSON.geojson'
 logging.basicConfig(level=logging.INFO)
 load_dotenv()
-mongo_uri = os.getenv('MONGO_URI')
+mongo_uri = MONGO_URI
 
 # startup & shutdown events management
 def lifespan(app: FastAPI):
     # executed at startup
+    to_thread.current_default_thread_limiter().total_tokens = THREADS
     startup_db_client()
     yield
     # executed at shutdown
@@ -57,7 +82,23 @@ Can be used :
     * with @app.middleware('http') decorator on custom_middleware function.
     * with app.add(<class_custom_middleware(BaseHttpMiddleware)>, **options) by implementing dispatch method.
 """
-# Add CORS middleware
+# ErrorMiddleware handler
+app.add_middleware(CustomMiddleware)
+
+# Concurrency limits by route class (503 + Retry-After when saturated)
+app.add_middleware(BulkheadMiddleware)
+
+# Identical concurrent reads share one query (outside bulkheads: followers don't take a slot)
+app.add_middleware(CoalescingMiddleware)
+
+# Server-Timing header and X-Profile
+app.add_middleware(TimingMiddleware)
+
+# Prometheus metrics (measures full request time)
+app.add_middleware(MetricsMiddleware)
+
+# Add CORS middleware (outermost: 503 of bulkheads and 403 of X-Profile carry CORS headers too,
+# preflight OPTIONS requests are answered before taking a bulkhead slot)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -66,9 +107,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# ErrorMiddleware handler
-app.add_middleware(CustomMiddleware)
-
 
 def init_2dsphere_index(coll: Collection, name:str, field:str):
     """
@@ -87,6 +125,44 @@ def init_2dsphere_index(coll: Collection, name:str, field:str):
         print(f"2dsphere_index created for {name} at field: {field}.")
 
 
+def init_tag_indexes(coll: Collection):
+    """
+    Check for spatial join tags indexes on restaurants, and creates them if missing.
+    Neighborhood or borough filters are equality matches on their prefix, cuisine narrows them down.
+    """
+    for field in ("neighborhood", "borough_geo"):
+        if f"{field}_cuisine" not in coll.index_information():
+            coll.create_index([(field, 1), ("cuisine", 1)], name=f"{field}_cuisine")
+            print(f"{field}_cuisine index created for {coll.name}.")
+
+
+def init_facets_index(coll: Collection):
+    """
+    Check for borough and cuisine index on restaurants, and creates it if missing.
+    Most used filters and facets: their facet counts are read from the index only.
+    """
+    if "borough_cuisine" not in coll.index_information():
+        coll.create_index([("borough", 1), ("cuisine", 1)], name="borough_cuisine")
+        print(f"borough_cuisine index created for {coll.name}.")
+
+
+def init_grade_indexes(coll: Collection):
+    """
+    Check for grades summary indexes on restaurants, and creates them if missing.
+    Current grade filters (with latest score as tie-breaker), average score and inspection date sorts.
+    """
+    indexes = {
+        "latest_grade_latest_score": [("latest_grade", 1), ("latest_score", 1)],
+        "avg_score": [("avg_score", 1)],
+        "latest_inspection_date": [("latest_inspection_date", -1)],
+    }
+    index_info = coll.index_information()
+    for name, keys in indexes.items():
+        if name not in index_info:
+            coll.create_index(keys, name=name)
+            print(f"{name} index created for {coll.name}.")
+
+
 def init_Collection(db: Database, name:str, sphere_ref:str):
     """
     Check for boroughs (or any other name) and create table if missing.
@@ -116,20 +192,72 @@ def init_Collection(db: Database, name:str, sphere_ref:str):
 
 
 def startup_db_client():
-    app.mongodb_client = MongoClient(mongo_uri)
-    app.database = app.mongodb_client['sample_restaurants']
+    """
+    Critical path only: client creation (lazy connection, no round trip) and collections handles.
+    Index checks, reference data loading and in-memory indexes are processed by background
+    warmup tasks - see /readyz for their status.
+    """
+    app.mongodb_client = MongoClient(
+        mongo_uri,
+        serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+        socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+        event_listeners=[MongoCommandListener(), MongoPoolListener()],
+    )
+    app.database = app.mongodb_client[DB_NAME]
     app.db_restaurants = app.database['restaurants']
-    init_2dsphere_index(coll=app.db_restaurants, name="restaurants", field="address.coord")
-    logging.info(msg='2dSphere index processed for restaurants collection.')
     app.db_neighborhoods = app.database['neighborhoods']
-    init_2dsphere_index(coll=app.db_neighborhoods, name="neighborhoods", field="geometry")
-    logging.info(msg='2dSphere index processed for neighborhoods collection.')
-    init_Collection(db=app.database, name="boroughs", sphere_ref='geometry')
-    logging.info(msg='Successfully connected to mongodb_Atlas!')
+    app.db_boroughs = app.database['boroughs']
+    # already built when preloaded by gunicorn master
+    app.geo_boroughs = GEO_INDEXES['boroughs']
+    app.geo_neighborhoods = GEO_INDEXES['neighborhoods']
+    # polygons changed by other workers
+    app.geo_watcher = GeoIndexWatcher(app.database, GEO_INDEXES)
+    app.geo_watcher.start()
+    app.jobs = JobRunner(app.database)
+    app.jobs.register("spatial_join", SpatialJoinBatches)
+    app.jobs.register("import", ImportRun)
+    app.stats = ChoroplethStats(app.database)
+    app.rankings = Rankings(app.database)
+    # collection-wide jobs on restaurants: every stats and rankings are refreshed
+    app.jobs.subscribe(lambda job: job["collection"] == app.db_restaurants.name and app.stats.touchAll())
+    app.jobs.subscribe(lambda job: job["collection"] == app.db_restaurants.name and app.rankings.touchAll())
+    # imported restaurants (even of a cancelled import) are tagged by a spatial join job
+    app.jobs.subscribe(lambda job: job.get("kind") == "import" and doSpatialJoin(app, missing_only=True, write_concern=job.get("write_concern")))
+    # jobs on polygons (/neighborhood/update/field/set): geo indexes are built again
+    app.jobs.subscribe(lambda job: job["collection"] in GEO_INDEXES and GEO_INDEXES[job["collection"]].reload(app.database[job["collection"]]))
+    app.stats.start()
+    app.rankings.start()
+    app.write_behind = WriteBehindQueue() if WRITE_BEHIND else None
+    app.write_behind and app.write_behind.start()
+    app.warmup = Warmup()
+    app.warmup.add('restaurants_2dsphere', lambda: init_2dsphere_index(coll=app.db_restaurants, name="restaurants", field="address.coord"))
+    app.warmup.add('neighborhoods_2dsphere', lambda: init_2dsphere_index(coll=app.db_neighborhoods, name="neighborhoods", field="geometry"))
+    app.warmup.add('restaurants_facets_index', lambda: init_facets_index(app.db_restaurants), critical=False)
+    app.warmup.add('restaurants_grade_indexes', lambda: init_grade_indexes(app.db_restaurants), critical=False)
+    app.warmup.add('restaurants_tags_index', lambda: init_tag_indexes(app.db_restaurants), critical=False)
+    app.warmup.add('boroughs_collection', lambda: init_Collection(db=app.database, name="boroughs", sphere_ref='geometry'))
+    if not app.geo_boroughs.ready:
+        app.warmup.add('boroughs_geo_index', lambda: app.geo_boroughs.load(app.db_boroughs), after=['boroughs_collection'], critical=False)
+    if not app.geo_neighborhoods.ready:
+        app.warmup.add('neighborhoods_geo_index', lambda: app.geo_neighborhoods.load(app.db_neighborhoods), critical=False)
+    app.warmup.add('choropleth_stats', app.stats.refreshIfEmpty, after=['restaurants_tags_index'], critical=False)
+    app.warmup.add('rankings', app.rankings.refreshIfEmpty, after=['restaurants_tags_index'], critical=False)
+    # jobs interrupted by a restart, then periodic take over of jobs of stopped workers
+    app.warmup.add('jobs_resume', app.jobs.resumeAll, critical=False)
+    app.warmup.start()
+    logging.info(msg='Mongodb client created - warmup tasks started.')
     # For database managment, use console setup input:
     # console_setup()
 
 def shutdown_db_client():
+    app.warmup.shutdown()
+    # flush-on-shutdown: pending write-behind updates are written before client is closed
+    app.write_behind and app.write_behind.close()
+    app.jobs.shutdown()
+    app.stats.shutdown()
+    app.rankings.shutdown()
+    app.geo_watcher.shutdown()
     app.mongodb_client.close()
 
 
@@ -0,0 +1,22 @@
+import hmac
+from typing import Annotated
+from fastapi import Header, HTTPException
+
+from ..config import ADMIN_TOKEN
+
+
+def doCheckAdminToken(token: str|None) -> bool:
+    """
+    Constant time comparison with ADMIN_TOKEN. Always False when ADMIN_TOKEN is not set.
+    """
+    if not ADMIN_TOKEN or not token:
+        return False
+    return hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+
+def require_admin(x_admin_token: Annotated[str|None, Header()] = None):
+    """
+    Dependency for admin routes: X-Admin-Token header must match ADMIN_TOKEN.
+    """
+    if not doCheckAdminToken(x_admin_token):
+        raise HTTPException(status_code=403, detail="Admin token required.")
@@ -0,0 +1,139 @@
+import asyncio
+import json
+import os
+import time
+
+from ..modules.metrics.metrics import BULKHEAD_ACTIVE, BULKHEAD_QUEUE_WAIT, BULKHEAD_QUEUED, BULKHEAD_REJECTED
+from ..modules.profiling.trace import TRACE
+from .guardrails import RouteClass, doRouteClass
+
+"""
+BULKHEADS -
+Separate concurrency limits by route class (see middleware/guardrails.py), so that heavy
+/distinct or $geoNear requests can't fill the threadpool and starve cheap /one lookups.
+Each class has a number of slots, a max number of queued requests and a max queue wait;
+requests over queue depth or deadline are rejected with 503 and Retry-After.
+Limits are per worker process.
+"""
+
+# infrastructure routes are never limited (probes must answer under load)
+# /batch: its sub-requests take their own slots
+EXEMPT_PATHS = {"/healthz", "/readyz", "/metrics", "/docs", "/redoc", "/openapi.json", "/batch"}
+RETRY_AFTER = int(os.getenv('BULKHEAD_RETRY_AFTER', 1))
+
+
+class Bulkhead():
+    """
+    Slots of one route class.
+
+    @param concurrency:\n
+        int - requests processed at the same time.\n
+    @param queue:\n
+        int - requests waiting for a slot, more are rejected immediately.\n
+    @param timeout:\n
+        float - max queue wait in seconds.
+    """
+    def __init__(self, route_class: RouteClass, concurrency: int, queue: int, timeout: float):
+        self.route_class = route_class
+        self.concurrency = concurrency
+        self.queue = queue
+        self.timeout = timeout
+        self.waiting = 0
+        self.semaphore = asyncio.Semaphore(concurrency)
+
+    async def acquire(self) -> str|None:
+        """
+        Wait for a slot. Return None once acquired, the rejection reason otherwise.
+        """
+        if not self.semaphore.locked():
+            await self.semaphore.acquire()
+            return None
+        if self.waiting >= self.queue:
+            return 'queue_full'
+        self.waiting += 1
+        BULKHEAD_QUEUED.labels(self.route_class.value).inc()
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), self.timeout)
+            return None
+        except asyncio.TimeoutError:
+            return 'timeout'
+        finally:
+            self.waiting -= 1
+            BULKHEAD_QUEUED.labels(self.route_class.value).dec()
+
+    def release(self):
+        self.semaphore.release()
+
+
+def doClassBulkhead(route_class: RouteClass, concurrency: int, queue: int, timeout: float) -> Bulkhead:
+    """
+    Class limits, each one can be set with BULKHEAD_<CLASS>_<LIMIT> env (ex: BULKHEAD_GEO_CONCURRENCY).
+    """
+    prefix = f'BULKHEAD_{route_class.name}_'
+    return Bulkhead(
+        route_class,
+        concurrency=int(os.getenv(prefix + 'CONCURRENCY', concurrency)),
+        queue=int(os.getenv(prefix + 'QUEUE', queue)),
+        timeout=float(os.getenv(prefix + 'TIMEOUT', timeout)),
+    )
+
+
+# default slots share the 40 threads of a worker (THREADS)
+BULKHEADS = {
+    RouteClass.READ_LIGHT: doClassBulkhead(RouteClass.READ_LIGHT, 20, 200, 1),
+    RouteClass.READ_HEAVY: doClassBulkhead(RouteClass.READ_HEAVY, 8, 50, 2),
+    RouteClass.GEO: doClassBulkhead(RouteClass.GEO, 8, 50, 2),
+    RouteClass.WRITE: doClassBulkhead(RouteClass.WRITE, 4, 50, 5),
+    # long lived streams
+    RouteClass.EXPORT: doClassBulkhead(RouteClass.EXPORT, 2, 4, 1),
+}
+
+
+class BulkheadMiddleware():
+    """
+    Pure ASGI middleware holding a slot of the route class during the whole request.
+    Queue wait is added to Server-Timing as "queue" phase.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in EXEMPT_PATHS:
+            return await self.app(scope, receive, send)
+
+        bulkhead = BULKHEADS[doRouteClass(scope["method"], scope["path"])]
+        start = time.perf_counter()
+        reason = await bulkhead.acquire()
+        wait = time.perf_counter() - start
+        BULKHEAD_QUEUE_WAIT.labels(bulkhead.route_class.value).observe(wait)
+        if reason is not None:
+            BULKHEAD_REJECTED.labels(bulkhead.route_class.value, reason).inc()
+            return await self.doReject(send, bulkhead, reason)
+
+        trace = TRACE.get()
+        if trace is not None:
+            trace.add('queue', wait)
+        BULKHEAD_ACTIVE.labels(bulkhead.route_class.value).inc()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            BULKHEAD_ACTIVE.labels(bulkhead.route_class.value).dec()
+            bulkhead.release()
+
+    async def doReject(self, send, bulkhead: Bulkhead, reason: str):
+        body = json.dumps({"detail": {
+            "guardrail": "Server busy, retry later.",
+            "route_class": bulkhead.route_class.value,
+            "reason": reason,
+        }}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(RETRY_AFTER).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,111 @@
+import asyncio
+import hashlib
+import json
+import time
+
+from ..config import COALESCE
+from ..modules.metrics.metrics import COALESCED_REQUESTS
+from ..modules.profiling.trace import TRACE
+from .guardrails import ROUTE_CLASSES, RouteClass
+
+"""
+COALESCING (single-flight) -
+Read routes are POST requests with HttpParams body: identical requests received while
+the first one is processed wait for its response instead of running their own aggregation.
+Key is the route, query string and canonical json body (sorted keys). CORS headers are added
+to each response outside of this middleware (CORSMiddleware is outermost). Per worker process.
+"""
+
+# exports are streamed: never buffered for followers
+READ_PATHS = {path for path, route_class in ROUTE_CLASSES.items() if route_class not in (RouteClass.WRITE, RouteClass.EXPORT)}
+
+
+def doRequestKey(scope, body: bytes) -> str:
+    try:
+        body = json.dumps(json.loads(body or b'null'), sort_keys=True, separators=(',', ':')).encode()
+    except ValueError:
+        pass
+    digest = hashlib.sha256(body)
+    for part in (scope["path"].encode(), scope["query_string"]):
+        digest.update(b"\0" + part)
+    return digest.hexdigest()
+
+
+class CoalescingMiddleware():
+    """
+    Pure ASGI middleware: the leader request runs normally and records its response messages
+    and trace headers (added by TimingMiddleware), followers replay them.
+    If the leader fails without a response, followers run on their own.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+        # key > future of (response messages, trace headers)
+        self.inflight: dict[str, asyncio.Future] = {}
+
+    async def __call__(self, scope, receive, send):
+        if not COALESCE or scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in READ_PATHS:
+            return await self.app(scope, receive, send)
+        trace = TRACE.get()
+        if trace is not None and trace.profile:
+            return await self.app(scope, receive, send)
+
+        body = await self.doReadBody(receive)
+        replay = self.doReplay(body, receive)
+        key = doRequestKey(scope, body)
+
+        future = self.inflight.get(key)
+        if future is not None:
+            start = time.perf_counter()
+            shared = await asyncio.shield(future)
+            if shared is not None:
+                messages, headers = shared
+                COALESCED_REQUESTS.labels(scope["path"], 'follower').inc()
+                if trace is not None:
+                    trace.add('coalesced', time.perf_counter() - start)
+                    trace.headers.update(headers)
+                for message in messages:
+                    await send(message)
+                return
+            return await self.app(scope, replay, send)
+
+        future = asyncio.get_running_loop().create_future()
+        self.inflight[key] = future
+        COALESCED_REQUESTS.labels(scope["path"], 'leader').inc()
+        messages = []
+
+        async def send_wrapper(message):
+            messages.append(message)
+            await send(message)
+
+        try:
+            await self.app(scope, replay, send_wrapper)
+        finally:
+            del self.inflight[key]
+            complete = messages and not messages[-1].get("more_body", False)
+            future.set_result((messages, dict(trace.headers) if trace is not None else {}) if complete else None)
+
+    async def doReadBody(self, receive) -> bytes:
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] != "http.request":
+                break
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+        return b"".join(chunks)
+
+    def doReplay(self, body: bytes, receive):
+        """
+        Receive callable giving the already read body, then the original receive (disconnect).
+        """
+        sent = False
+
+        async def replay():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+        return replay
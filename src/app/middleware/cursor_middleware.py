@@ -1,7 +1,22 @@
+import json
+import typing
 from datetime import datetime
+from functools import lru_cache
+import bson
+from bson import ObjectId
+from fastapi import Response
+from pydantic import BaseModel
 from pymongo import CursorType
 
+from ..modules.profiling.trace import doTime, timed
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+@timed('cursor')
 def cursor_to_object(cursor: CursorType, rm_datetime: bool = False) -> dict|list:
     """
     Removes _id: ObjectId (not Json-interpretable) and convert additionnal problematic data.
@@ -17,13 +32,15 @@ def cursor_to_object(cursor: CursorType, rm_datetime: bool = False) -> dict|list
         # cursorList > find result
         l_result = list(map(lambda item: {k:v for k,v in item.items() if k!='_id'}, list(cursor)))
         if rm_datetime:
-            l_result = list(map(lambda item: convert_datetime_to_str(item), l_result))
+            with doTime('datetime'):
+                l_result = list(map(lambda item: convert_datetime_to_str(item), l_result))
     except:
         # cursorSingle > find_one result
         l_result = dict(cursor)
         l_result.pop('_id', None)
         if rm_datetime:
-            l_result = convert_datetime_to_str(l_result)
+            with doTime('datetime'):
+                l_result = convert_datetime_to_str(l_result)
     return l_result
 
 def convert_datetime_to_str(obj):
@@ -38,4 +55,95 @@ def convert_datetime_to_str(obj):
         result = obj.strftime('%Y-%m-%d')
         return result
     else:
-        return obj
\ No newline at end of file
+        return obj
+
+
+### Raw BSON > JSON #
+def doJsonDefault(obj):
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    raise TypeError(f'{type(obj).__name__} is not json serializable')
+
+
+def doJsonDefaultDate(obj):
+    if isinstance(obj, datetime):
+        return obj.strftime('%Y-%m-%d')
+    return doJsonDefault(obj)
+
+
+@lru_cache(maxsize=None)
+def doModelFields(model: type[BaseModel]) -> dict:
+    """
+    Field tree of a response model: field name > field tree of its nested model (lists and Optional
+    included), None for plain values.
+    """
+    def doNested(annotation):
+        if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+            return doModelFields(annotation)
+        for arg in typing.get_args(annotation):
+            nested = doNested(arg)
+            if nested is not None:
+                return nested
+        return None
+    return {name: doNested(field.annotation) for name, field in model.model_fields.items()}
+
+
+def doFilterFields(value, fields: dict):
+    """
+    Remove in place keys missing from field tree, in nested documents and lists of documents too.
+    """
+    if isinstance(value, list):
+        for item in value:
+            doFilterFields(item, fields)
+    elif isinstance(value, dict):
+        for key in [k for k in value if k not in fields]:
+            del value[key]
+        for key, nested in fields.items():
+            nested is not None and key in value and doFilterFields(value[key], nested)
+
+
+@timed('cursor')
+def raw_to_json(raw: bytes, fields: dict = None, rm_datetime: bool = False) -> bytes:
+    """
+    Transcode concatenated BSON documents (aggregate_raw_batches, see database/query.py doAggregateRaw)
+    into a json array, in one pass: each document is decoded once by the C extension, filtered in place
+    and serialized straight to bytes by orjson (json module when not installed).
+    Replaces list(cursor) + cursor_to_object + response_model validation and encoding: fields are
+    filtered like response_model does, values are not coerced to field types.
+
+    @param fields:\n
+        dict <Optionnal> - field tree of the response model (doModelFields), nested fields included, _id is always removed.
+
+    @param rm_datetime <Optionnal>:\n
+        bool - Format datetime as %Y-%m-%d.
+    """
+    l_docs = bson.decode_all(raw)
+    if fields is None:
+        for doc in l_docs:
+            doc.pop('_id', None)
+    else:
+        doFilterFields(l_docs, fields)
+    if orjson is not None:
+        if rm_datetime:
+            return orjson.dumps(l_docs, default=doJsonDefaultDate, option=orjson.OPT_PASSTHROUGH_DATETIME)
+        return orjson.dumps(l_docs, default=doJsonDefault)
+    return json.dumps(l_docs, default=doJsonDefaultDate if rm_datetime else doJsonDefault, separators=(',', ':')).encode()
+
+
+def raw_to_response(raw: bytes, model: type[BaseModel] = None, **envelope) -> Response:
+    """
+    JSON response of raw documents, bypassing route response_model.
+
+    @param model:\n
+        BaseModel <Optionnal> - only its fields (and fields of its nested models) are kept in documents.
+
+    @param envelope:\n
+        additionnal keys: documents are set in "data" key (ex: page_nbr=1 > {data: [...], page_nbr: 1}).
+    """
+    data = raw_to_json(raw, doModelFields(model) if model else None)
+    if envelope:
+        tail = json.dumps(envelope, separators=(',', ':'))[1:]
+        data = b'{"data":' + data + b',' + tail.encode()
+    return Response(content=data, media_type="application/json")
@@ -0,0 +1,182 @@
+import json
+import os
+import re
+from enum import Enum
+
+from ..config import GUARD_EXPLAIN, GUARD_OVERRIDES
+from .http_params import HttpParams
+
+"""
+GUARDRAILS -
+Query cost limits applied by routes before reaching Mongo:
+    * default and max number of items (nbr) - no more unbounded pages.
+    * maxTimeMS on every aggregate/find.
+    * max number of filter elements.
+    * optional explain pre-check rejecting COLLSCAN plans on large collections (GUARD_EXPLAIN=on).
+    * result cache ttl of route pipelines (0: no cache).
+    * write concern of write routes (None: client default, w=majority on Atlas).
+
+Limits are set by route class, and can be overridden per route path with GUARD_OVERRIDES env
+(json, ex: {"/distinct": {"max_nbr": 20000, "cache_ttl": 600}, "/create": {"write_concern": {"w": 1}}}).
+Rejections raise GuardrailError, turned into structured 4xx responses by CustomMiddleware.
+"""
+
+
+class RouteClass(str, Enum):
+    """
+    Cost class of a route.
+    """
+    READ_LIGHT = "read_light"
+    READ_HEAVY = "read_heavy"
+    GEO = "geo"
+    WRITE = "write"
+    EXPORT = "export"
+
+
+# route path (or template) > class, PUT|DELETE routes default to WRITE, other ones to READ_LIGHT
+ROUTE_CLASSES = {
+    "/one": RouteClass.READ_LIGHT,
+    "/list": RouteClass.READ_HEAVY,
+    "/distinct": RouteClass.READ_HEAVY,
+    "/create": RouteClass.WRITE,
+    "/neighborhood/one": RouteClass.READ_LIGHT,
+    "/neighborhood/list": RouteClass.READ_HEAVY,
+    "/neighborhood/distinct": RouteClass.READ_HEAVY,
+    "/neighborhood/stats": RouteClass.READ_HEAVY,
+    "/borough/one": RouteClass.READ_LIGHT,
+    "/borough/list": RouteClass.READ_HEAVY,
+    "/borough/stats": RouteClass.READ_HEAVY,
+    "/borough/contain": RouteClass.READ_LIGHT,
+    "/point/from_neighborhood": RouteClass.READ_LIGHT,
+    "/point/to_restaurant": RouteClass.GEO,
+    "/point/to_restaurant_within": RouteClass.GEO,
+    "/point/in_bbox": RouteClass.GEO,
+    "/point/context": RouteClass.GEO,
+    "/rankings": RouteClass.READ_LIGHT,
+    "/export/{collection}": RouteClass.EXPORT,
+    "/admin/import": RouteClass.WRITE,
+    "/admin/spatial_join": RouteClass.WRITE,
+    "/admin/grade_summary": RouteClass.WRITE,
+    "/jobs/{id}/resume": RouteClass.WRITE,
+}
+
+
+def doPathPattern(template: str) -> re.Pattern:
+    """
+    Regex of a route template: each {param} matches one path segment.
+    """
+    return re.compile('^' + re.sub(r'\\\{[^/]+\\\}', '[^/]+', re.escape(template)) + '$')
+
+
+# templates ({param}) matched against request paths
+ROUTE_TEMPLATES = [(doPathPattern(path), route_class) for path, route_class in ROUTE_CLASSES.items() if '{' in path]
+
+
+def doRouteClass(method: str, path: str) -> RouteClass:
+    if path in ROUTE_CLASSES:
+        return ROUTE_CLASSES[path]
+    for pattern, route_class in ROUTE_TEMPLATES:
+        if pattern.match(path):
+            return route_class
+    if method in ("PUT", "DELETE", "PATCH"):
+        return RouteClass.WRITE
+    return RouteClass.READ_LIGHT
+
+
+class Guard():
+    """
+    Limits of one route.
+    """
+    def __init__(self, default_nbr: int, max_nbr: int, max_time_ms: int, max_filter_elements: int, reject_collscan: bool, cache_ttl: float, write_concern: dict = None):
+        self.default_nbr = default_nbr
+        self.max_nbr = max_nbr
+        self.max_time_ms = max_time_ms
+        self.max_filter_elements = max_filter_elements
+        self.reject_collscan = reject_collscan
+        self.cache_ttl = cache_ttl
+        self.write_concern = write_concern
+
+    def doOverride(self, **changes) -> 'Guard':
+        return Guard(**{**self.__dict__, **changes})
+
+
+def doClassGuard(route_class: RouteClass, default_nbr: int, max_nbr: int, max_time_ms: int, cache_ttl: float) -> Guard:
+    """
+    Class limits, each one can be set with GUARD_<CLASS>_<LIMIT> env (ex: GUARD_READ_HEAVY_MAX_NBR,
+    GUARD_WRITE_WRITE_CONCERN='{"w": 1, "j": false}').
+    """
+    prefix = f'GUARD_{route_class.name}_'
+    write_concern = os.getenv(prefix + 'WRITE_CONCERN')
+    return Guard(
+        default_nbr=int(os.getenv(prefix + 'DEFAULT_NBR', default_nbr)),
+        max_nbr=int(os.getenv(prefix + 'MAX_NBR', max_nbr)),
+        max_time_ms=int(os.getenv(prefix + 'MAX_TIME_MS', max_time_ms)),
+        max_filter_elements=int(os.getenv(prefix + 'MAX_FILTER_ELEMENTS', 10)),
+        reject_collscan=GUARD_EXPLAIN,
+        cache_ttl=float(os.getenv(prefix + 'CACHE_TTL', cache_ttl)),
+        write_concern=json.loads(write_concern) if write_concern else None,
+    )
+
+
+GUARDS = {
+    RouteClass.READ_LIGHT: doClassGuard(RouteClass.READ_LIGHT, 20, 100, 2000, 60),
+    RouteClass.READ_HEAVY: doClassGuard(RouteClass.READ_HEAVY, 100, 1000, 5000, 60),
+    RouteClass.GEO: doClassGuard(RouteClass.GEO, 100, 1000, 3000, 30),
+    RouteClass.WRITE: doClassGuard(RouteClass.WRITE, 100, 1000, 10000, 0),
+    # streamed dumps: maxTimeMS of each batch query (keyset pagination), not of the whole export
+    RouteClass.EXPORT: doClassGuard(RouteClass.EXPORT, 0, 0, 30000, 0),
+}
+
+# distinct lists (cuisines, names, neighborhoods) are fetched whole by front end, and rarely change:
+# /distinct without nbr is not paginated (default_nbr 0), max_nbr only bounds explicit requests
+ROUTE_GUARDS = {
+    "/distinct": GUARDS[RouteClass.READ_HEAVY].doOverride(default_nbr=0, max_nbr=50000, cache_ttl=300),
+    "/neighborhood/distinct": GUARDS[RouteClass.READ_HEAVY].doOverride(default_nbr=1000, max_nbr=10000, cache_ttl=300),
+}
+for path, changes in json.loads(GUARD_OVERRIDES or '{}').items():
+    base = ROUTE_GUARDS.get(path) or GUARDS[doRouteClass('POST', path)]
+    ROUTE_GUARDS[path] = base.doOverride(**changes)
+
+
+def doGuard(method: str, path: str) -> Guard:
+    return ROUTE_GUARDS.get(path) or GUARDS[doRouteClass(method, path)]
+
+
+def doRequestGuard(request) -> Guard:
+    """
+    Guard of the route template matched by request.
+    """
+    route = request.scope.get("route")
+    return doGuard(request.method, getattr(route, "path", request.url.path))
+
+
+class GuardrailError(Exception):
+    """
+    Query rejected by guardrails. status_code and detail are used by CustomMiddleware.
+    """
+    def __init__(self, detail: dict, status_code: int = 422):
+        super().__init__(detail.get("guardrail"))
+        self.status_code = status_code
+        self.detail = detail
+
+
+def doCheckParams(params: HttpParams, guard: Guard, paginate: bool = True) -> HttpParams:
+    """
+    Apply default nbr (and first page) when missing, reject nbr over max and too many filter elements.
+    Return a copy of params (route default params are shared between requests).
+
+    @param paginate:\n
+        bool - False for routes with their own limit (one item, bbox cap): only max values are checked.
+    """
+    params = params.model_copy() if params is not None else HttpParams()
+    if paginate and not params.nbr:
+        params.nbr = guard.default_nbr
+    if params.nbr and params.nbr > guard.max_nbr:
+        raise GuardrailError({"guardrail": "Too many items requested.", "field": "nbr", "value": params.nbr, "max": guard.max_nbr})
+    if paginate and not params.page_nbr:
+        params.page_nbr = 1
+    if params.filters:
+        nbr_filters = len(params.filters.get("filter_elements") or []) or 1
+        if nbr_filters > guard.max_filter_elements:
+            raise GuardrailError({"guardrail": "Too many filter elements.", "field": "filters", "value": nbr_filters, "max": guard.max_filter_elements})
+    return params
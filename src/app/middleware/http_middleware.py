@@ -3,6 +3,7 @@ from typing import Any
 from fastapi import HTTPException, Request, Response
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
+from pymongo.errors import ConnectionFailure, ExecutionTimeout
 from starlette.middleware.base import BaseHTTPMiddleware
 
 
@@ -42,6 +43,20 @@ class CustomMiddleware(BaseHTTPMiddleware):
                 content=json.dumps(error_content, default=self.safe_serializer),
                 headers={"Content-Type": "application/json"},
             )
+        except ExecutionTimeout as e:
+            # maxTimeMS reached (see middleware/guardrails.py)
+            return Response(
+                status_code=504,
+                content=json.dumps({"detail": {"guardrail": "Query time limit exceeded, narrow filters or page size."}}),
+                headers={"Content-Type": "application/json"},
+            )
+        except ConnectionFailure as e:
+            # Mongo unreachable (server selection / socket timeouts) and no stale result to serve
+            return Response(
+                status_code=503,
+                content=json.dumps({"detail": "Database unavailable, retry later."}),
+                headers={"Content-Type": "application/json", "Retry-After": "5"},
+            )
         except Exception as e:
             status_code = 500
             error_detail = "Internal server error."
@@ -1,3 +1,4 @@
+from datetime import datetime
 from enum import Enum
 import json
 from typing import Any, Optional, Tuple
@@ -6,6 +7,7 @@ from pydantic import BaseModel, Field
 from pymongo import ASCENDING, DESCENDING
 
 from ..models.utils import IdMapper
+from ..modules.profiling.trace import timed
 
 ### OPERATOR ENUMS #
 """
@@ -76,6 +78,7 @@ class Filter():
     def apply(self):
         raise NotImplementedError("Subclasses must implement apply() method")
 
+    @timed('filter')
     def make(self):
         l_request = {}
         if all(param is None for param in [self.value, self.operator, self.operator_field, self.operator_field, self.field, self.filter_elements]):
@@ -100,8 +103,20 @@ class Filter():
         l_request.insert(-1, {"$match": {"name": {"$ne": ""}}})
         return l_request
 
+    def makeMatch(self) -> dict:
+        """
+        Find filter (update_many, find) of the filter: its first $match stage, {} without filter.
+        $geoNear filters are refused, they are pipeline stages only.
+        """
+        l_request = self.make()
+        if any(OP_FIELD.GEONEAR.value in stage for stage in l_request):
+            raise HTTPException(status_code=422, detail={"valueError": "$geoNear filter can't be used here.", "field": "operator_field", "value": OP_FIELD.GEONEAR.value})
+        return next((stage["$match"] for stage in l_request if "$match" in stage), {})
+
     #  Requete en aggregation pipeline
     def doBuildSingle(self, field:str, operator:OP_FIELD, val:any) -> dict:
+        if field in DATE_FIELDS:
+            val = doParseDate(val)
         # {<field>: {$eq: <value>}}
         if operator == OP_FIELD.EQ.value:
             return {field: {operator: val}}
@@ -140,6 +155,8 @@ class Filter():
         Hint: to get $all operator on values of sub-arrays, use $nor operator with reversed query.
         ex: {$nor: [{"grades.grade": {$gt: "A"}}]} > only grade $lte "A"
         ex: {"grades.grade": {$gt: "A"}} > some grade "A"
+        Current grade: filter (and sort) on indexed summary fields instead (modules/grades/grades.py),
+        ex: {"latest_grade": {$eq: "A"}}, {"avg_score": {$lt: 10}}, {"latest_inspection_date": {$gte: "2024-01-01"}}
         """
         if not has_geoNearFilter:
             l_request = [{'$match': {}}, {"$project": { "_id":0 }}]
@@ -227,6 +244,32 @@ class SortParams(BaseModel):
     field: str
     way: int
 
+class FacetField(str, Enum):
+    """
+    Facet counts of /list: filtered restaurants by borough, cuisine, latest grade or neighborhood (spatial join tag).
+    """
+    BOROUGH = "borough"
+    CUISINE = "cuisine"
+    GRADE = "grade"
+    NEIGHBORHOOD = "neighborhood"
+
+# filter values compared as dates (json has no date type)
+DATE_FIELDS = {"grades.date", "latest_inspection_date"}
+
+
+def doParseDate(value):
+    """
+    ISO strings to datetime, in lists too. Other values are returned as is.
+    """
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            return value
+    if isinstance(value, list):
+        return [doParseDate(v) for v in value]
+    return value
+
 # Error object returned in response.body #
 class ValueError():
     ValueError: str
@@ -243,6 +286,7 @@ class HttpParams(BaseModel):
     page_nbr: int = Field(default=None, ge=1)
     filters: dict = Field(default=None)
     sort: SortParams = Field(default=None)
+    facets: list[FacetField] = Field(default=None)
 
     class Config:
         json_schema_extra = {
@@ -264,3 +308,22 @@ def httpParamsInterpreter(params: HttpParams) -> list[int,int,Tuple[str,int]]:
     limit = params.nbr if params.nbr and params.nbr > 0 else None
     sort = {params.sort.field: ASCENDING if params.sort.way==1 else DESCENDING} if params.sort and params.sort.field and params.sort.way else None
     return [skip, limit, sort]
+
+### Facets #
+def makeFacets(facets: list[FacetField]) -> list[dict]:
+    """
+    $project and $facet stages: counts of filtered documents by value of each facet, most frequent first.
+    Only fields of requested facets are read: documents entering $facet are projected first
+    (a covered index scan when an index holds filter and facet fields).
+    """
+    # grade facet: latest grade, precomputed on restaurants (modules/grades/grades.py)
+    l_fields = {facet.value: "$latest_grade" if facet == FacetField.GRADE else 1 for facet in facets}
+    l_facets = {
+        facet.value: [
+            {"$group": {"_id": f"${facet.value}", "count": {"$sum": 1}}},
+            {"$sort": {"count": -1, "_id": 1}},
+            {"$project": {"_id": 0, "value": "$_id", "count": 1}},
+        ]
+        for facet in dict.fromkeys(facets)
+    }
+    return [{"$project": {"_id": 0, **l_fields}}, {"$facet": l_facets}]
@@ -0,0 +1,48 @@
+import time
+
+from ..modules.metrics.metrics import (
+    HTTP_IN_PROGRESS,
+    HTTP_LATENCY,
+    HTTP_REQUESTS,
+    HTTP_RESPONSE_SIZE,
+)
+
+
+class MetricsMiddleware():
+    """
+    Pure ASGI middleware (no BaseHTTPMiddleware overhead) recording request count,
+    latency and response size by route template (ex: /point/to_restaurant).
+    Route template is read from scope once router has matched the request.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        method = scope["method"]
+        status_code = 500
+        size = 0
+
+        async def send_wrapper(message):
+            nonlocal status_code, size
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        HTTP_IN_PROGRESS.labels(method).inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - start
+            HTTP_IN_PROGRESS.labels(method).dec()
+            route = scope.get("route")
+            template = getattr(route, "path", "unmatched")
+            HTTP_REQUESTS.labels(method, template, str(status_code)).inc()
+            HTTP_LATENCY.labels(method, template).observe(duration)
+            HTTP_RESPONSE_SIZE.labels(method, template).observe(size)
@@ -0,0 +1,57 @@
+import json
+import time
+
+from ..config import SERVER_TIMING
+from ..modules.profiling.trace import TRACE, RequestTrace
+from .admin_auth import doCheckAdminToken
+
+
+class TimingMiddleware():
+    """
+    Pure ASGI middleware creating the RequestTrace of each request, and adding
+    Server-Timing header (phases, Mongo round trips and bytes received) and
+    headers set by request processing (trace.headers, ex: Age of stale results) to response.
+
+    X-Profile: <ADMIN_TOKEN> header captures a profile of the endpoint,
+    file path is returned in X-Profile-File header.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        profile = None
+        for key, value in scope["headers"]:
+            if key == b"x-profile":
+                profile = value.decode()
+        if profile is not None and not doCheckAdminToken(profile):
+            return await self.doForbidden(send)
+        trace = RequestTrace(profile=profile is not None)
+        token = TRACE.set(trace)
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                if SERVER_TIMING or trace.profile:
+                    headers.append((b"server-timing", trace.doServerTiming(time.perf_counter() - start).encode()))
+                headers += [(k.lower().encode(), v.encode()) for k, v in trace.headers.items()]
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            TRACE.reset(token)
+
+    async def doForbidden(self, send):
+        body = json.dumps({"detail": "X-Profile requires a valid admin token."}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 403,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -1,7 +1,7 @@
 from datetime import datetime
 from typing import Any, Dict, Optional
 from bson import ObjectId
-from pydantic import BaseModel, Field, ValidationError, conlist
+from pydantic import BaseModel, Field, conlist
 
 
 ### Restaurant models #
@@ -30,6 +30,15 @@ class Restaurant(BaseModel):
     grades: list[Grade]
     name: str
     restaurant_id: str
+    # spatial join tags (modules/point/spatial_join.py), null outside of every polygon
+    neighborhood: str|None = None
+    borough_geo: str|None = None
+    # grades summary (modules/grades/grades.py), set on write
+    latest_grade: str|None = None
+    latest_score: int|None = None
+    latest_inspection_date: datetime|None = None
+    avg_score: float|None = None
+    grade_count: int|None = None
 
 ### Neighnorhood models #
 class Geometry(BaseModel):
@@ -53,9 +62,15 @@ class Borough(BaseModel):
 class Distinct(BaseModel):
     name: str
 
+class FacetCount(BaseModel):
+    value: Any
+    count: int
+
 class ListResponse(BaseModel):
     data: list[Restaurant|Neighborhood|Borough|Distinct]
     page_nbr: int
+    # /list facets: counts by value of each requested facet
+    facets: dict[str, list[FacetCount]]|None = None
 
 class Response(BaseModel):
     data: Restaurant|Neighborhood|Borough
@@ -69,6 +84,44 @@ class Distance(BaseModel):
     min: int
     max: int
 
+class BBox(BaseModel):
+    """
+    Viewport bounding box [min_lon, min_lat, max_lon, max_lat].
+    """
+    min_longitude: float = Field(ge=-180, le=180)
+    min_latitude: float = Field(ge=-90, le=90)
+    max_longitude: float = Field(ge=-180, le=180)
+    max_latitude: float = Field(ge=-90, le=90)
+
+class BBoxResponse(BaseModel):
+    data: list[Restaurant]
+    total: int
+    sampled: bool
+    page_nbr: int|None = None
+
+class PointContextResponse(BaseModel):
+    """
+    /point/context: nearest restaurants (data), borough and neighborhood of the point (None when outside).
+    """
+    data: list[Restaurant]
+    borough: Borough|None
+    neighborhood: Neighborhood|None
+
+
+### Batch models #
+class SubRequest(BaseModel):
+    """
+    One request of a /batch: read routes only, body as sent to the route.
+    """
+    id: str|None = None
+    method: str = Field(default="POST", pattern="^(GET|POST)$")
+    path: str = Field(pattern="^/")
+    body: Any = None
+
+class BatchRequest(BaseModel):
+    requests: list[SubRequest] = Field(min_length=1)
+    deadline_ms: int|None = Field(default=None, ge=1)
+
 
 ### Utils models #
 class SingleItemDict(BaseModel):
@@ -83,9 +136,3 @@ def check_dict_length(arr):
             raise ValueError("Dictionnary param must contain exactly one item.")
     return v
 
-
-try:
-    Restaurant()
-    Neighborhood()
-except ValidationError as exc:
-    print(repr(exc.errors()[0]['type']))
\ No newline at end of file
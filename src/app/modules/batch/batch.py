@@ -0,0 +1,125 @@
+import asyncio
+import json
+import time
+from urllib.parse import urlsplit
+
+from ...middleware.guardrails import doPathPattern
+from ...models.models import SubRequest
+
+"""
+BATCH -
+Sub-requests of /batch are dispatched in process to the app itself (ASGI call, no socket, no http
+parsing): each one goes through the whole middleware stack (guardrails, bulkheads, coalescing,
+result cache, metrics) as if it had been sent alone, and they all run concurrently.
+Only read routes are allowed (READ_ROUTES): no writes, exports, admin routes nor nested batches.
+"""
+
+# method > templates of routes allowed in a batch: anything else is refused
+READ_ROUTES = {
+    "POST": (
+        "/one", "/list", "/distinct",
+        "/neighborhood/one", "/neighborhood/list", "/neighborhood/distinct",
+        "/borough/one", "/borough/list", "/borough/contain",
+        "/point/from_neighborhood", "/point/to_restaurant", "/point/to_restaurant_within", "/point/in_bbox", "/point/context",
+    ),
+    "GET": ("/neighborhood/stats", "/borough/stats", "/rankings", "/jobs", "/jobs/{id}"),
+}
+READ_PATTERNS = {method: [doPathPattern(path) for path in paths] for method, paths in READ_ROUTES.items()}
+
+# outer request headers not forwarded to sub-requests
+DROPPED_HEADERS = {b"content-length", b"content-type", b"accept-encoding", b"transfer-encoding"}
+
+
+def doCheckSubRequest(sub: SubRequest) -> str|None:
+    """
+    Reason why a sub-request is refused, None when allowed.
+    """
+    path = urlsplit(sub.path).path
+    if path == "/batch":
+        return "nested batch is not allowed"
+    if not any(pattern.match(path) for pattern in READ_PATTERNS.get(sub.method, ())):
+        return "only read routes are allowed"
+    return None
+
+
+def doSubScope(scope: dict, sub: SubRequest, body: bytes) -> dict:
+    url = urlsplit(sub.path)
+    headers = [(k, v) for k, v in scope["headers"] if k not in DROPPED_HEADERS]
+    headers += [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+    return {
+        "type": "http",
+        "asgi": scope.get("asgi", {"version": "3.0"}),
+        "http_version": scope.get("http_version", "1.1"),
+        "method": sub.method,
+        "scheme": scope.get("scheme", "http"),
+        "path": url.path,
+        "raw_path": url.path.encode(),
+        "query_string": url.query.encode(),
+        "root_path": scope.get("root_path", ""),
+        "headers": headers,
+        "client": scope.get("client"),
+        "server": scope.get("server"),
+        "state": dict(scope.get("state") or {}),
+    }
+
+
+async def doSubRequest(app, scope: dict, sub: SubRequest) -> dict:
+    """
+    Run one sub-request against app, return {status, body, duration_ms}.
+    Body is decoded json when response is json, text otherwise.
+    """
+    start = time.perf_counter()
+    body = json.dumps(sub.body).encode() if sub.body is not None else b""
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if sent:
+            # no disconnect while the sub-request runs: batch deadline cancels it
+            await asyncio.Event().wait()
+        sent = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    status, content_type, chunks = 500, "", []
+
+    async def send(message):
+        nonlocal status, content_type
+        if message["type"] == "http.response.start":
+            status = message["status"]
+            content_type = next((v.decode() for k, v in message.get("headers", []) if k == b"content-type"), "")
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    await app(doSubScope(scope, sub, body), receive, send)
+    raw = b"".join(chunks)
+    if "json" in content_type:
+        content = json.loads(raw) if raw else None
+    else:
+        content = raw.decode(errors="replace")
+    return {"status": status, "body": content, "duration_ms": round((time.perf_counter() - start) * 1000, 2)}
+
+
+async def doBatch(app, scope: dict, requests: list[SubRequest], deadline_s: float) -> list[dict]:
+    """
+    Run sub-requests concurrently, results in requests order. Sub-requests still running at
+    deadline are cancelled and reported with status 504.
+    """
+    l_results: list[dict] = [None] * len(requests)
+    tasks: dict[asyncio.Task, int] = {}
+    for index, sub in enumerate(requests):
+        reason = doCheckSubRequest(sub)
+        if reason is not None:
+            l_results[index] = {"status": 403, "body": {"detail": reason}, "duration_ms": 0}
+        else:
+            tasks[asyncio.create_task(doSubRequest(app, scope, sub))] = index
+    if tasks:
+        done, pending = await asyncio.wait(tasks, timeout=deadline_s)
+        for task in pending:
+            task.cancel()
+            l_results[tasks[task]] = {"status": 504, "body": {"detail": "Batch deadline exceeded."}, "duration_ms": round(deadline_s * 1000, 2)}
+        for task in done:
+            try:
+                l_results[tasks[task]] = task.result()
+            except Exception as e:
+                l_results[tasks[task]] = {"status": 500, "body": {"detail": "Internal server error.", "args": [repr(e)]}, "duration_ms": None}
+    return [{"id": sub.id if sub.id is not None else str(index), **result} for index, (sub, result) in enumerate(zip(requests, l_results))]
@@ -0,0 +1,257 @@
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from enum import Enum
+from typing import Iterable, Iterator
+
+import bson
+from bson import ObjectId
+from bson.raw_bson import RawBSONDocument
+from pymongo.collection import Collection
+
+from ...database.query import doRawBatches
+
+"""
+EXPORT -
+Streaming writers of collection dumps. Input is an iterable of raw BSON batches
+(doKeysetBatches), output an iterator of bytes chunks: one batch is decoded, written
+and released at a time, so memory does not depend on collection size.
+Each batch is its own query (keyset pagination on _id): maxTimeMS bounds one batch,
+never the whole export.
+Every record carries its _id (as string): the last one received is the resume token
+of an interrupted export (after=<_id>).
+"""
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+
+class ExportFormat(str, Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+    GEOJSON = "geojson"
+    PARQUET = "parquet"
+
+
+MEDIA_TYPES = {
+    ExportFormat.NDJSON: "application/x-ndjson",
+    ExportFormat.CSV: "text/csv",
+    ExportFormat.GEOJSON: "application/geo+json",
+    ExportFormat.PARQUET: "application/vnd.apache.parquet",
+}
+
+# restaurants csv: one row per grade (restaurant fields repeated), one empty grade row if none
+RESTAURANT_COLUMNS = [
+    "_id", "restaurant_id", "name", "borough", "cuisine",
+    "building", "street", "zipcode", "longitude", "latitude",
+    "grade_date", "grade", "score",
+]
+# neighborhoods and boroughs csv: geometry as GeoJSON string
+AREA_COLUMNS = ["_id", "name", "geometry"]
+
+
+def doSerialize(obj):
+    """
+    json default: ObjectId and datetime values.
+    """
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    raise TypeError(f'{type(obj).__name__} is not json serializable')
+
+
+def doDumps(obj) -> str:
+    return json.dumps(obj, default=doSerialize, separators=(',', ':'))
+
+
+def doLastId(batch: bytes) -> tuple[int, object]:
+    """
+    Number of documents and _id of the last one in concatenated BSON documents, without decoding them.
+    """
+    count, start = 1, 0
+    size = int.from_bytes(batch[0:4], "little")
+    while start + size < len(batch):
+        start += size
+        size = int.from_bytes(batch[start:start + 4], "little")
+        count += 1
+    return count, RawBSONDocument(batch[start:start + size])["_id"]
+
+
+def doKeysetBatches(coll: Collection, pipeline: list, after, batch_size: int, max_time_ms: int) -> Iterator[bytes]:
+    """
+    Raw batches of pipeline documents in _id order, each one read by its own aggregation
+    (_id greater than the last one of previous batch, _id index), with its own maxTimeMS.
+
+    @param after:\n
+        _id <Optional> - export starts after it (resume token).
+    """
+    while True:
+        l_aggreg = list(pipeline)
+        after is not None and l_aggreg.append({"$match": {"_id": {"$gt": after}}})
+        l_aggreg += [{"$sort": {"_id": 1}}, {"$limit": batch_size}]
+        batch = doRawBatches(coll, l_aggreg, batchSize=batch_size, maxTimeMS=max_time_ms)
+        if not batch:
+            return
+        yield batch
+        count, after = doLastId(batch)
+        if count < batch_size:
+            return
+
+
+def doIterDocs(batches: Iterable[bytes]) -> Iterator[list[dict]]:
+    for batch in batches:
+        yield bson.decode_all(batch)
+
+
+### Writers #
+def doWriteNdjson(batches: Iterable[bytes], collection: str) -> Iterator[bytes]:
+    for docs in doIterDocs(batches):
+        yield "".join(doDumps(doc) + "\n" for doc in docs).encode()
+
+
+def doRestaurantRows(doc: dict) -> Iterator[list]:
+    address = doc.get("address") or {}
+    coord = address.get("coord") or [None, None]
+    base = [
+        str(doc.get("_id")), doc.get("restaurant_id"), doc.get("name"), doc.get("borough"), doc.get("cuisine"),
+        address.get("building"), address.get("street"), address.get("zipcode"),
+        coord[0] if len(coord) > 0 else None, coord[1] if len(coord) > 1 else None,
+    ]
+    grades = doc.get("grades") or [{}]
+    for grade in grades:
+        date = grade.get("date")
+        yield base + [date.isoformat() if isinstance(date, datetime) else date, grade.get("grade"), grade.get("score")]
+
+
+def doAreaRows(doc: dict) -> Iterator[list]:
+    yield [str(doc.get("_id")), doc.get("name"), doDumps(doc.get("geometry"))]
+
+
+def doWriteCsv(batches: Iterable[bytes], collection: str) -> Iterator[bytes]:
+    columns, rows = (RESTAURANT_COLUMNS, doRestaurantRows) if collection == "restaurants" else (AREA_COLUMNS, doAreaRows)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for docs in doIterDocs(batches):
+        for doc in docs:
+            writer.writerows(rows(doc))
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    # header only for an empty export
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def doFeature(doc: dict, collection: str) -> dict:
+    properties = {k: v for k, v in doc.items() if k not in ("_id", "geometry")}
+    if collection == "restaurants":
+        coord = (doc.get("address") or {}).get("coord")
+        geometry = {"type": "Point", "coordinates": coord} if coord else None
+    else:
+        geometry = doc.get("geometry")
+    return {"type": "Feature", "id": str(doc.get("_id")), "geometry": geometry, "properties": properties}
+
+
+def doWriteGeojson(batches: Iterable[bytes], collection: str) -> Iterator[bytes]:
+    yield b'{"type":"FeatureCollection","features":['
+    separator = ""
+    for docs in doIterDocs(batches):
+        chunk = []
+        for doc in docs:
+            chunk.append(separator + doDumps(doFeature(doc, collection)))
+            separator = ","
+        yield "".join(chunk).encode()
+    yield b']}'
+
+
+class ChunkSink(io.RawIOBase):
+    """
+    Write-only file drained after each parquet row group.
+    """
+    def __init__(self):
+        self.chunks: list[bytes] = []
+        self.position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def drain(self) -> bytes:
+        data, self.chunks = b"".join(self.chunks), []
+        return data
+
+
+def doParquetSchema(collection: str):
+    if collection == "restaurants":
+        return pa.schema([
+            ("_id", pa.string()),
+            ("restaurant_id", pa.string()),
+            ("name", pa.string()),
+            ("borough", pa.string()),
+            ("cuisine", pa.string()),
+            ("address", pa.struct([
+                ("building", pa.string()), ("street", pa.string()), ("zipcode", pa.string()),
+                ("coord", pa.list_(pa.float64())),
+            ])),
+            ("grades", pa.list_(pa.struct([
+                ("date", pa.timestamp("ms")), ("grade", pa.string()), ("score", pa.int64()),
+            ]))),
+        ])
+    return pa.schema([("_id", pa.string()), ("name", pa.string()), ("geometry", pa.string())])
+
+
+def doParquetRecord(doc: dict, collection: str) -> dict:
+    doc = {**doc, "_id": str(doc.get("_id"))}
+    if collection != "restaurants":
+        doc["geometry"] = doDumps(doc.get("geometry"))
+    return doc
+
+
+def doWriteParquet(batches: Iterable[bytes], collection: str) -> Iterator[bytes]:
+    """
+    One row group per raw batch, zstd compressed columns.
+    """
+    schema = doParquetSchema(collection)
+    sink = ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    try:
+        for docs in doIterDocs(batches):
+            table = pa.Table.from_pylist([doParquetRecord(doc, collection) for doc in docs], schema=schema)
+            writer.write_table(table)
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+WRITERS = {
+    ExportFormat.NDJSON: doWriteNdjson,
+    ExportFormat.CSV: doWriteCsv,
+    ExportFormat.GEOJSON: doWriteGeojson,
+    ExportFormat.PARQUET: doWriteParquet,
+}
+
+
+def doGzip(chunks: Iterator[bytes], level: int = 6) -> Iterator[bytes]:
+    """
+    Compress a stream of chunks on the fly (gzip container, Content-Encoding: gzip).
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,90 @@
+from fastapi import HTTPException
+from pydantic import TypeAdapter, ValidationError
+
+from ...models.models import Grade
+
+"""
+GRADES -
+Summary of a restaurant grades array, stored on the restaurant so that its current grade can be
+filtered and sorted on with an index, instead of reasoning over the whole array:
+    latest_grade, latest_score, latest_inspection_date: latest inspection (grades are not sorted by date).
+    avg_score: average score of every inspection, null without scores.
+    grade_count: number of inspections.
+Kept current by write routes (create, update, field set) and imports, set on existing restaurants
+by a backfill job (POST /admin/grade_summary).
+"""
+
+# latest inspection of a restaurant: grades are not sorted by date (imports add them at the end)
+LATEST_GRADE = {
+    "$reduce": {
+        "input": {"$ifNull": ["$grades", []]},
+        "initialValue": None,
+        "in": {"$cond": [{"$or": [{"$eq": ["$$value", None]}, {"$gt": ["$$this.date", "$$value.date"]}]}, "$$this", "$$value"]},
+    }
+}
+
+GRADES_ADAPTER = TypeAdapter(list[Grade])
+
+SUMMARY_FIELDS = ("latest_grade", "latest_score", "latest_inspection_date", "avg_score", "grade_count")
+
+# update pipeline computing summary from stored grades (update_many, bulk UpdateOne)
+SUMMARY_UPDATE = [
+    {"$set": {"latest_inspection": LATEST_GRADE}},
+    {
+        "$set": {
+            "latest_grade": {"$ifNull": ["$latest_inspection.grade", None]},
+            "latest_score": {"$ifNull": ["$latest_inspection.score", None]},
+            "latest_inspection_date": {"$ifNull": ["$latest_inspection.date", None]},
+            "avg_score": {"$avg": {"$ifNull": ["$grades.score", []]}},
+            "grade_count": {"$size": {"$ifNull": ["$grades", []]}},
+        }
+    },
+    {"$unset": "latest_inspection"},
+]
+
+
+def doValidGrades(grades) -> list[dict]:
+    """
+    Grades array written as a whole, validated: dates are stored as dates (compared by LATEST_GRADE), 422 otherwise.
+    """
+    try:
+        return [grade.model_dump() for grade in GRADES_ADAPTER.validate_python(grades)]
+    except ValidationError as e:
+        raise HTTPException(
+            status_code=422,
+            detail={"valueError": "Invalid grades.", "field": "grades", "errors": e.errors(include_url=False, include_context=False, include_input=False)},
+        )
+
+
+def doGradeSummary(grades: list[dict]|None) -> dict:
+    """
+    Summary of validated grades in python, for grades written as a whole (create, grades array replaced).
+    """
+    grades = grades or []
+    latest = max(grades, key=lambda grade: grade["date"], default=None)
+    scores = [grade["score"] for grade in grades if isinstance(grade.get("score"), (int, float))]
+    return {
+        "latest_grade": latest.get("grade") if latest else None,
+        "latest_score": latest.get("score") if latest else None,
+        "latest_inspection_date": latest["date"] if latest else None,
+        "avg_score": sum(scores) / len(scores) if scores else None,
+        "grade_count": len(grades),
+    }
+
+
+def doSummaryChanges(changes: dict) -> dict:
+    """
+    $set changes with validated grades and their summary, when they replace the whole array.
+    """
+    if "grades" in changes:
+        grades = doValidGrades(changes["grades"])
+        return {**changes, "grades": grades, **doGradeSummary(grades)}
+    return changes
+
+
+def doPartialGrades(changes: dict) -> bool:
+    """
+    True when $set changes modify elements of grades ("grades.0.score"): summary is then computed
+    from stored grades by a SUMMARY_UPDATE after the write.
+    """
+    return any(key.startswith("grades.") for key in changes)
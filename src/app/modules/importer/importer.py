@@ -0,0 +1,376 @@
+import argparse
+import csv
+import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime
+from enum import Enum
+from typing import Iterator
+
+from pydantic import TypeAdapter, ValidationError
+from pymongo import MongoClient, UpdateOne
+from pymongo.collection import Collection
+from pymongo.errors import BulkWriteError
+
+from ...config import DB_NAME, IMPORT_BATCH_SIZE, IMPORT_CHUNK_ROWS, IMPORT_WORKERS, MONGO_URI
+from ...models.models import Restaurant
+from ..grades.grades import SUMMARY_UPDATE
+
+"""
+IMPORTER -
+Bulk import of NYC open data restaurant inspection files (DOHMH New York City Restaurant
+Inspection Results, CSV export or SODA json lines): one row per inspection violation.
+
+    * main process splits records (csv.reader: quoted fields may hold newlines, json lines otherwise)
+      and sends chunks of IMPORT_CHUNK_ROWS records, with their first line number, to a process pool.
+    * workers parse rows, group them by restaurant_id (CAMIS) into Restaurant documents with their
+      grades, and validate each chunk in one call of a cached pydantic TypeAdapter.
+    * main process upserts documents with unordered bulk_write: restaurant fields are $set,
+      grades are added with $addToSet, so that restaurants split over chunks, and re-imports
+      of the same file, are merged.
+    * grades summary fields (modules/grades/grades.py) are then computed from stored grades,
+      by one update_many per batch.
+    * POST /admin/import spools the body to a temporary file and runs it as an "import" job
+      (modules/jobs/jobs.py, ImportRun), so that the request ends at once.
+
+CLI, from root of the project:
+    python -m src.app.modules.importer.importer inspections.csv --workers 8
+"""
+
+# validators built once per process
+RESTAURANTS_ADAPTER = TypeAdapter(list[Restaurant])
+# rejected rows kept in report (all of them are counted)
+REJECT_SAMPLE = 100
+# inspection date of restaurants not inspected yet
+NOT_INSPECTED = datetime(1900, 1, 1)
+
+
+class ImportFormat(str, Enum):
+    CSV = "csv"
+    NDJSON = "ndjson"
+
+
+class ImportReport():
+    """
+    rows: records read (without csv header), a csv record may span several lines.
+    restaurants: restaurant documents upserted, counted once per chunk they appear in.
+    rejected: rows (or restaurants) refused by parsing, validation or Mongo, with samples.
+    """
+    def __init__(self):
+        self.rows = 0
+        self.restaurants = 0
+        self.grades = 0
+        self.upserted = 0
+        self.modified = 0
+        self.rejected = 0
+        self.rejected_sample: list[dict] = []
+        self.started_at = time.perf_counter()
+        self.duration: float = None
+
+    def doReject(self, line: int|None, reason: str):
+        self.rejected += 1
+        if len(self.rejected_sample) < REJECT_SAMPLE:
+            self.rejected_sample.append({"line": line, "reason": reason})
+
+    def report(self) -> dict:
+        duration = self.duration if self.duration is not None else time.perf_counter() - self.started_at
+        return {
+            "rows": self.rows,
+            "restaurants": self.restaurants,
+            "grades": self.grades,
+            "upserted": self.upserted,
+            "modified": self.modified,
+            "rejected": self.rejected,
+            "rejected_sample": self.rejected_sample,
+            "duration_s": round(duration, 3),
+            "rows_per_s": round(self.rows / duration) if duration else None,
+        }
+
+
+### Parsing (worker processes) #
+def doNormalizeKey(key: str) -> str:
+    """
+    CSV headers (CUISINE DESCRIPTION) and SODA json keys (cuisine_description) to the same name.
+    """
+    return key.strip().lower().replace(' ', '_')
+
+
+def doParseDate(value: str) -> datetime|None:
+    if not value:
+        return None
+    for fmt in ('%m/%d/%Y', '%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(value.strip(), fmt)
+        except ValueError:
+            continue
+    raise ValueError(f'invalid date {value!r}')
+
+
+def doParseCoord(row: dict) -> list[float]:
+    try:
+        lon, lat = float(row.get('longitude') or 0), float(row.get('latitude') or 0)
+    except ValueError:
+        return []
+    # 0 is used for missing coordinates in open data
+    return [lon, lat] if lon and lat else []
+
+
+def doIterRows(records: list[tuple[int, list[str]|str]], fmt: ImportFormat, fieldnames: list[str]|None) -> Iterator[tuple[int, dict|None]]:
+    """
+    (line, row with normalized keys) of each record, row None for unreadable records.
+    """
+    for line, record in records:
+        if fmt == ImportFormat.CSV:
+            yield line, dict(zip(fieldnames, record)) if len(record) == len(fieldnames) else None
+            continue
+        try:
+            row = json.loads(record)
+            yield line, {doNormalizeKey(k): v for k, v in row.items()} if isinstance(row, dict) else None
+        except ValueError:
+            yield line, None
+
+
+def doParseChunk(records: list[tuple[int, list[str]|str]], fmt: ImportFormat, fieldnames: list[str]|None) -> dict:
+    """
+    Parse and validate a chunk of records into restaurant documents grouped by restaurant_id.
+
+    @param records:\n
+        list[(first line of record, csv values | json line)] - see doIterChunks.\n
+
+    @return:\n
+        {rows: int, docs: list[dict], grades: int, rejected: list[{line, reason}]}
+    """
+    restaurants: dict[str, dict] = {}
+    lines_of: dict[str, list[int]] = {}
+    rejected = []
+    for line, row in doIterRows(records, fmt, fieldnames):
+        if row is None:
+            rejected.append({"line": line, "reason": "unreadable record"})
+            continue
+        camis = str(row.get('camis') or '').strip()
+        if not camis:
+            rejected.append({"line": line, "reason": "missing CAMIS (restaurant_id)"})
+            continue
+        try:
+            date = doParseDate(row.get('grade_date') or row.get('inspection_date'))
+            score = row.get('score')
+            score = int(float(score)) if score not in (None, '') else None
+        except ValueError as e:
+            rejected.append({"line": line, "reason": str(e)})
+            continue
+        doc = restaurants.setdefault(camis, {"restaurant_id": camis, "grades": {}})
+        lines_of.setdefault(camis, []).append(line)
+        # last row wins for restaurant fields
+        doc.update({
+            "name": (row.get('dba') or '').strip(),
+            "borough": (row.get('boro') or '').strip(),
+            "cuisine": (row.get('cuisine_description') or '').strip(),
+            "address": {
+                "building": (row.get('building') or '').strip(),
+                "street": (row.get('street') or '').strip(),
+                "zipcode": str(row.get('zipcode') or '').strip(),
+                "coord": doParseCoord(row),
+            },
+        })
+        grade = (row.get('grade') or '').strip()
+        if grade and date and date != NOT_INSPECTED:
+            # one inspection has one row per violation: same grade repeated
+            doc["grades"][(date, grade, score)] = {"date": date, "grade": grade, "score": score}
+
+    l_ids = list(restaurants)
+    l_docs = [{**restaurants[i], "grades": list(restaurants[i]["grades"].values())} for i in l_ids]
+    invalid = {}
+    try:
+        l_models = RESTAURANTS_ADAPTER.validate_python(l_docs)
+    except ValidationError as e:
+        for error in e.errors():
+            index = error["loc"][0]
+            invalid.setdefault(index, f'{".".join(str(l) for l in error["loc"][1:])}: {error["msg"]}')
+        valid = [doc for index, doc in enumerate(l_docs) if index not in invalid]
+        l_models = RESTAURANTS_ADAPTER.validate_python(valid)
+    for index, reason in invalid.items():
+        for line in lines_of[l_ids[index]]:
+            rejected.append({"line": line, "reason": reason})
+
+    docs = [model.model_dump() for model in l_models]
+    return {
+        "rows": len(records),
+        "docs": docs,
+        "grades": sum(len(doc["grades"]) for doc in docs),
+        "rejected": rejected,
+    }
+
+
+### Writing (main process) #
+def doUpsertOps(docs: list[dict]) -> list[UpdateOne]:
+    l_ops = []
+    for doc in docs:
+        grades = doc.pop("grades")
+        update = {"$set": doc}
+        if grades:
+            update["$addToSet"] = {"grades": {"$each": grades}}
+        else:
+            update["$setOnInsert"] = {"grades": []}
+        l_ops.append(UpdateOne({"restaurant_id": doc["restaurant_id"]}, update, upsert=True))
+    return l_ops
+
+
+def doBulkWrite(coll: Collection, docs: list[dict], report: ImportReport, batch_size: int):
+    l_ids = [doc["restaurant_id"] for doc in docs]
+    l_ops = doUpsertOps(docs)
+    for i in range(0, len(l_ops), batch_size):
+        try:
+            result = coll.bulk_write(l_ops[i:i + batch_size], ordered=False)
+            report.upserted += result.upserted_count
+            report.modified += result.modified_count
+        except BulkWriteError as e:
+            details = e.details
+            report.upserted += details.get("nUpserted", 0)
+            report.modified += details.get("nModified", 0)
+            for error in details.get("writeErrors", []):
+                report.doReject(None, f'restaurant_id {l_ids[i + error["index"]]}: {error["errmsg"]}')
+        # grades were merged ($addToSet): summary from stored grades
+        coll.update_many({"restaurant_id": {"$in": l_ids[i:i + batch_size]}}, SUMMARY_UPDATE)
+
+
+def doIterRecords(f, fmt: ImportFormat) -> Iterator[tuple[int, list[str]|str]]:
+    """
+    (first line, record) of each non blank record after csv header: csv values, split by csv.reader
+    (a quoted field may hold newlines, so a record may span several lines), or a json line.
+    """
+    if fmt == ImportFormat.CSV:
+        reader = csv.reader(f)
+        last_line = reader.line_num
+        for values in reader:
+            line, last_line = last_line + 1, reader.line_num
+            if values:
+                yield line, values
+        return
+    for line, text in enumerate(f, start=1):
+        if text.strip():
+            yield line, text
+
+
+def doIterChunks(path: str, fmt: ImportFormat, chunk_rows: int) -> Iterator[tuple[list[tuple[int, list[str]|str]], list[str]|None]]:
+    """
+    (chunk of chunk_rows records, csv fieldnames) - records are split here, parsed by pool processes.
+    """
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        records = doIterRecords(f, fmt)
+        fieldnames = None
+        if fmt == ImportFormat.CSV:
+            header = next(records, None)
+            if header is None:
+                return
+            fieldnames = [doNormalizeKey(k) for k in header[1]]
+        chunk = []
+        for record in records:
+            chunk.append(record)
+            if len(chunk) >= chunk_rows:
+                yield chunk, fieldnames
+                chunk = []
+        if chunk:
+            yield chunk, fieldnames
+
+
+def doImport(
+    path: str,
+    coll: Collection,
+    fmt: ImportFormat = ImportFormat.CSV,
+    workers: int = IMPORT_WORKERS,
+    chunk_rows: int = IMPORT_CHUNK_ROWS,
+    batch_size: int = IMPORT_BATCH_SIZE,
+    progress=None,
+) -> ImportReport:
+    """
+    Import a file into restaurants collection. Chunks in flight are bounded (2 per worker),
+    so that memory does not depend on file size.
+
+    @param progress:\n
+        Callable(ImportReport) <Optional>: called after each chunk is written.
+    """
+    report = ImportReport()
+    coll.create_index("restaurant_id", name="restaurant_id")
+    # spawn: web workers and drivers run threads, forking them is unsafe
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        pending = set()
+        chunks = doIterChunks(path, fmt, chunk_rows)
+
+        def doCollect(done):
+            for future in done:
+                result = future.result()
+                report.rows += result["rows"]
+                report.grades += result["grades"]
+                report.restaurants += len(result["docs"])
+                for reject in result["rejected"]:
+                    report.doReject(reject["line"], reject["reason"])
+                doBulkWrite(coll, result["docs"], report, batch_size)
+                progress and progress(report)
+
+        for records, fieldnames in chunks:
+            pending.add(pool.submit(doParseChunk, records, fmt, fieldnames))
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                doCollect(done)
+        doCollect(wait(pending).done)
+    report.duration = time.perf_counter() - report.started_at
+    return report
+
+
+class ImportRun():
+    """
+    "import" job kind: one run imports the spooled file of the job update ({"path", "format"}) into the
+    target collection, then removes it. processed: rows, matched: restaurants, modified: upserted and modified.
+    The file is local to the worker that received it: an interrupted import fails, it can't be resumed.
+    """
+    def __init__(self, target: Collection, filter: dict, update: dict):
+        self.target = target
+        self.path = update["path"]
+        self.fmt = ImportFormat(update["format"])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        return False
+
+    def run(self, progress) -> dict:
+        report = doImport(self.path, self.target, self.fmt, progress=lambda r: progress(r.rows, r.restaurants, r.upserted + r.modified))
+        return report.report()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Import NYC restaurant inspection results (csv or json lines).')
+    parser.add_argument('path')
+    parser.add_argument('--format', choices=[f.value for f in ImportFormat], help='default: from file extension')
+    parser.add_argument('--workers', type=int, default=IMPORT_WORKERS)
+    parser.add_argument('--chunk', type=int, default=IMPORT_CHUNK_ROWS, help='records per worker task')
+    parser.add_argument('--batch', type=int, default=IMPORT_BATCH_SIZE, help='bulk_write batch size')
+    parser.add_argument('--mongo-uri', default=MONGO_URI)
+    parser.add_argument('--db', default=DB_NAME)
+    args = parser.parse_args()
+    fmt = ImportFormat(args.format or ('csv' if args.path.lower().endswith('.csv') else 'ndjson'))
+
+    def doPrint(report: ImportReport):
+        r = report.report()
+        print(f'{r["rows"]} rows, {r["restaurants"]} restaurants, {r["rejected"]} rejected ({r["rows_per_s"]} rows/s)', flush=True)
+
+    client = MongoClient(args.mongo_uri)
+    try:
+        report = doImport(args.path, client[args.db]["restaurants"], fmt, args.workers, args.chunk, args.batch, doPrint)
+    finally:
+        client.close()
+    print(json.dumps(report.report(), indent=2, default=str))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
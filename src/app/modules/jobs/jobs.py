@@ -0,0 +1,398 @@
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from enum import Enum
+from typing import Callable
+
+from bson import ObjectId, json_util
+from pymongo import ReturnDocument
+from pymongo.collection import Collection
+from pymongo.database import Database
+from pymongo.errors import ExecutionTimeout
+from pymongo.write_concern import WriteConcern
+
+from ...config import JOB_BATCH_SIZE, JOB_LEASE_S, JOB_THROTTLE_MS
+from ...database.query import doInvalidate
+
+"""
+JOBS -
+Background collection-wide mutations (update_many of admin routes), persisted in the "jobs"
+collection so that they survive restarts:
+    * the target collection is processed in _id order by batches of JOB_BATCH_SIZE documents,
+      with JOB_THROTTLE_MS pause between batches, so that Mongo keeps serving routes.
+    * progress (last _id, processed, matched, modified, elapsed time) is saved after each batch:
+      an interrupted job resumes after its last batch.
+    * a running job is leased by one api worker (owner, heartbeat_at refreshed at each batch):
+      jobs of a stopped worker are taken over when their lease expires (JOB_LEASE_S).
+    * cancellation is a status change, seen by the runner at the end of its current batch.
+status: pending | running | done | cancelled | failed
+kind: how a batch is updated - "update" (update document applied with update_many) by default,
+      other kinds are registered by their module (ex: "spatial_join", modules/point/spatial_join.py).
+      A kind with a run(progress) method is run in one call instead of batches (ex: "import",
+      modules/importer/importer.py): progress is saved by its callback, its report is the job result.
+"""
+
+
+class JobStatus(str, Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    CANCELLED = "cancelled"
+    FAILED = "failed"
+
+
+ACTIVE = [JobStatus.PENDING.value, JobStatus.RUNNING.value]
+
+
+class JobStopped(Exception):
+    """
+    Raised by the progress callback of a run(progress) job kind: job cancelled, lease lost or worker stopping.
+    """
+
+
+def doNow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class UpdateBatches():
+    """
+    Default job kind: job update document applied to each batch with update_many.
+    A job kind is a context manager, opened for one run of a job, whose apply(query)
+    updates the documents of one batch and returns (matched, modified).
+    """
+    def __init__(self, target: Collection, filter: dict, update: dict):
+        self.target = target
+        self.update = update
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def apply(self, query: dict) -> tuple[int, int]:
+        result = self.target.update_many(query, self.update)
+        return result.matched_count, result.modified_count
+
+
+def doReport(job: dict) -> dict:
+    """
+    Public view of a job document, with progress (0-1) and ETA from the measured rate.
+    """
+    total, processed, elapsed = job.get("total") or 0, job.get("processed", 0), job.get("elapsed_s", 0)
+    rate = processed / elapsed if elapsed else None
+    eta = None
+    if job["status"] in ACTIVE and rate:
+        eta = round(max(0, total - processed) / rate, 1)
+    return {
+        "id": str(job["_id"]),
+        "kind": job.get("kind", "update"),
+        "description": job.get("description"),
+        "collection": job["collection"],
+        "status": job["status"],
+        "total": total,
+        "processed": processed,
+        "matched": job.get("matched", 0),
+        "modified": job.get("modified", 0),
+        "upserted_id": str(job["upserted_id"]) if job.get("upserted_id") else None,
+        "progress": round(min(1, processed / total), 4) if total else (1 if job["status"] == JobStatus.DONE.value else 0),
+        "rate_per_s": round(rate, 1) if rate else None,
+        "eta_s": eta,
+        "created_at": job.get("created_at"),
+        "updated_at": job.get("updated_at"),
+        "finished_at": job.get("finished_at"),
+        "error": job.get("error"),
+        "result": job.get("result"),
+    }
+
+
+class JobRunner():
+    """
+    Create, run, cancel and resume jobs of one api worker.
+
+    @param database:\n
+        Database - holds "jobs" collection and jobs target collections.
+    """
+    def __init__(self, database: Database, batch_size: int = JOB_BATCH_SIZE, throttle_ms: int = JOB_THROTTLE_MS, lease_s: float = JOB_LEASE_S):
+        self.database = database
+        self.jobs: Collection = database["jobs"]
+        self.batch_size = batch_size
+        self.throttle_ms = throttle_ms
+        self.lease_s = lease_s
+        self.owner = f'{socket.gethostname()}:{os.getpid()}'
+        self.threads: dict[ObjectId, threading.Thread] = {}
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.sweeper: threading.Thread = None
+        self.kinds: dict[str, type] = {"update": UpdateBatches}
+        self.listeners: list[Callable[[dict], None]] = []
+
+    ### Api #
+    def register(self, kind: str, batches: type):
+        """
+        Add a job kind, before jobs of this kind are created or resumed.
+
+        @param batches:\n
+            type - built with (target, filter, update) for each run of a job, see UpdateBatches.
+        """
+        self.kinds[kind] = batches
+
+    def subscribe(self, listener: Callable[[dict], None]):
+        """
+        Call listener with each job that ends done or cancelled in this worker (its documents changed).
+        """
+        self.listeners.append(listener)
+
+    def create(self, collection: str, filter: dict, update: dict, upsert: bool = False, description: str = None, write_concern: dict = None, kind: str = "update", total: int = None) -> dict:
+        """
+        Save a pending job and start it in background.
+
+        @param filter:\n
+            dict - find filter of documents to update (no $geoNear).\n
+
+        @param update:\n
+            dict - update document ($set, $unset, $rename...) applied to each batch.\n
+
+        @param upsert:\n
+            bool - insert one document from filter and update when nothing matched (update_many upsert).\n
+
+        @param write_concern:\n
+            dict <Optional> - write concern of batches (route guard), client default when None.\n
+
+        @param kind:\n
+            str - registered job kind, "update" by default.\n
+
+        @param total:\n
+            int <Optional> - documents to process when known (0: unknown), counted from filter when None.
+        """
+        if kind not in self.kinds:
+            raise ValueError(f'Unknown job kind: {kind}')
+        now = doNow()
+        job = {
+            "kind": kind,
+            "description": description,
+            "collection": collection,
+            # extended json strings: $ operators can't be stored as field names
+            "filter": json_util.dumps(filter),
+            "update": json_util.dumps(update),
+            "upsert": upsert,
+            "write_concern": write_concern,
+            "status": JobStatus.PENDING.value,
+            "total": self.doCount(self.database[collection], filter) if total is None else total,
+            "processed": 0,
+            "matched": 0,
+            "modified": 0,
+            "elapsed_s": 0,
+            "last_id": None,
+            "owner": None,
+            "heartbeat_at": None,
+            "created_at": now,
+            "updated_at": now,
+            "finished_at": None,
+            "error": None,
+            "result": None,
+        }
+        job["_id"] = self.jobs.insert_one(job).inserted_id
+        self.start(job["_id"])
+        return job
+
+    def get(self, job_id: ObjectId) -> dict|None:
+        return self.jobs.find_one({"_id": job_id})
+
+    def list(self, limit: int = 50) -> list[dict]:
+        return list(self.jobs.find().sort("_id", -1).limit(limit))
+
+    def cancel(self, job_id: ObjectId) -> dict|None:
+        """
+        Cancel a pending or running job, its runner stops at the end of current batch.
+        None when job is missing or over.
+        """
+        return self.jobs.find_one_and_update(
+            {"_id": job_id, "status": {"$in": ACTIVE}},
+            {"$set": {"status": JobStatus.CANCELLED.value, "finished_at": doNow(), "updated_at": doNow()}},
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def resume(self, job_id: ObjectId) -> dict|None:
+        """
+        Restart a cancelled or failed job after its last processed batch.
+        None when job is missing or not resumable.
+        """
+        job = self.jobs.find_one_and_update(
+            {"_id": job_id, "status": {"$in": [JobStatus.CANCELLED.value, JobStatus.FAILED.value]}},
+            {"$set": {"status": JobStatus.PENDING.value, "owner": None, "finished_at": None, "error": None, "updated_at": doNow()}},
+            return_document=ReturnDocument.AFTER,
+        )
+        job is not None and self.start(job_id)
+        return job
+
+    ### Runner #
+    def start(self, job_id: ObjectId):
+        with self.lock:
+            thread = self.threads.get(job_id)
+            if thread is not None and thread.is_alive():
+                return
+            thread = threading.Thread(target=self.doRun, args=(job_id,), name=f'job-{job_id}', daemon=True)
+            self.threads[job_id] = thread
+        thread.start()
+
+    def resumeAll(self):
+        """
+        Start active jobs without a live owner: run at warmup, then every lease period
+        (jobs of a stopped worker are taken over).
+        """
+        expired = doNow() - timedelta(seconds=self.lease_s)
+        for job in self.jobs.find({"status": {"$in": ACTIVE}}, {"owner": 1, "heartbeat_at": 1}):
+            heartbeat = job.get("heartbeat_at")
+            if job.get("owner") in (None, self.owner) or heartbeat is None or heartbeat < expired:
+                self.start(job["_id"])
+        if self.sweeper is None:
+            self.sweeper = threading.Thread(target=self.doSweep, name='jobs-sweeper', daemon=True)
+            self.sweeper.start()
+
+    def doSweep(self):
+        while not self.stopping.wait(self.lease_s):
+            try:
+                self.resumeAll()
+            except Exception:
+                logging.exception('Jobs sweep failed')
+
+    def doClaim(self, job_id: ObjectId) -> dict|None:
+        """
+        Take the lease of an active job: free, already ours, or expired.
+        """
+        now = doNow()
+        return self.jobs.find_one_and_update(
+            {
+                "_id": job_id,
+                "status": {"$in": ACTIVE},
+                "$or": [
+                    {"owner": None},
+                    {"owner": self.owner},
+                    {"heartbeat_at": None},
+                    {"heartbeat_at": {"$lt": now - timedelta(seconds=self.lease_s)}},
+                ],
+            },
+            {"$set": {"status": JobStatus.RUNNING.value, "owner": self.owner, "heartbeat_at": now, "updated_at": now}},
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def doRun(self, job_id: ObjectId):
+        try:
+            job = self.doClaim(job_id)
+            if job is None:
+                return
+            logging.info(msg=f'Job {job_id} started on {job["collection"]} after {job.get("last_id")}')
+            target = self.database[job["collection"]]
+            if job.get("write_concern"):
+                target = target.with_options(write_concern=WriteConcern(**job["write_concern"]))
+            filter, update = json_util.loads(job["filter"]), json_util.loads(job["update"])
+            with self.kinds[job.get("kind", "update")](target, filter, update) as batches:
+                if hasattr(batches, "run"):
+                    job = self.doWhole(job, target, batches)
+                while job is not None and job["status"] == JobStatus.RUNNING.value and not self.stopping.is_set():
+                    job = self.doBatch(job, target, filter, update, batches)
+                    if job is not None and job["status"] == JobStatus.RUNNING.value:
+                        self.stopping.wait(self.throttle_ms / 1000)
+            if job is not None and job["status"] in (JobStatus.DONE.value, JobStatus.CANCELLED.value):
+                for listener in self.listeners:
+                    try:
+                        listener(job)
+                    except Exception:
+                        logging.exception(f'Job {job_id} listener failed')
+        except Exception as e:
+            logging.exception(f'Job {job_id} failed')
+            self.jobs.update_one(
+                {"_id": job_id, "owner": self.owner},
+                {"$set": {"status": JobStatus.FAILED.value, "error": repr(e), "finished_at": doNow(), "updated_at": doNow()}},
+            )
+        finally:
+            with self.lock:
+                self.threads.pop(job_id, None)
+
+    def doBatch(self, job: dict, target: Collection, filter: dict, update: dict, batches: UpdateBatches) -> dict|None:
+        """
+        Update next batch of documents and save progress. Return job as saved (None when lease was lost),
+        its status tells whether to go on (running) or stop (done, cancelled).
+        """
+        start = time.perf_counter()
+        query = {"$and": [filter, {"_id": {"$gt": job["last_id"]}}]} if job["last_id"] is not None else filter
+        l_ids = [doc["_id"] for doc in target.find(query, {"_id": 1}).sort("_id", 1).limit(self.batch_size)]
+        now = doNow()
+        changes = {"$set": {"heartbeat_at": now, "updated_at": now}, "$inc": {}}
+        if l_ids:
+            # filter applied again: documents may have changed since they were listed
+            matched, modified = batches.apply({"$and": [filter, {"_id": {"$in": l_ids}}]})
+            doInvalidate(target)
+            changes["$set"]["last_id"] = l_ids[-1]
+            changes["$inc"] = {"processed": len(l_ids), "matched": matched, "modified": modified}
+        if len(l_ids) < self.batch_size:
+            if job["upsert"] and job["matched"] + changes["$inc"].get("matched", 0) == 0:
+                result = target.update_one(filter, update, upsert=True)
+                doInvalidate(target)
+                changes["$set"]["upserted_id"] = result.upserted_id
+            changes["$set"].update({"status": JobStatus.DONE.value, "finished_at": now})
+        changes["$inc"]["elapsed_s"] = time.perf_counter() - start + self.throttle_ms / 1000
+        # progress is saved even when job was cancelled meanwhile (status is then returned as is),
+        # a lost lease (owner changed) returns None: both stop the runner
+        query = {"_id": job["_id"], "owner": self.owner}
+        if "status" in changes["$set"]:
+            query["status"] = JobStatus.RUNNING.value
+        return self.jobs.find_one_and_update(query, changes, return_document=ReturnDocument.AFTER)
+
+    def doWhole(self, job: dict, target: Collection, batches) -> dict|None:
+        """
+        Run a job kind with a run(progress) method in one call. progress(processed, matched, modified)
+        saves counts and heartbeat, and raises JobStopped once the job is cancelled, its lease lost
+        or the worker stopping. Return job as saved (None when lease was lost).
+        """
+        start = time.perf_counter()
+
+        def doProgress(processed: int, matched: int, modified: int):
+            now = doNow()
+            saved = self.jobs.find_one_and_update(
+                {"_id": job["_id"], "owner": self.owner},
+                {"$set": {"processed": processed, "matched": matched, "modified": modified, "elapsed_s": time.perf_counter() - start, "heartbeat_at": now, "updated_at": now}},
+                return_document=ReturnDocument.AFTER,
+            )
+            if saved is None or saved["status"] != JobStatus.RUNNING.value or self.stopping.is_set():
+                raise JobStopped()
+
+        try:
+            result = batches.run(doProgress)
+        except JobStopped:
+            return self.jobs.find_one({"_id": job["_id"], "owner": self.owner})
+        finally:
+            doInvalidate(target)
+        now = doNow()
+        return self.jobs.find_one_and_update(
+            {"_id": job["_id"], "owner": self.owner, "status": JobStatus.RUNNING.value},
+            {"$set": {"status": JobStatus.DONE.value, "result": result, "elapsed_s": time.perf_counter() - start, "heartbeat_at": now, "updated_at": now, "finished_at": now}},
+            return_document=ReturnDocument.AFTER,
+        )
+
+    @staticmethod
+    def doCount(coll: Collection, filter: dict) -> int:
+        """
+        Documents to process, estimated count of collection when counting takes too long.
+        """
+        try:
+            return coll.count_documents(filter, maxTimeMS=5000)
+        except ExecutionTimeout:
+            return coll.estimated_document_count()
+
+    def shutdown(self):
+        """
+        Stop runners after their current batch and release their leases, so that another
+        worker (or the next start) resumes them at once.
+        """
+        self.stopping.set()
+        for thread in list(self.threads.values()):
+            thread.join(timeout=5)
+        try:
+            self.jobs.update_many({"owner": self.owner, "status": {"$in": ACTIVE}}, {"$set": {"owner": None}})
+        except Exception:
+            logging.exception('Jobs lease release failed')
@@ -0,0 +1,218 @@
+import os
+import threading
+import bson
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    REGISTRY,
+)
+from prometheus_client import multiprocess
+from pymongo import monitoring
+
+from ..profiling.trace import TRACE
+
+"""
+METRICS -
+Prometheus metrics of the api, exposed on /metrics.
+With several gunicorn workers, set PROMETHEUS_MULTIPROC_DIR to an empty directory
+so that every worker writes its values there and /metrics aggregates them.
+"""
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+### HTTP #
+HTTP_REQUESTS = Counter(
+    'http_requests_total', 'Requests count by route template.',
+    ['method', 'route', 'status'],
+)
+HTTP_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Request latency by route template.',
+    ['method', 'route'], buckets=LATENCY_BUCKETS,
+)
+HTTP_RESPONSE_SIZE = Histogram(
+    'http_response_size_bytes', 'Response body size by route template.',
+    ['method', 'route'], buckets=SIZE_BUCKETS,
+)
+HTTP_IN_PROGRESS = Gauge(
+    'http_requests_in_progress', 'Requests being processed.',
+    ['method'], multiprocess_mode='livesum',
+)
+
+### Bulkheads #
+BULKHEAD_QUEUE_WAIT = Histogram(
+    'bulkhead_queue_wait_seconds', 'Time spent waiting for a slot by route class.',
+    ['route_class'], buckets=LATENCY_BUCKETS,
+)
+BULKHEAD_REJECTED = Counter(
+    'bulkhead_rejected_total', 'Requests rejected with 503 by route class and reason (queue_full|timeout).',
+    ['route_class', 'reason'],
+)
+BULKHEAD_ACTIVE = Gauge(
+    'bulkhead_active_requests', 'Requests holding a slot by route class.',
+    ['route_class'], multiprocess_mode='livesum',
+)
+BULKHEAD_QUEUED = Gauge(
+    'bulkhead_queued_requests', 'Requests waiting for a slot by route class.',
+    ['route_class'], multiprocess_mode='livesum',
+)
+
+### Coalescing #
+COALESCED_REQUESTS = Counter(
+    'coalesced_requests_total', 'Identical concurrent read requests by route and role: leader runs the query, follower reuses its response.',
+    ['route', 'role'],
+)
+
+### Caches #
+CACHE_REQUESTS = Counter(
+    'cache_requests_total', 'Cache lookups by result (hit|stale|miss), hit ratio = (hit + stale) / (hit + stale + miss).',
+    ['cache', 'result'],
+)
+CACHE_SIZE_BYTES = Gauge(
+    'cache_size_bytes', 'In-process cache size.',
+    ['cache'], multiprocess_mode='livesum',
+)
+CACHE_EVICTIONS = Counter(
+    'cache_evictions_total', 'Entries evicted to stay under cache max size.',
+    ['cache'],
+)
+
+### Write-behind #
+WRITE_BEHIND_OPERATIONS = Counter(
+    'write_behind_operations_total', 'Queued updates by result: queued, merged (into a pending one), written, failed, bypassed (queue full).',
+    ['result'],
+)
+WRITE_BEHIND_PENDING = Gauge(
+    'write_behind_pending_updates', 'Updates waiting for next flush.',
+    multiprocess_mode='livesum',
+)
+WRITE_BEHIND_FLUSH = Histogram(
+    'write_behind_flush_duration_seconds', 'Duration of one flush (bulk_write of pending updates).',
+    buckets=LATENCY_BUCKETS,
+)
+
+### Mongo #
+MONGO_LATENCY = Histogram(
+    'mongo_command_duration_seconds', 'Mongo command latency by collection and command.',
+    ['collection', 'command'], buckets=LATENCY_BUCKETS,
+)
+MONGO_FAILURES = Counter(
+    'mongo_command_failures_total', 'Failed Mongo commands by collection and command.',
+    ['collection', 'command'],
+)
+MONGO_POOL_CHECKED_OUT = Gauge(
+    'mongo_pool_checked_out_connections', 'Connections in use by address.',
+    ['address'], multiprocess_mode='livesum',
+)
+MONGO_POOL_OPEN = Gauge(
+    'mongo_pool_open_connections', 'Open connections by address.',
+    ['address'], multiprocess_mode='livesum',
+)
+MONGO_POOL_CHECKOUT_FAILURES = Counter(
+    'mongo_pool_checkout_failures_total', 'Connection checkout failures by reason.',
+    ['reason'],
+)
+
+
+def doCountCache(cache: str, hit: bool, stale: bool = False):
+    CACHE_REQUESTS.labels(cache, 'stale' if stale else 'hit' if hit else 'miss').inc()
+
+
+def doGenerateMetrics() -> tuple[bytes, str]:
+    """
+    Return (payload, content_type) for /metrics.
+    """
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """
+    Record latency of each Mongo command by collection and command name.
+    Collection name is read on started event and matched with request_id on completion.
+    """
+    # commands whose first field is not a collection name
+    NO_COLLECTION = {'ping', 'hello', 'isMaster', 'ismaster', 'endSessions', 'buildInfo'}
+
+    def __init__(self):
+        self.pending: dict[int, str] = {}
+        self.lock = threading.Lock()
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        name = event.command.get(event.command_name)
+        collection = name if isinstance(name, str) and event.command_name not in self.NO_COLLECTION else '-'
+        with self.lock:
+            self.pending[event.request_id] = collection
+
+    def doPop(self, event) -> str:
+        with self.lock:
+            return self.pending.pop(event.request_id, '-')
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent):
+        collection = self.doPop(event)
+        MONGO_LATENCY.labels(collection, event.command_name).observe(event.duration_micros / 1e6)
+        # request Server-Timing (listener runs in the thread of the request)
+        trace = TRACE.get()
+        if trace is not None:
+            trace.add('mongo', event.duration_micros / 1e6)
+            trace.mongo_count += 1
+            # replies are encoded again to be measured: profiled requests only, not on the hot path
+            if trace.profile:
+                trace.mongo_bytes += len(bson.encode(event.reply))
+
+    def failed(self, event: monitoring.CommandFailedEvent):
+        collection = self.doPop(event)
+        MONGO_LATENCY.labels(collection, event.command_name).observe(event.duration_micros / 1e6)
+        MONGO_FAILURES.labels(collection, event.command_name).inc()
+        trace = TRACE.get()
+        if trace is not None:
+            trace.add('mongo', event.duration_micros / 1e6)
+            trace.mongo_count += 1
+
+
+class MongoPoolListener(monitoring.ConnectionPoolListener):
+    """
+    Track connection pool usage by server address.
+    """
+    def doAddress(self, event) -> str:
+        return f'{event.address[0]}:{event.address[1]}'
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        MONGO_POOL_OPEN.labels(self.doAddress(event)).inc()
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        MONGO_POOL_OPEN.labels(self.doAddress(event)).dec()
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        MONGO_POOL_CHECKOUT_FAILURES.labels(str(event.reason)).inc()
+
+    def connection_checked_out(self, event):
+        MONGO_POOL_CHECKED_OUT.labels(self.doAddress(event)).inc()
+
+    def connection_checked_in(self, event):
+        MONGO_POOL_CHECKED_OUT.labels(self.doAddress(event)).dec()
@@ -0,0 +1,224 @@
+import json
+import logging
+import threading
+from datetime import datetime, timezone
+
+import bson
+from pymongo import DeleteMany, ReplaceOne
+from pymongo.collection import Collection
+from pymongo.database import Database
+
+from ...config import CHOROPLETH_FULL_REFRESH_S, CHOROPLETH_REFRESH_MS
+from ...database.query import doAggregateRaw, doInvalidate
+from ...middleware.cursor_middleware import doJsonDefault, orjson
+from ...middleware.guardrails import Guard
+from ..grades.grades import LATEST_GRADE
+from .geospatial import GeoIndex
+
+"""
+CHOROPLETH -
+Materialized statistics of restaurants by neighborhood and by borough (count, cuisine mix, grade
+distribution and average score of their latest inspection), stored in the "choropleth" collection
+and served by /neighborhood/stats and /borough/stats.
+    * restaurants are grouped by their spatial join tags (neighborhood, borough_geo, see spatial_join.py).
+    * write routes mark the neighborhoods and boroughs they change as dirty: a background thread
+      recomputes only dirty ones, at most every CHOROPLETH_REFRESH_MS. Changes of unknown scope (jobs,
+      imports, moved restaurants) mark every one of them, as does CHOROPLETH_FULL_REFRESH_S.
+    * each worker refreshes the changes it made, results are shared through the collection.
+"""
+
+# level > restaurants tag field, polygons collection
+LEVELS = {"neighborhood": "neighborhood", "borough": "borough_geo"}
+POLYGONS = {"neighborhood": "neighborhoods", "borough": "boroughs"}
+TAGS_PROJECTION = {"_id": 0, "neighborhood": 1, "borough_geo": 1}
+
+
+def doDumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, default=doJsonDefault)
+    return json.dumps(obj, default=doJsonDefault, separators=(',', ':')).encode()
+
+
+class ChoroplethStats():
+    """
+    Materialized stats of one api worker: dirty names by level, refresh thread and pre-serialized geometries.
+    """
+    def __init__(self, database: Database, refresh_ms: int = CHOROPLETH_REFRESH_MS, full_refresh_s: int = CHOROPLETH_FULL_REFRESH_S):
+        self.database = database
+        self.restaurants: Collection = database["restaurants"]
+        self.coll: Collection = database["choropleth"]
+        self.refresh_ms = refresh_ms
+        self.full_refresh_s = full_refresh_s
+        self.dirty: dict[str, set[str]] = {level: set() for level in LEVELS}
+        self.dirty_ids: set[str] = set()
+        self.dirty_all = False
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.thread: threading.Thread = None
+        # level > (polygons docs the geometries were serialized from, name > geometry json)
+        self.geometries: dict[str, tuple[list, dict[str, bytes]]] = {}
+
+    ### Changes #
+    def touch(self, restaurant: dict|None):
+        """
+        Mark neighborhood and borough of a restaurant (document with its tags) as dirty.
+        """
+        if not restaurant:
+            return
+        with self.lock:
+            for level, field in LEVELS.items():
+                restaurant.get(field) and self.dirty[level].add(restaurant[field])
+
+    def touchRestaurant(self, restaurant_id: str):
+        """
+        Restaurant changed by a deferred write (write-behind): its tags are read at refresh time.
+        """
+        with self.lock:
+            self.dirty_ids.add(restaurant_id)
+
+    def touchAll(self):
+        with self.lock:
+            self.dirty_all = True
+
+    ### Refresh #
+    def start(self):
+        self.thread = threading.Thread(target=self.doLoop, name='choropleth', daemon=True)
+        self.thread.start()
+
+    def doLoop(self):
+        waited = 0
+        while not self.stopping.wait(self.refresh_ms / 1000):
+            waited += self.refresh_ms / 1000
+            if self.full_refresh_s and waited >= self.full_refresh_s:
+                waited = 0
+                self.touchAll()
+            try:
+                self.refresh()
+            except Exception:
+                logging.exception('Choropleth refresh failed')
+
+    def refresh(self):
+        """
+        Recompute dirty neighborhoods and boroughs (all of them after touchAll).
+        """
+        with self.lock:
+            dirty, dirty_ids, dirty_all = self.dirty, self.dirty_ids, self.dirty_all
+            self.dirty, self.dirty_ids, self.dirty_all = {level: set() for level in LEVELS}, set(), False
+        try:
+            if dirty_ids and not dirty_all:
+                for restaurant in self.restaurants.find({"restaurant_id": {"$in": list(dirty_ids)}}, TAGS_PROJECTION):
+                    for level, field in LEVELS.items():
+                        restaurant.get(field) and dirty[level].add(restaurant[field])
+            for level in LEVELS:
+                if dirty_all:
+                    self.doRefreshLevel(level, None)
+                elif dirty[level]:
+                    self.doRefreshLevel(level, dirty[level])
+        except Exception:
+            # marked again: retried at next refresh
+            with self.lock:
+                self.dirty_all = self.dirty_all or dirty_all
+                self.dirty_ids |= dirty_ids
+                for level in LEVELS:
+                    self.dirty[level] |= dirty[level]
+            raise
+
+    def refreshIfEmpty(self):
+        """
+        Warmup: first computation of stats, once for every worker.
+        """
+        if self.coll.estimated_document_count() == 0:
+            self.touchAll()
+            self.refresh()
+
+    def doRefreshLevel(self, level: str, names: set[str]|None):
+        """
+        Recompute stats of names of one level, every name when None. Names without restaurants are removed.
+        """
+        field = LEVELS[level]
+        match = {field: {"$in": sorted(names)}} if names is not None else {field: {"$ne": None}}
+        pipeline = [
+            {"$match": match},
+            {"$project": {"_id": 0, "name": f"${field}", "cuisine": 1, "latest": LATEST_GRADE}},
+            {
+                "$group": {
+                    "_id": {"name": "$name", "cuisine": "$cuisine", "grade": "$latest.grade"},
+                    "count": {"$sum": 1},
+                    "score_sum": {"$sum": "$latest.score"},
+                    "scored": {"$sum": {"$cond": [{"$gt": ["$latest.score", None]}, 1, 0]}},
+                }
+            },
+        ]
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        l_stats: dict[str, dict] = {}
+        for group in self.restaurants.aggregate(pipeline, allowDiskUse=True):
+            key = group["_id"]
+            stats = l_stats.setdefault(key["name"], {"count": 0, "cuisines": {}, "grades": {}, "score_sum": 0, "scored": 0})
+            stats["count"] += group["count"]
+            stats["score_sum"] += group["score_sum"]
+            stats["scored"] += group["scored"]
+            cuisine, grade = key.get("cuisine") or "Unknown", key.get("grade") or "Not graded"
+            stats["cuisines"][cuisine] = stats["cuisines"].get(cuisine, 0) + group["count"]
+            stats["grades"][grade] = stats["grades"].get(grade, 0) + group["count"]
+        l_ops = []
+        for name, stats in l_stats.items():
+            l_ops.append(ReplaceOne(
+                {"_id": f"{level}:{name}"},
+                {
+                    "level": level,
+                    "name": name,
+                    "count": stats["count"],
+                    "avg_score": round(stats["score_sum"] / stats["scored"], 2) if stats["scored"] else None,
+                    # cuisine mix: most frequent first
+                    "cuisines": dict(sorted(stats["cuisines"].items(), key=lambda item: -item[1])),
+                    "grades": dict(sorted(stats["grades"].items())),
+                    "updated_at": now,
+                },
+                upsert=True,
+            ))
+        gone = {"level": level, "name": {"$nin": list(l_stats)}}
+        if names is not None:
+            gone["name"]["$in"] = sorted(names)
+        l_ops.append(DeleteMany(gone))
+        self.coll.bulk_write(l_ops, ordered=False)
+        doInvalidate(self.coll)
+
+    ### Read #
+    def doRaw(self, level: str, guard: Guard) -> bytes:
+        """
+        Stats documents of a level sorted by name, as concatenated BSON (cached like route pipelines).
+        """
+        return doAggregateRaw(self.coll, [{"$match": {"level": level}}, {"$project": {"_id": 0, "level": 0}}, {"$sort": {"name": 1}}], guard)
+
+    ### Geometries #
+    def doGeometries(self, level: str, index: GeoIndex) -> dict[str, bytes]:
+        """
+        GeoJSON geometries of a level serialized once, from its in-memory geo index
+        (serialized again when the index is rebuilt, read from Mongo for each call until it is built).
+        """
+        if not index.ready:
+            return self.doSerialize(self.database[POLYGONS[level]].find({}, {"_id": 0, "name": 1, "geometry": 1}))
+        docs, geometries = self.geometries.get(level, (None, None))
+        if docs is not index.docs:
+            geometries = self.doSerialize(index.docs)
+            self.geometries[level] = (index.docs, geometries)
+        return geometries
+
+    @staticmethod
+    def doSerialize(docs) -> dict[str, bytes]:
+        return {doc["name"]: doDumps({k: v for k, v in doc["geometry"].items() if k != "centroid"}) for doc in docs if doc.get("name") and doc.get("geometry")}
+
+    def doFeatureCollection(self, level: str, index: GeoIndex, raw: bytes) -> bytes:
+        """
+        GeoJSON FeatureCollection of stats documents (concatenated BSON), with pre-serialized geometries.
+        Names without polygon get a null geometry.
+        """
+        geometries = self.doGeometries(level, index)
+        l_features = [
+            b'{"type":"Feature","properties":' + doDumps(stats) + b',"geometry":' + geometries.get(stats["name"], b'null') + b'}'
+            for stats in bson.decode_all(raw)
+        ]
+        return b'{"type":"FeatureCollection","features":[' + b','.join(l_features) + b']}'
+
+    def shutdown(self):
+        self.stopping.set()
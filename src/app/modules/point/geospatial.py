@@ -1,4 +1,15 @@
+import gc
+import logging
+import threading
+from fastapi import HTTPException
+from pymongo import MongoClient
 from pymongo.collection import Collection
+from pymongo.database import Database
+
+from ...config import GEO_INDEX_CHECK_S
+
+# polygons collection name > generation, incremented when their geometry or name change
+GEO_GENERATIONS = "geo_generations"
 
 
 # def doCreate2dSphere(coll: Collection, field: str, name: str):
@@ -8,3 +19,213 @@ from pymongo.collection import Collection
 
 # def doGetNeighborhood():
 #     pass
+
+
+def doBuildBox(min_lon: float, min_lat: float, max_lon: float, max_lat: float) -> dict:
+    """
+    Build a GeoJSON Polygon from bounding box corners.
+    $geoWithin with a $geometry Polygon is supported by the 2dsphere index
+    (legacy $box operator is only indexed by 2d indexes).
+
+    @return {type: Polygon, coordinates: [[[lon,lat] * 5]]}
+    """
+    if min_lon >= max_lon or min_lat >= max_lat:
+        raise HTTPException(
+            status_code=422,
+            detail={"valueError": "Min values should be lower than max values.", "field": "bbox", "value": [min_lon, min_lat, max_lon, max_lat]},
+        )
+    return {
+        "type": "Polygon",
+        "coordinates": [
+            [
+                [min_lon, min_lat],
+                [max_lon, min_lat],
+                [max_lon, max_lat],
+                [min_lon, max_lat],
+                [min_lon, min_lat],
+            ]
+        ],
+    }
+
+
+def doContainPoint(geometry: dict, lon: float, lat: float) -> bool:
+    """
+    Point in polygon (ray casting) for GeoJSON Polygon and MultiPolygon geometries.
+    Holes (inner rings) are excluded.
+    """
+    if geometry["type"] == "Polygon":
+        polygons = [geometry["coordinates"]]
+    elif geometry["type"] == "MultiPolygon":
+        polygons = geometry["coordinates"]
+    else:
+        return False
+    for rings in polygons:
+        if rings and doContainInRing(rings[0], lon, lat) and not any(
+            doContainInRing(hole, lon, lat) for hole in rings[1:]
+        ):
+            return True
+    return False
+
+
+def doContainInRing(ring: list, lon: float, lat: float) -> bool:
+    inside = False
+    j = len(ring) - 1
+    for i in range(len(ring)):
+        xi, yi = ring[i][0], ring[i][1]
+        xj, yj = ring[j][0], ring[j][1]
+        if (yi > lat) != (yj > lat) and lon < (xj - xi) * (lat - yi) / (yj - yi) + xi:
+            inside = not inside
+        j = i
+    return inside
+
+
+def doGetBounds(geometry: dict) -> tuple[float, float, float, float]:
+    """
+    Bounding box of a Polygon|MultiPolygon: (min_lon, min_lat, max_lon, max_lat).
+    """
+    rings = geometry["coordinates"] if geometry["type"] == "Polygon" else [r for p in geometry["coordinates"] for r in p]
+    lons = [pt[0] for ring in rings for pt in ring]
+    lats = [pt[1] for ring in rings for pt in ring]
+    return min(lons), min(lats), max(lons), max(lats)
+
+
+def doGeoChanged(changes: dict) -> bool:
+    """
+    True when $set changes of a polygon document modify its geometry or name (indexed fields).
+    """
+    return any(key.split(".")[0] in ("geometry", "name") for key in changes)
+
+
+class GeoIndex():
+    """
+    In-memory grid index of polygons (boroughs, neighborhoods) for fast point lookups
+    without a Mongo round trip. Built at warmup, built again when polygons change: by the worker
+    changing them (reload), by other workers when the generation of the collection moves (GeoIndexWatcher).
+
+    Each grid cell of <cell_size> degrees references the polygons whose bounding box overlaps it.
+    """
+    def __init__(self, name: str, cell_size: float = 0.01):
+        self.name = name
+        self.cell_size = cell_size
+        self.docs: list[dict] = []
+        self.bounds: list[tuple] = []
+        self.grid: dict[tuple[int, int], list[int]] = {}
+        # (docs, bounds, grid) swapped at once: lookups running during a rebuild see one build or the other
+        self.snapshot: tuple[list, list, dict] = ([], [], {})
+        self.generation = 0
+        self.ready = False
+
+    def doCell(self, lon: float, lat: float) -> tuple[int, int]:
+        return int(lon // self.cell_size), int(lat // self.cell_size)
+
+    def build(self, docs: list[dict]):
+        """
+        Index is ready only with polygons: an empty collection (boroughs not created yet on a fresh
+        database) is loaded again by worker warmup, queries go to Mongo meanwhile.
+
+        @param docs: documents with a GeoJSON "geometry" field (_id is dropped).
+        """
+        grid: dict[tuple[int, int], list[int]] = {}
+        l_docs, l_bounds = [], []
+        for doc in docs:
+            geometry = doc.get("geometry")
+            if not geometry or geometry.get("type") not in ("Polygon", "MultiPolygon"):
+                continue
+            doc = {k: v for k, v in doc.items() if k != "_id"}
+            bounds = doGetBounds(geometry)
+            idx = len(l_docs)
+            l_docs.append(doc)
+            l_bounds.append(bounds)
+            (x0, y0), (x1, y1) = self.doCell(bounds[0], bounds[1]), self.doCell(bounds[2], bounds[3])
+            for x in range(x0, x1 + 1):
+                for y in range(y0, y1 + 1):
+                    grid.setdefault((x, y), []).append(idx)
+        self.snapshot = (l_docs, l_bounds, grid)
+        self.docs, self.bounds, self.grid = self.snapshot
+        self.ready = bool(l_docs)
+
+    def load(self, coll: Collection):
+        # generation read first: a change made during the load is loaded again at next check
+        generation = doGeneration(coll.database, self.name)
+        self.build(coll.find({}, {"_id": 0}))
+        self.generation = generation
+
+    def reload(self, coll: Collection):
+        """
+        Polygons changed by this worker: new generation for other workers, and index built again.
+        """
+        coll.database[GEO_GENERATIONS].update_one({"_id": self.name}, {"$inc": {"generation": 1}}, upsert=True)
+        self.load(coll)
+
+    def locate(self, lon: float, lat: float) -> dict|None:
+        """
+        Return the first polygon document containing point, None if outside every polygon.
+        """
+        docs, bounds, grid = self.snapshot
+        for idx in grid.get(self.doCell(lon, lat), ()):
+            min_lon, min_lat, max_lon, max_lat = bounds[idx]
+            if min_lon <= lon <= max_lon and min_lat <= lat <= max_lat and doContainPoint(docs[idx]["geometry"], lon, lat):
+                return docs[idx]
+        return None
+
+
+def doGeneration(database: Database, name: str) -> int:
+    doc = database[GEO_GENERATIONS].find_one({"_id": name})
+    return doc["generation"] if doc else 0
+
+
+class GeoIndexWatcher():
+    """
+    Per worker thread loading again indexes whose polygons were changed by another worker
+    (generation in the geo_generations collection), every GEO_INDEX_CHECK_S.
+    """
+    def __init__(self, database: Database, indexes: dict[str, GeoIndex], check_s: int = GEO_INDEX_CHECK_S):
+        self.database = database
+        self.indexes = indexes
+        self.check_s = check_s
+        self.stopping = threading.Event()
+        self.thread: threading.Thread = None
+
+    def start(self):
+        if self.check_s:
+            self.thread = threading.Thread(target=self.doLoop, name='geo-index-watcher', daemon=True)
+            self.thread.start()
+
+    def doLoop(self):
+        while not self.stopping.wait(self.check_s):
+            try:
+                self.check()
+            except Exception:
+                logging.exception('Geo index check failed')
+
+    def check(self):
+        generations = {doc["_id"]: doc["generation"] for doc in self.database[GEO_GENERATIONS].find({"_id": {"$in": list(self.indexes)}})}
+        for name, index in self.indexes.items():
+            if generations.get(name, 0) != index.generation:
+                index.load(self.database[name])
+                logging.info(msg=f'Geo index {name} loaded again (generation {index.generation}).')
+
+    def shutdown(self):
+        self.stopping.set()
+
+
+# Process wide indexes: built once in gunicorn master before fork (see doPreloadGeoIndexes),
+# then shared copy-on-write by every worker.
+GEO_INDEXES = {
+    "boroughs": GeoIndex("boroughs"),
+    "neighborhoods": GeoIndex("neighborhoods"),
+}
+
+
+def doPreloadGeoIndexes(mongo_uri: str, db_name: str):
+    """
+    Build GEO_INDEXES in current process with a short lived client (pymongo clients are not fork-safe),
+    then freeze gc tracking so that forked workers don't write to (and copy) these pages on collection.
+    """
+    client = MongoClient(mongo_uri, serverSelectionTimeoutMS=10000)
+    try:
+        for name, index in GEO_INDEXES.items():
+            index.load(client[db_name][name])
+    finally:
+        client.close()
+    gc.freeze()
@@ -0,0 +1,123 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from pymongo import UpdateOne
+from pymongo.collection import Collection
+
+from ...config import SPATIAL_JOIN_PROCESSES
+from ...database.query import doLocate
+from ...middleware.guardrails import Guard
+from .geospatial import GeoIndex
+
+"""
+SPATIAL_JOIN -
+Restaurants are tagged with the name of the neighborhood and of the borough polygons containing their
+address.coord ("neighborhood", "borough_geo", null outside of every polygon), so that "Italian restaurants
+in Williamsburg" is an indexed equality filter instead of a polygon fetch followed by a $geoWithin query.
+    * the whole collection is tagged by a "spatial_join" job (modules/jobs/jobs.py): the points of each
+      batch are split between a process pool whose processes hold both polygon grids (GeoIndex), and
+      only changed tags are written, by one unordered bulk_write per batch.
+    * created and updated restaurants are tagged by their route (in-memory geo indexes),
+      imported ones by a spatial_join job on untagged restaurants started after the import.
+"""
+
+TAG_FIELDS = ("neighborhood", "borough_geo")
+# polygon grids of a pool process, built once by doInitWorker
+WORKER_INDEXES: dict[str, GeoIndex] = {}
+
+
+def doCoord(address: dict|None) -> tuple[float, float]|None:
+    coord = address.get("coord") if isinstance(address, dict) else None
+    if isinstance(coord, (list, tuple)) and len(coord) == 2 and all(isinstance(v, (int, float)) for v in coord):
+        return coord[0], coord[1]
+    return None
+
+
+def doTags(neighborhood: dict|None, borough: dict|None) -> dict:
+    return {
+        "neighborhood": neighborhood.get("name") if neighborhood else None,
+        "borough_geo": borough.get("name") if borough else None,
+    }
+
+
+def doChangedAddress(changes: dict) -> dict|None:
+    """
+    Address set by $set changes ({"coord": ...} for "address.coord"), None when coord is left unchanged.
+    """
+    if "address.coord" in changes:
+        return {"coord": changes["address.coord"]}
+    if "address" in changes:
+        return changes["address"] if isinstance(changes["address"], dict) else {}
+    return None
+
+
+def doRestaurantTags(app, address: dict|None, guard: Guard) -> dict:
+    """
+    Tags of one restaurant, for create and update routes: in-memory geo indexes, $geoIntersects queries until they are built.
+    """
+    coord = doCoord(address)
+    if coord is None:
+        return doTags(None, None)
+    point = {"type": "Point", "coordinates": list(coord)}
+    return doTags(
+        doLocate(app.db_neighborhoods, app.geo_neighborhoods, point, guard),
+        doLocate(app.db_boroughs, app.geo_boroughs, point, guard),
+    )
+
+
+### Pool processes #
+def doInitWorker(neighborhoods: list[dict], boroughs: list[dict]):
+    for name, docs in (("neighborhoods", neighborhoods), ("boroughs", boroughs)):
+        index = GeoIndex(name)
+        index.build(docs)
+        WORKER_INDEXES[name] = index
+
+
+def doTagChunk(coords: list[tuple[float, float]|None]) -> list[dict]:
+    neighborhoods, boroughs = WORKER_INDEXES["neighborhoods"], WORKER_INDEXES["boroughs"]
+    return [doTags(neighborhoods.locate(*coord), boroughs.locate(*coord)) if coord else doTags(None, None) for coord in coords]
+
+
+### Job kind #
+class SpatialJoinBatches():
+    """
+    "spatial_join" job kind (see JobRunner.register): tags restaurants of each batch, job update is unused.
+    Polygons are read once per run of the job and sent to the pool processes at their start.
+    """
+    def __init__(self, target: Collection, filter: dict, update: dict, processes: int = SPATIAL_JOIN_PROCESSES):
+        self.target = target
+        self.processes = processes
+        self.pool: ProcessPoolExecutor = None
+
+    def __enter__(self):
+        database = self.target.database
+        polygons = [list(database[name].find({}, {"_id": 0, "name": 1, "geometry": 1})) for name in ("neighborhoods", "boroughs")]
+        # spawn: web workers and drivers run threads, forking them is unsafe
+        self.pool = ProcessPoolExecutor(
+            max_workers=self.processes,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=doInitWorker,
+            initargs=tuple(polygons),
+        )
+        return self
+
+    def __exit__(self, *exc):
+        self.pool.shutdown(cancel_futures=True)
+        return False
+
+    def apply(self, query: dict) -> tuple[int, int]:
+        l_docs = list(self.target.find(query, {"address.coord": 1, **{field: 1 for field in TAG_FIELDS}}))
+        if not l_docs:
+            return 0, 0
+        coords = [doCoord(doc.get("address")) for doc in l_docs]
+        size = -(-len(coords) // self.processes)
+        l_tags = [tags for chunk in self.pool.map(doTagChunk, [coords[i:i + size] for i in range(0, len(coords), size)]) for tags in chunk]
+        # unchanged tags are not written: a new run on a tagged collection is read only
+        l_ops = [
+            UpdateOne({"_id": doc["_id"]}, {"$set": tags})
+            for doc, tags in zip(l_docs, l_tags)
+            if any(field not in doc or doc[field] != tags[field] for field in TAG_FIELDS)
+        ]
+        if not l_ops:
+            return len(l_docs), 0
+        return len(l_docs), self.target.bulk_write(l_ops, ordered=False).modified_count
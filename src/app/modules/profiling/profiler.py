@@ -0,0 +1,48 @@
+import cProfile
+import os
+import time
+
+from ...config import PROFILE_DIR
+
+"""
+PROFILER -
+Capture a profile of one request endpoint (X-Profile header) into PROFILE_DIR.
+pyinstrument (sampling profiler) is used when installed and writes a speedscope json file
+(open it in https://www.speedscope.app for a flamegraph), otherwise cProfile writes a .prof file
+(readable with snakeviz or flameprof).
+"""
+try:
+    from pyinstrument import Profiler
+    from pyinstrument.renderers import SpeedscopeRenderer
+except ImportError:
+    Profiler = None
+
+
+class ProfileSession():
+    """
+    Profile of current thread between start() and stop().
+    stop() writes the file and returns its path.
+    """
+    def __init__(self, name: str):
+        base = f'{time.strftime("%Y%m%d-%H%M%S")}_{name.strip("/").replace("/", "_") or "root"}'
+        self.base = os.path.join(PROFILE_DIR, base)
+        self.profiler = Profiler(interval=0.0005) if Profiler is not None else cProfile.Profile()
+
+    def start(self):
+        if Profiler is not None:
+            self.profiler.start()
+        else:
+            self.profiler.enable()
+
+    def stop(self) -> str:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        if Profiler is not None:
+            self.profiler.stop()
+            path = f'{self.base}.speedscope.json'
+            with open(path, 'w') as f:
+                f.write(self.profiler.output(renderer=SpeedscopeRenderer()))
+        else:
+            self.profiler.disable()
+            path = f'{self.base}.prof'
+            self.profiler.dump_stats(path)
+        return path
@@ -0,0 +1,72 @@
+import asyncio
+import time
+from functools import wraps
+from typing import Callable
+
+from fastapi import Request, Response
+from fastapi.routing import APIRoute
+
+from .profiler import ProfileSession
+from .trace import TRACE
+
+"""
+TIMED_ROUTE -
+APIRoute class splitting handler time in two Server-Timing phases:
+    endpoint: route function (Filter.make, Mongo round trips, cursor_to_object, ...)
+    response: request parsing, Pydantic response validation and JSON encoding
+Endpoint is profiled in its own thread (threadpool for sync routes) when requested with X-Profile.
+"""
+
+
+def doWrapEndpoint(call: Callable, path: str) -> Callable:
+    if asyncio.iscoroutinefunction(call):
+        @wraps(call)
+        async def async_endpoint(*args, **kwargs):
+            trace = TRACE.get()
+            if trace is None:
+                return await call(*args, **kwargs)
+            session = ProfileSession(path) if trace.profile else None
+            session and session.start()
+            start = time.perf_counter()
+            try:
+                return await call(*args, **kwargs)
+            finally:
+                trace.add('endpoint', time.perf_counter() - start)
+                session and trace.headers.update({'X-Profile-File': session.stop()})
+        return async_endpoint
+
+    @wraps(call)
+    def endpoint(*args, **kwargs):
+        trace = TRACE.get()
+        if trace is None:
+            return call(*args, **kwargs)
+        session = ProfileSession(path) if trace.profile else None
+        session and session.start()
+        start = time.perf_counter()
+        try:
+            return call(*args, **kwargs)
+        finally:
+            trace.add('endpoint', time.perf_counter() - start)
+            session and trace.headers.update({'X-Profile-File': session.stop()})
+    return endpoint
+
+
+class TimedRoute(APIRoute):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # request handler reads dependant.call at each request
+        self.dependant.call = doWrapEndpoint(self.dependant.call, self.path)
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def timed_handler(request: Request) -> Response:
+            trace = TRACE.get()
+            if trace is None:
+                return await handler(request)
+            start = time.perf_counter()
+            response = await handler(request)
+            trace.add('response', time.perf_counter() - start - trace.phases.get('endpoint', 0))
+            return response
+
+        return timed_handler
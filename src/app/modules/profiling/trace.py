@@ -0,0 +1,72 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+"""
+REQUEST TRACE -
+Per request timings shared through a ContextVar: the trace object is created by TimingMiddleware
+and the same instance is seen (and filled) by routes running in threadpool, Filter.make,
+cursor_to_object and the Mongo CommandListener.
+"""
+
+
+class RequestTrace():
+    """
+    phases: {name: seconds} - accumulated if a phase runs several times.
+    mongo_count: number of Mongo round trips.
+    mongo_bytes: size of Mongo replies (BSON bytes), measured for profiled requests only.
+    headers: additionnal response headers set by request processing.
+    profile: capture a profile of the endpoint (X-Profile header).
+    """
+    def __init__(self, profile: bool = False):
+        self.phases: dict[str, float] = {}
+        self.mongo_count = 0
+        self.mongo_bytes = 0
+        self.headers: dict[str, str] = {}
+        self.profile = profile
+
+    def add(self, phase: str, duration: float):
+        self.phases[phase] = self.phases.get(phase, 0) + duration
+
+    def doServerTiming(self, total: float = None) -> str:
+        """
+        Server-Timing header value, durations in ms.
+        """
+        l_metrics = [f'{name};dur={duration * 1000:.2f}' for name, duration in self.phases.items()]
+        l_metrics.append(f'mongo-round-trips;desc="{self.mongo_count}"')
+        self.profile and l_metrics.append(f'mongo-bytes;desc="{self.mongo_bytes}"')
+        total is not None and l_metrics.append(f'total;dur={total * 1000:.2f}')
+        return ', '.join(l_metrics)
+
+
+TRACE: ContextVar[RequestTrace|None] = ContextVar('request_trace', default=None)
+
+
+@contextmanager
+def doTime(phase: str):
+    """
+    Time a block into current request trace (no-op outside of a traced request).
+    """
+    trace = TRACE.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(phase, time.perf_counter() - start)
+
+
+def timed(phase: str):
+    """
+    Decorator version of doTime.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with doTime(phase):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,238 @@
+import logging
+import threading
+from datetime import datetime, timezone
+from enum import Enum
+
+from pymongo import DeleteMany, ReplaceOne
+from pymongo.collection import Collection
+from pymongo.database import Database
+
+from ...config import RANKING_FULL_REFRESH_S, RANKING_REFRESH_MS, RANKING_SIZE
+from ...database.query import doFindOne, doInvalidate
+from ...middleware.guardrails import Guard
+
+"""
+RANKINGS -
+Materialized top restaurants of each bucket, stored in the "rankings" collection and served by /rankings
+with one find_one of K items:
+    * metrics: latest_score and avg_score (lower is better: NYC scores count violation points),
+      grade (best latest grade, most recently inspected first). Read from grades summary fields.
+    * buckets: cuisine (or every cuisine) by borough, by neighborhood (spatial join tag) or city wide.
+      Each bucket keeps its first RANKING_SIZE restaurants, computed by $group with $topN.
+    * write routes mark the restaurants they change: a background thread recomputes, at most every
+      RANKING_REFRESH_MS, the buckets they are ranked in (found in the lists themselves: covers deletes
+      and moves) and the buckets of their current document. City wide buckets (a whole collection or
+      cuisine to rank) are recomputed only when the restaurant would enter them: not full, or ranked
+      before their last entry. Jobs and imports recompute every bucket, as does RANKING_FULL_REFRESH_S.
+"""
+
+class RankingMetric(str, Enum):
+    latest_score = "latest_score"
+    avg_score = "avg_score"
+    grade = "grade"
+
+
+# metric > $topN sortBy: best first, name as tie-breaker
+METRICS = {
+    "latest_score": {"latest_score": 1, "name": 1},
+    "avg_score": {"avg_score": 1, "name": 1},
+    "grade": {"latest_grade": 1, "latest_inspection_date": -1, "name": 1},
+}
+# area level > restaurants field
+LEVELS = {"borough": "borough", "neighborhood": "neighborhood"}
+# buckets: (by cuisine, area level)
+GROUPINGS = [(True, "borough"), (True, "neighborhood"), (True, None), (False, "borough"), (False, "neighborhood"), (False, None)]
+# fields of ranked restaurants
+OUTPUT = ("restaurant_id", "name", "cuisine", "borough", "neighborhood", "address", "latest_grade", "latest_score", "latest_inspection_date", "avg_score", "grade_count")
+
+
+def doBucketId(metric: str, cuisine: str|None, level: str|None, area: str|None) -> str:
+    return f'{metric}|{cuisine or "*"}|{level or "*"}|{area or "*"}'
+
+
+def doRankedBefore(restaurant: dict, other: dict, sort_by: dict) -> bool:
+    """
+    True when restaurant is ranked before other in $topN sortBy order (null values first when ascending, as in Mongo).
+    """
+    for field, way in sort_by.items():
+        a, b = restaurant.get(field), other.get(field)
+        if a == b:
+            continue
+        before = a is None if a is None or b is None else a < b
+        return before if way == 1 else not before
+    return False
+
+
+class Rankings():
+    """
+    Materialized rankings of one api worker: dirty restaurants and refresh thread.
+    """
+    def __init__(self, database: Database, size: int = RANKING_SIZE, refresh_ms: int = RANKING_REFRESH_MS, full_refresh_s: int = RANKING_FULL_REFRESH_S):
+        self.restaurants: Collection = database["restaurants"]
+        self.coll: Collection = database["rankings"]
+        self.size = size
+        self.refresh_ms = refresh_ms
+        self.full_refresh_s = full_refresh_s
+        self.dirty_ids: set[str] = set()
+        self.dirty_all = False
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.thread: threading.Thread = None
+
+    ### Changes #
+    def touchRestaurant(self, restaurant_id: str):
+        """
+        Restaurant created, changed or deleted: its buckets are read at refresh time.
+        """
+        with self.lock:
+            self.dirty_ids.add(restaurant_id)
+
+    def touchAll(self):
+        with self.lock:
+            self.dirty_all = True
+
+    ### Refresh #
+    def start(self):
+        self.thread = threading.Thread(target=self.doLoop, name='rankings', daemon=True)
+        self.thread.start()
+
+    def doLoop(self):
+        waited = 0
+        while not self.stopping.wait(self.refresh_ms / 1000):
+            waited += self.refresh_ms / 1000
+            if self.full_refresh_s and waited >= self.full_refresh_s:
+                waited = 0
+                self.touchAll()
+            try:
+                self.refresh()
+            except Exception:
+                logging.exception('Rankings refresh failed')
+
+    def refresh(self):
+        """
+        Recompute buckets of dirty restaurants (every bucket after touchAll).
+        """
+        with self.lock:
+            dirty_ids, dirty_all = self.dirty_ids, self.dirty_all
+            self.dirty_ids, self.dirty_all = set(), False
+        try:
+            if dirty_all:
+                for grouping in GROUPINGS:
+                    self.doRefreshGrouping(grouping, None)
+            elif dirty_ids:
+                keys = self.doDirtyKeys(list(dirty_ids))
+                for grouping in GROUPINGS:
+                    l_keys = {key for key in keys if (key[0] is not None, key[1]) == grouping}
+                    l_keys and self.doRefreshGrouping(grouping, l_keys)
+        except Exception:
+            # marked again: retried at next refresh
+            with self.lock:
+                self.dirty_all = self.dirty_all or dirty_all
+                self.dirty_ids |= dirty_ids
+            raise
+
+    def refreshIfEmpty(self):
+        """
+        Warmup: index of ranked restaurant ids, and first computation of rankings, once for every worker.
+        """
+        self.coll.create_index("restaurants.restaurant_id", name="restaurant_id")
+        if self.coll.estimated_document_count() == 0:
+            self.touchAll()
+            self.refresh()
+
+    def doDirtyKeys(self, restaurant_ids: list[str]) -> set[tuple]:
+        """
+        (cuisine, level, area) of buckets ranking these restaurants, and of buckets of their current documents
+        (city wide ones only when the restaurant enters them).
+        """
+        keys = {(doc.get("cuisine"), doc.get("level"), doc.get("area")) for doc in self.coll.find(
+            {"restaurants.restaurant_id": {"$in": restaurant_ids}}, {"_id": 0, "cuisine": 1, "level": 1, "area": 1}
+        )}
+        l_docs = list(self.restaurants.find(
+            {"restaurant_id": {"$in": restaurant_ids}},
+            {"_id": 0, "cuisine": 1, **{field: 1 for field in LEVELS.values()}, **{field: 1 for sort_by in METRICS.values() for field in sort_by}},
+        ))
+        # city wide buckets of these cuisines: size and last entry
+        city = {bucket["_id"]: bucket for bucket in self.coll.find(
+            {"level": None, "area": None, "cuisine": {"$in": [None, *{doc.get("cuisine") for doc in l_docs}]}},
+            {"count": 1, "restaurants": {"$slice": -1}},
+        )}
+        for doc in l_docs:
+            for by_cuisine, level in GROUPINGS:
+                cuisine = doc.get("cuisine") if by_cuisine else None
+                area = doc.get(LEVELS[level]) if level else None
+                if (by_cuisine and not cuisine) or (level and not area) or (cuisine, level, area) in keys:
+                    continue
+                if level is None and not self.doEnters(doc, cuisine, city):
+                    continue
+                keys.add((cuisine, level, area))
+        return keys
+
+    def doEnters(self, restaurant: dict, cuisine: str|None, city: dict[str, dict]) -> bool:
+        """
+        True when restaurant enters a city wide bucket for one metric at least: bucket missing or not full
+        (every ranked restaurant is in it), or restaurant ranked before its last entry.
+        """
+        for metric, sort_by in METRICS.items():
+            if restaurant.get(next(iter(sort_by))) is None:
+                continue
+            bucket = city.get(doBucketId(metric, cuisine, None, None))
+            if bucket is None or bucket.get("count", 0) < self.size or not bucket["restaurants"]:
+                return True
+            if doRankedBefore(restaurant, bucket["restaurants"][-1], sort_by):
+                return True
+        return False
+
+    def doRefreshGrouping(self, grouping: tuple[bool, str|None], keys: set[tuple]|None):
+        """
+        Recompute buckets of one grouping, every bucket when keys is None. Buckets left without restaurants are removed.
+        """
+        by_cuisine, level = grouping
+        group_id = {}
+        by_cuisine and group_id.update(cuisine="$cuisine")
+        level and group_id.update(area=f"${LEVELS[level]}")
+        match = {}
+        by_cuisine and match.update(cuisine={"$nin": [None, ""]})
+        level and match.update({LEVELS[level]: {"$ne": None}})
+        if keys is not None and grouping != (False, None):
+            match["$or"] = [
+                {**({"cuisine": cuisine} if by_cuisine else {}), **({LEVELS[level]: area} if level else {})}
+                for cuisine, _, area in keys
+            ]
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        l_ops, l_ids = [], []
+        for metric, sort_by in METRICS.items():
+            pipeline = [
+                {"$match": {**match, next(iter(sort_by)): {"$ne": None}}},
+                {
+                    "$group": {
+                        "_id": group_id or None,
+                        "restaurants": {"$topN": {"n": self.size, "sortBy": sort_by, "output": {field: f"${field}" for field in OUTPUT}}},
+                    }
+                },
+            ]
+            for bucket in self.restaurants.aggregate(pipeline, allowDiskUse=True):
+                key = bucket["_id"] or {}
+                bucket_id = doBucketId(metric, key.get("cuisine"), level, key.get("area"))
+                l_ids.append(bucket_id)
+                l_ops.append(ReplaceOne(
+                    {"_id": bucket_id},
+                    {"metric": metric, "cuisine": key.get("cuisine"), "level": level, "area": key.get("area"), "restaurants": bucket["restaurants"], "count": len(bucket["restaurants"]), "updated_at": now},
+                    upsert=True,
+                ))
+        gone = {"cuisine": {"$ne": None} if by_cuisine else None, "level": level, "_id": {"$nin": l_ids}}
+        if keys is not None:
+            gone["_id"]["$in"] = [doBucketId(metric, cuisine, level, area) for metric in METRICS for cuisine, _, area in keys]
+        l_ops.append(DeleteMany(gone))
+        self.coll.bulk_write(l_ops, ordered=False)
+        doInvalidate(self.coll)
+
+    ### Read #
+    def read(self, metric: str, cuisine: str|None, level: str|None, area: str|None, k: int, guard: Guard) -> dict|None:
+        """
+        First k restaurants of a bucket, None when the bucket has no ranked restaurant.
+        """
+        return doFindOne(self.coll, {"_id": doBucketId(metric, cuisine, level, area)}, guard, {"_id": 0, "restaurants": {"$slice": k}})
+
+    def shutdown(self):
+        self.stopping.set()
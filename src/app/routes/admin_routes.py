@@ -0,0 +1,129 @@
+import os
+import tempfile
+from typing import Annotated
+from fastapi import APIRouter, Depends, Query, Request, status
+from fastapi.concurrency import run_in_threadpool
+
+from ..database.write_behind import doFlushPending
+from ..middleware.admin_auth import require_admin
+from ..middleware.guardrails import doRequestGuard
+from ..modules.grades.grades import SUMMARY_UPDATE
+from ..modules.importer.importer import ImportFormat
+from ..modules.jobs.jobs import doReport
+
+# ADMIN_ROUTER - every route requires X-Admin-Token header
+admin_router = APIRouter(prefix="/admin", dependencies=[Depends(require_admin)])
+
+
+@admin_router.post(
+    "/import",
+    response_description="bulk import of restaurant inspection results",
+    status_code=status.HTTP_202_ACCEPTED,
+)
+async def import_restaurants(
+    request: Request,
+    format: Annotated[ImportFormat, Query()] = ImportFormat.CSV,
+):
+    """
+    IMPORT NYC RESTAURANT INSPECTION RESULTS - request body is the raw file (csv or json lines).
+    Body is spooled to a temporary file, then an "import" job parses it in a process pool and upserts
+    restaurants by restaurant_id. Untagged restaurants are then tagged by a spatial join job.
+
+    ex: curl -X POST -H "X-Admin-Token: $ADMIN_TOKEN" --data-binary @inspections.csv "<api>/admin/import?format=csv"
+
+    @param format:\n
+        csv (default) | ndjson\n
+
+    @return:\n
+        Job: {id, kind, status, processed (rows), matched (restaurants), modified, result} - runs in background,
+        follow it at /jobs/{id}. result: {rows, restaurants, grades, upserted, modified, rejected, rejected_sample,
+        duration_s, rows_per_s} once done.
+    """
+    guard = doRequestGuard(request)
+    doFlushPending(request.app.write_behind)
+    fd, path = tempfile.mkstemp(suffix=f'.{format.value}')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            async for chunk in request.stream():
+                f.write(chunk)
+        # file is removed by the job
+        job = await run_in_threadpool(
+            request.app.jobs.create,
+            request.app.db_restaurants.name,
+            {},
+            {"path": path, "format": format.value},
+            description=f'import of {format.value} file',
+            write_concern=guard.write_concern,
+            kind="import",
+            total=0,
+        )
+    except BaseException:
+        os.remove(path)
+        raise
+    return doReport(job)
+
+
+def doSpatialJoin(app, missing_only: bool, write_concern: dict = None) -> dict:
+    doFlushPending(app.write_behind)
+    return app.jobs.create(
+        app.db_restaurants.name,
+        {"borough_geo": {"$exists": False}} if missing_only else {},
+        {},
+        description='spatial join of untagged restaurants' if missing_only else 'spatial join of restaurants',
+        write_concern=write_concern,
+        kind="spatial_join",
+    )
+
+
+@admin_router.post(
+    "/spatial_join",
+    response_description="tag restaurants with their neighborhood and borough",
+    status_code=status.HTTP_202_ACCEPTED,
+)
+def spatial_join_restaurants(
+    request: Request,
+    missing_only: Annotated[bool, Query()] = False,
+):
+    """
+    SPATIAL JOIN - set "neighborhood" and "borough_geo" of restaurants from the polygons containing their
+    address.coord (point in polygon in a process pool), so that they can be filtered by equality.
+    Run it again after neighborhoods or boroughs polygons change.
+
+    @param missing_only:\n
+        bool: untagged restaurants only (false by default: every restaurant, unchanged tags are not written).\n
+
+    @return:\n
+        Job: {id, kind, status, total, processed, matched, modified, progress, eta_s} - runs in background, follow it at /jobs/{id}.
+    """
+    job = doSpatialJoin(request.app, missing_only, doRequestGuard(request).write_concern)
+    return doReport(job)
+
+
+@admin_router.post(
+    "/grade_summary",
+    response_description="compute grades summary fields of restaurants",
+    status_code=status.HTTP_202_ACCEPTED,
+)
+def grade_summary_restaurants(
+    request: Request,
+    missing_only: Annotated[bool, Query()] = False,
+):
+    """
+    GRADES SUMMARY BACKFILL - set latest_grade, latest_score, latest_inspection_date, avg_score and grade_count
+    of restaurants from their stored grades (update pipeline), so that they can be filtered and sorted on with an index.
+
+    @param missing_only:\n
+        bool: restaurants without summary only (false by default: every restaurant).\n
+
+    @return:\n
+        Job: {id, kind, status, total, processed, matched, modified, progress, eta_s} - runs in background, follow it at /jobs/{id}.
+    """
+    doFlushPending(request.app.write_behind)
+    job = request.app.jobs.create(
+        request.app.db_restaurants.name,
+        {"grade_count": {"$exists": False}} if missing_only else {},
+        SUMMARY_UPDATE,
+        description='grades summary of restaurants without it' if missing_only else 'grades summary of restaurants',
+        write_concern=doRequestGuard(request).write_concern,
+    )
+    return doReport(job)
@@ -0,0 +1,42 @@
+import time
+from fastapi import APIRouter, HTTPException, Request, status
+
+from ..config import BATCH_DEADLINE_MS, BATCH_MAX_REQUESTS
+from ..models.models import BatchRequest
+from ..modules.batch.batch import doBatch
+
+# BATCH_ROUTER
+batch_router = APIRouter()
+
+
+@batch_router.post(
+    "/batch",
+    response_description="run several read requests in one",
+    status_code=status.HTTP_200_OK,
+)
+async def batch_requests(request: Request, batch: BatchRequest):
+    """
+    BATCH OF READ REQUESTS - sub-requests run concurrently, each one as if sent alone
+    (guardrails, cache, coalescing), results are returned together in requests order.
+
+    ex: {"requests": [{"id": "cuisines", "path": "/distinct", "body": {"params": {"sort": {"field": "cuisine", "way": 1}}}},
+                      {"id": "boroughs", "path": "/borough/list", "body": {"params": {}}}], "deadline_ms": 2000}
+
+    @param requests:\n
+        list[{id<Optional>, method: GET|POST (default), path, body}]: read routes only, BATCH_MAX_REQUESTS at most.\n
+
+    @param deadline_ms:\n
+        int <Optional>: deadline of the whole batch, sub-requests still running get a 504 (BATCH_DEADLINE_MS by default and at most).\n
+
+    @return:\n
+        {responses: list[{id, status, body, duration_ms}], duration_ms}
+    """
+    if len(batch.requests) > BATCH_MAX_REQUESTS:
+        raise HTTPException(
+            status_code=422,
+            detail={"guardrail": "Too many sub-requests.", "field": "requests", "value": len(batch.requests), "max": BATCH_MAX_REQUESTS},
+        )
+    start = time.perf_counter()
+    deadline_ms = min(batch.deadline_ms or BATCH_DEADLINE_MS, BATCH_DEADLINE_MS)
+    responses = await doBatch(request.app, request.scope, batch.requests, deadline_ms / 1000)
+    return {"responses": responses, "duration_ms": round((time.perf_counter() - start) * 1000, 2)}
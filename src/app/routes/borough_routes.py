@@ -1,8 +1,13 @@
 from typing import Annotated, Any
-from fastapi import APIRouter, Body, HTTPException, status, Request
+from fastapi import APIRouter, Body, HTTPException, Query, Response, status, Request
 from pymongo.collection import Collection
 
-from ..middleware.cursor_middleware import cursor_to_object
+from ..database.query import doAggregate, doLocate, doUpdateOne
+from ..middleware.cursor_middleware import raw_to_response
+from ..middleware.guardrails import doCheckParams, doRequestGuard
+from ..modules.point.choropleth import ChoroplethStats
+from ..modules.point.geospatial import doGeoChanged
+from ..modules.profiling.timed_route import TimedRoute
 
 from ..middleware.http_params import (
     OP_FIELD,
@@ -15,7 +20,7 @@ from ..models.utils import IdMapper
 from ..models.models import Borough, ListResponse, Point
 
 # BOROUGH_ROUTER
-borough_router = APIRouter(prefix="/borough")
+borough_router = APIRouter(prefix="/borough", route_class=TimedRoute)
 
 
 @borough_router.post(
@@ -38,6 +43,8 @@ def read_one_borough(
     """
     # gain autocompletion by strongly typing collection
     coll: Collection = request.app.db_boroughs
+    guard = doRequestGuard(request)
+    params = doCheckParams(params, guard, paginate=False)
     skip, limit, sort = httpParamsInterpreter(params)
     if params.filters and params.filters != {}:
         query = Filter(**params.filters).make()
@@ -49,7 +56,7 @@ def read_one_borough(
     sort and l_aggreg.append({"$sort": sort})
     skip and l_aggreg.append({"$skip": skip})
     l_aggreg.append({"$limit": 1})
-    cursor = coll.aggregate(l_aggreg)
+    cursor = doAggregate(coll, l_aggreg, guard)
     # Aggregation pipes return list
     return list(cursor)[0]
 
@@ -76,6 +83,8 @@ def read_list_boroughs(
         list[Borough]: the requested list.
     """
     coll: Collection = request.app.db_boroughs
+    guard = doRequestGuard(request)
+    params = doCheckParams(params, guard)
     skip, limit, sort = httpParamsInterpreter(params)
     if params.filters and params.filters != {}:
         query = Filter(**params.filters).make()
@@ -89,7 +98,7 @@ def read_list_boroughs(
     sort and l_aggreg.append({"$sort": sort})
     skip and l_aggreg.append({"$skip": skip})
     limit and l_aggreg.append({"$limit": limit})
-    cursor = coll.aggregate(l_aggreg)
+    cursor = doAggregate(coll, l_aggreg, guard)
     return {"data": cursor, "page_nbr": params.page_nbr}
 
 
@@ -97,7 +106,7 @@ def read_list_boroughs(
     "/contain",
     response_description="check for coord's borough part of",
     status_code=status.HTTP_200_OK,
-    response_model=ListResponse,
+    response_model=Borough,
 )
 def borough_contain(
     request: Request,
@@ -113,21 +122,15 @@ def borough_contain(
     @returns
         the corresponding borough
     """
-    coll: Collection = request.app.db_boroughs
+    # in-memory index built at warmup (no round trip), $geoIntersects query until then
     point = {
         "type": "Point",
         "coordinates": [coord.longitude, coord.latitude]
     }
-    cursor = coll.find_one({
-        "geometry": {
-            "$geoIntersects": { "$geometry": point}
-        }
-    })
-
-    if cursor:
-        return cursor_to_object(cursor)
-    else:
-        raise HTTPException(status_code=404, detail="No borough corresponding to given point")
+    result = doLocate(request.app.db_boroughs, request.app.geo_boroughs, point, doRequestGuard(request))
+    if result:
+        return result
+    raise HTTPException(status_code=404, detail="No borough corresponding to given point")
 
 
 @borough_router.put(
@@ -161,10 +164,36 @@ def update_borough(
         the updated borough.
     """
     coll: Collection = request.app.db_boroughs
-    result = coll.update_one({"name": name}, {"$set": changes})
-    if result.matched_count == 0:
+    updated = doUpdateOne(coll, {"name": name}, {"$set": changes}, doRequestGuard(request))
+    if updated is None:
         raise HTTPException(
             status_code=404, detail={"update": {"error": f'name "{name}" not found'}}
         )
-    confirm = coll.find_one({"name": name})
-    return confirm
+    # point lookups follow new polygons (other workers within GEO_INDEX_CHECK_S)
+    doGeoChanged(changes) and request.app.geo_boroughs.reload(coll)
+    return updated
+
+@borough_router.get(
+    "/stats",
+    response_description="materialized stats of restaurants by borough",
+    status_code=status.HTTP_200_OK,
+)
+def get_borough_stats(
+    request: Request,
+    geometry: Annotated[bool, Query()] = False,
+):
+    """
+    BOROUGH STATS - restaurants count, cuisine mix (most frequent first), grade distribution and average score
+    of their latest inspection, by borough. Materialized, refreshed in background when restaurants change.
+
+    @param geometry:\n
+        bool: GeoJSON FeatureCollection with borough polygons (stats as feature properties), false by default.\n
+
+    @return:\n
+        {data: list[{name, count, avg_score, cuisines: {cuisine: count}, grades: {grade: count}, updated_at}], level}
+    """
+    stats: ChoroplethStats = request.app.stats
+    raw = stats.doRaw("borough", doRequestGuard(request))
+    if geometry:
+        return Response(content=stats.doFeatureCollection("borough", request.app.geo_boroughs, raw), media_type="application/geo+json")
+    return raw_to_response(raw, level="borough")
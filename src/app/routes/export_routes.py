@@ -0,0 +1,95 @@
+from enum import Enum
+from typing import Annotated
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import APIRouter, Body, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
+from pymongo.collection import Collection
+
+from ..config import EXPORT_BATCH_SIZE
+from ..middleware.guardrails import doCheckParams, doRequestGuard
+from ..middleware.http_params import OP_FIELD, Filter, HttpParams
+from ..modules.export.export import MEDIA_TYPES, WRITERS, ExportFormat, doGzip, doKeysetBatches, pa
+from ..modules.profiling.timed_route import TimedRoute
+
+# EXPORT_ROUTER
+export_router = APIRouter(prefix="/export", route_class=TimedRoute)
+
+
+class ExportCollection(str, Enum):
+    RESTAURANTS = "restaurants"
+    NEIGHBORHOODS = "neighborhoods"
+    BOROUGHS = "boroughs"
+
+
+@export_router.post(
+    "/{collection}",
+    response_description="stream the whole filtered collection",
+    status_code=status.HTTP_200_OK,
+)
+def export_collection(
+    request: Request,
+    collection: ExportCollection,
+    format: Annotated[ExportFormat, Query()] = ExportFormat.NDJSON,
+    after: Annotated[str, Query()] = None,
+    params: Annotated[HttpParams, Body(embed=True)] = None,
+):
+    """
+    EXPORT A COLLECTION - streamed in _id order with constant memory, whatever its size.
+    Response is gzip compressed on the fly when client accepts it (Accept-Encoding: gzip),
+    parquet columns are zstd compressed.
+
+    @param collection:\n
+        restaurants | neighborhoods | boroughs\n
+
+    @param format:\n
+        ndjson (default) | csv (restaurants: one row per grade) | geojson (FeatureCollection) | parquet (requires pyarrow)\n
+
+    @param after:\n
+        str <Optional>: resume token - _id of the last record received, export restarts after it.\n
+
+    @param params:\n
+        filters(Filter) <Optional>: filters for request ($geoNear not allowed). nbr, page_nbr and sort are ignored.\n
+
+    @return:\n
+        Stream of records, each one with its _id.
+    """
+    if format == ExportFormat.PARQUET and pa is None:
+        raise HTTPException(
+            status_code=422,
+            detail={"valueError": "Parquet export requires pyarrow.", "field": "format", "value": format.value},
+        )
+    coll: Collection = request.app.database[collection.value]
+    guard = doRequestGuard(request)
+    filters = params.filters if params else None
+    doCheckParams(HttpParams(filters=filters or {}), guard, paginate=False)
+
+    l_aggreg = []
+    if filters:
+        query = Filter(**filters).make()
+        if any(OP_FIELD.GEONEAR.value in stage for stage in query):
+            raise HTTPException(
+                status_code=422,
+                detail={"valueError": "$geoNear filter can't be used for export.", "field": "filters", "value": filters},
+            )
+        # _id is kept: resume token
+        l_aggreg += [stage for stage in query if "$project" not in stage]
+    try:
+        after_id = ObjectId(after) if after else None
+    except InvalidId:
+        raise HTTPException(
+            status_code=422,
+            detail={"valueError": "Resume token should be an _id.", "field": "after", "value": after},
+        )
+    # guard maxTimeMS bounds each batch query, whatever the export length
+    batches = doKeysetBatches(coll, l_aggreg, after_id, EXPORT_BATCH_SIZE, guard.max_time_ms)
+
+    chunks = WRITERS[format](batches, collection.value)
+    headers = {
+        "Content-Disposition": f'attachment; filename="{collection.value}.{format.value}"',
+        "Vary": "Accept-Encoding",
+    }
+    if format != ExportFormat.PARQUET and "gzip" in request.headers.get("accept-encoding", ""):
+        chunks = doGzip(chunks)
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(chunks, media_type=MEDIA_TYPES[format], headers=headers)
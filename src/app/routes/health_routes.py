@@ -0,0 +1,37 @@
+from fastapi import APIRouter, Request, Response, status
+
+# HEALTH_ROUTER
+health_router = APIRouter()
+
+
+@health_router.get(
+    "/healthz",
+    response_description="liveness probe",
+    status_code=status.HTTP_200_OK,
+)
+def liveness():
+    """
+    LIVENESS - app process is up and serving requests.
+    No database round trip.
+    """
+    return {"status": "ok"}
+
+
+@health_router.get(
+    "/readyz",
+    response_description="readiness probe with warmup tasks status",
+    status_code=status.HTTP_200_OK,
+)
+def readiness(request: Request, response: Response):
+    """
+    READINESS - every critical warmup task (indexes, reference data) is done.
+
+    @return:\n
+        {ready: bool, tasks: {name: {status, critical, duration_ms, error}}}\n
+        status code 503 while not ready.
+    """
+    warmup = request.app.warmup
+    ready = warmup.is_ready()
+    if not ready:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return {"ready": ready, "tasks": warmup.report()}
@@ -0,0 +1,106 @@
+from typing import Annotated
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+
+from ..middleware.admin_auth import require_admin
+from ..modules.jobs.jobs import JobRunner, doReport
+
+# JOB_ROUTER - background collection-wide updates (see modules/jobs/jobs.py), cancel and resume require X-Admin-Token header
+job_router = APIRouter(prefix="/jobs")
+
+
+def doJobId(id: str) -> ObjectId:
+    try:
+        return ObjectId(id)
+    except InvalidId:
+        raise HTTPException(status_code=404, detail=f"Job #{id} not found!")
+
+
+@job_router.get(
+    "",
+    response_description="list of latest jobs",
+    status_code=status.HTTP_200_OK,
+)
+def list_jobs(request: Request, nbr: Annotated[int, Query(ge=1, le=500)] = 50):
+    """
+    LIST JOBS - latest first.
+
+    @param nbr:\n
+        int: number of jobs (50 by default).\n
+
+    @return:\n
+        list[Job]
+    """
+    runner: JobRunner = request.app.jobs
+    return [doReport(job) for job in runner.list(nbr)]
+
+
+@job_router.get(
+    "/{id}",
+    response_description="job status and progress",
+    status_code=status.HTTP_200_OK,
+)
+def read_job(request: Request, id: str):
+    """
+    GET A JOB - status, progress and ETA.
+
+    @return:\n
+        Job: {id, kind<update|spatial_join>, description, collection, status<pending|running|done|cancelled|failed>, total, processed,
+        matched, modified, progress<0-1>, rate_per_s, eta_s, created_at, updated_at, finished_at, error}
+    """
+    runner: JobRunner = request.app.jobs
+    job = runner.get(doJobId(id))
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job #{id} not found!")
+    return doReport(job)
+
+
+@job_router.delete(
+    "/{id}",
+    response_description="cancel a job",
+    status_code=status.HTTP_200_OK,
+    dependencies=[Depends(require_admin)],
+)
+def cancel_job(request: Request, id: str):
+    """
+    CANCEL A JOB - pending or running, it stops at the end of its current batch.
+    Documents already updated are kept, the job can be resumed.
+
+    @return:\n
+        Job
+    """
+    runner: JobRunner = request.app.jobs
+    job_id = doJobId(id)
+    job = runner.cancel(job_id)
+    if job is None:
+        job = runner.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail=f"Job #{id} not found!")
+        raise HTTPException(status_code=409, detail={"job": {"error": f'job is {job["status"]}', "id": id}})
+    return doReport(job)
+
+
+@job_router.post(
+    "/{id}/resume",
+    response_description="resume a cancelled or failed job",
+    status_code=status.HTTP_202_ACCEPTED,
+    dependencies=[Depends(require_admin)],
+)
+def resume_job(request: Request, id: str):
+    """
+    RESUME A JOB - cancelled or failed, after its last processed batch.
+    Jobs interrupted by a restart are resumed automatically.
+
+    @return:\n
+        Job
+    """
+    runner: JobRunner = request.app.jobs
+    job_id = doJobId(id)
+    job = runner.resume(job_id)
+    if job is None:
+        job = runner.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail=f"Job #{id} not found!")
+        raise HTTPException(status_code=409, detail={"job": {"error": f'job is {job["status"]}', "id": id}})
+    return doReport(job)
@@ -0,0 +1,15 @@
+from fastapi import APIRouter, Response
+
+from ..modules.metrics.metrics import doGenerateMetrics
+
+# METRICS_ROUTER
+metrics_router = APIRouter()
+
+
+@metrics_router.get("/metrics", response_description="prometheus metrics", include_in_schema=False)
+def metrics():
+    """
+    PROMETHEUS METRICS - text exposition format.
+    """
+    payload, content_type = doGenerateMetrics()
+    return Response(content=payload, media_type=content_type)
@@ -1,8 +1,14 @@
 from typing import Annotated, Any
-from fastapi import APIRouter, Body, HTTPException, status, Request
+from fastapi import APIRouter, Body, HTTPException, Query, Response, status, Request
 from pymongo.collection import Collection
 
-from ..middleware.cursor_middleware import cursor_to_object
+from ..middleware.cursor_middleware import cursor_to_object, raw_to_response
+from ..database.query import doAggregate, doUpdateOne
+from ..middleware.guardrails import doCheckParams, doRequestGuard
+from ..modules.jobs.jobs import doReport
+from ..modules.point.choropleth import ChoroplethStats
+from ..modules.point.geospatial import doGeoChanged
+from ..modules.profiling.timed_route import TimedRoute
 
 from ..middleware.http_params import (
     OP_FIELD,
@@ -15,7 +21,7 @@ from ..models.utils import IdMapper
 from ..models.models import ListResponse, Neighborhood
 
 # NEIGHBORHOOD_ROUTER
-neighb_router = APIRouter(prefix="/neighborhood")
+neighb_router = APIRouter(prefix="/neighborhood", route_class=TimedRoute)
 
 
 @neighb_router.post(
@@ -38,6 +44,8 @@ def read_one_neighborhood(
     """
     # gain autocompletion by strongly typing collection
     coll: Collection = request.app.db_neighborhoods
+    guard = doRequestGuard(request)
+    params = doCheckParams(params, guard, paginate=False)
     skip, limit, sort = httpParamsInterpreter(params)
     if params.filters and params.filters != {}:
         query = Filter(**params.filters).make()
@@ -49,7 +57,7 @@ def read_one_neighborhood(
     sort and l_aggreg.append({"$sort": sort})
     skip and l_aggreg.append({"$skip": skip})
     l_aggreg.append({"$limit": 1})
-    cursor = coll.aggregate(l_aggreg)
+    cursor = doAggregate(coll, l_aggreg, guard)
     # Aggregation pipes return list
     return list(cursor)[0]
 
@@ -76,6 +84,8 @@ def read_list_neighborhoods(
         list[Neighborhood]: the requested list.
     """
     coll: Collection = request.app.db_neighborhoods
+    guard = doRequestGuard(request)
+    params = doCheckParams(params, guard)
     skip, limit, sort = httpParamsInterpreter(params)
     if params.filters and params.filters != {}:
         query = Filter(**params.filters).make()
@@ -89,7 +99,7 @@ def read_list_neighborhoods(
     sort and l_aggreg.append({"$sort": sort})
     skip and l_aggreg.append({"$skip": skip})
     limit and l_aggreg.append({"$limit": limit})
-    cursor = coll.aggregate(l_aggreg)
+    cursor = doAggregate(coll, l_aggreg, guard)
     return {"data": cursor, "page_nbr": params.page_nbr}
 
 
@@ -118,6 +128,8 @@ def get_distinct_neighborhood(
         list[str]: list of names.
     """
     coll: Collection = request.app.db_neighborhoods
+    guard = doRequestGuard(request)
+    params = doCheckParams(params, guard)
     skip, limit, sort = httpParamsInterpreter(params)
     if params.filters and params.filters != {}:
         query = Filter(**params.filters).make()
@@ -159,11 +171,11 @@ def get_distinct_neighborhood(
     skip and l_aggreg.append({"$skip": skip})
     limit and l_aggreg.append({"$limit": limit})
     l_aggreg.append({'$project': {'_id': 0}})
-    cursor = coll.aggregate(l_aggreg)
+    cursor = doAggregate(coll, l_aggreg, guard)
     return {"data": cursor, "page_nbr": params.page_nbr}
 
 
-@neighb_router.put("/update/field/set", response_description="set field value")
+@neighb_router.put("/update/field/set", response_description="set field value", status_code=status.HTTP_202_ACCEPTED)
 def update_neighborhood_value(
     request: Request,
     new_item: Annotated[dict[str, Any], Body(embed=True)],
@@ -182,29 +194,19 @@ def update_neighborhood_value(
         sort(SortParams{field:str, way:1|-1}): ascending order by default.\n
 
     @return:\n
-       {field: number of items processed}[]
+        Job: {id, status, total, processed, matched, modified, progress, eta_s} - update runs in background, follow it at /jobs/{id}.
     """
-    coll: Collection = request.app.db_neighborhoods
-    skip, limit, sort = httpParamsInterpreter(params)
-    # update_many(filter<{'name':'Wendys'}>, update<{$set:{'cuisine':'BUDU'}}, upsert<Bool: insert if not present>>)
-    if params.filters and len(params.filters) > 0:
-        query = Filter(**params.filters).make()
-    l_aggreg = [{"$set": new_item}]
-    query and l_aggreg.insert(0, query["$match"])
-    skip and l_aggreg.append(skip)
-    limit and l_aggreg.append(limit)
-    cursor = coll.update_many(*l_aggreg, upsert=True)
-    if cursor.modified_count > 0:
-        return {
-            "new_value": new_item,
-            "matched": cursor.matched_count,
-            "modified": cursor.modified_count,
-        }
-    else:
-        raise HTTPException(
-            status_code=404,
-            detail=f"No item modified for new item {new_item} and filters {params.filters}.",
-        )
+    guard = doRequestGuard(request)
+    match = Filter(**params.filters).makeMatch() if params.filters else {}
+    job = request.app.jobs.create(
+        request.app.db_neighborhoods.name,
+        match,
+        {"$set": new_item},
+        upsert=True,
+        description=f'set {", ".join(new_item)}',
+        write_concern=guard.write_concern,
+    )
+    return doReport(job)
 
 
 @neighb_router.put(
@@ -238,10 +240,36 @@ def update_neighborhood(
         the updated neighborhood.
     """
     coll: Collection = request.app.db_neighborhoods
-    result = coll.update_one({"name": name}, {"$set": changes})
-    if result.matched_count == 0:
+    updated = doUpdateOne(coll, {"name": name}, {"$set": changes}, doRequestGuard(request))
+    if updated is None:
         raise HTTPException(
             status_code=404, detail={"update": {"error": f'name "{name}" not found'}}
         )
-    confirm = coll.find_one({"name": name})
-    return confirm
+    # point lookups follow new polygons (other workers within GEO_INDEX_CHECK_S)
+    doGeoChanged(changes) and request.app.geo_neighborhoods.reload(coll)
+    return updated
+
+@neighb_router.get(
+    "/stats",
+    response_description="materialized stats of restaurants by neighborhood",
+    status_code=status.HTTP_200_OK,
+)
+def get_neighborhood_stats(
+    request: Request,
+    geometry: Annotated[bool, Query()] = False,
+):
+    """
+    NEIGHBORHOOD STATS - restaurants count, cuisine mix (most frequent first), grade distribution and average score
+    of their latest inspection, by neighborhood. Materialized, refreshed in background when restaurants change.
+
+    @param geometry:\n
+        bool: GeoJSON FeatureCollection with neighborhood polygons (stats as feature properties), false by default.\n
+
+    @return:\n
+        {data: list[{name, count, avg_score, cuisines: {cuisine: count}, grades: {grade: count}, updated_at}], level}
+    """
+    stats: ChoroplethStats = request.app.stats
+    raw = stats.doRaw("neighborhood", doRequestGuard(request))
+    if geometry:
+        return Response(content=stats.doFeatureCollection("neighborhood", request.app.geo_neighborhoods, raw), media_type="application/geo+json")
+    return raw_to_response(raw, level="neighborhood")
@@ -1,14 +1,22 @@
+import asyncio
 from typing import Annotated
 from fastapi import APIRouter, Body, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.encoders import jsonable_encoder
 from pymongo import GEOSPHERE
 from pymongo.collection import Collection
 
-from ..middleware.cursor_middleware import cursor_to_object
+from ..config import BBOX_MAX_RESULTS, BBOX_SAMPLE_ZOOM
+from ..middleware.cursor_middleware import raw_to_response
+from ..database.query import doAggregate, doAggregateRaw, doLocate
+from ..middleware.guardrails import doCheckParams, doRequestGuard
+from ..modules.profiling.timed_route import TimedRoute
 
-from ..models.models import Distance, Geometry, Neighborhood, Point, Restaurant
+from ..models.models import BBox, BBoxResponse, Distance, Geometry, Neighborhood, Point, PointContextResponse, Restaurant
+from ..modules.point.geospatial import GeoIndex, doBuildBox
 
 from ..middleware.http_params import (
+    OP_FIELD,
     Filter,
     HttpParams,
     SortParams,
@@ -16,7 +24,7 @@ from ..middleware.http_params import (
 )
 
 
-point_router = APIRouter(prefix="/point")
+point_router = APIRouter(prefix="/point", route_class=TimedRoute)
 
 
 @point_router.post(
@@ -43,26 +51,14 @@ def get_neighborhood(
         filters(Filter): filters for request.\n
         sort(SortParams{field:str, way:1|-1}): ascending order by default.\n
     """
-    coll: Collection = request.app.db_neighborhoods
-    result = coll.find_one(
-        {
-            "geometry": {
-                "$geoIntersects": {
-                    "$geometry": {
-                        "type": "Point",
-                        "coordinates": [coord.longitude, coord.latitude],
-                    }
-                }
-            }
-        }
+    # in-memory index built at warmup (no round trip), $geoIntersects query until then
+    point = {"type": "Point", "coordinates": [coord.longitude, coord.latitude]}
+    result = doLocate(request.app.db_neighborhoods, request.app.geo_neighborhoods, point, doRequestGuard(request))
+    if result:
+        return result
+    raise HTTPException(
+        status_code=404, detail=f"No neighborhood match for coordinates {coord}."
     )
-    try:
-        result = dict(result)
-        return cursor_to_object(result)
-    except:
-        raise HTTPException(
-            status_code=404, detail=f"No neighborhood match for coordinates {coord}."
-        )
 
 
 @point_router.post(
@@ -96,6 +92,8 @@ def get_restaurants(
         sort(SortParams{field:str, way:1|-1}): ascending order by default.\n
     """
     coll: Collection = request.app.db_restaurants
+    guard = doRequestGuard(request)
+    params = doCheckParams(params, guard)
     skip, limit, sort = httpParamsInterpreter(params)
     if params.filters and len(params.filters) > 0:
         query = Filter(**params.filters).make() if params.filters else {}
@@ -124,9 +122,7 @@ def get_restaurants(
     sort and l_aggreg.append({"$sort": sort})
     skip and l_aggreg.append({"$skip": skip})
     limit and l_aggreg.append({"$limit": limit})
-    cursor = coll.aggregate(l_aggreg)
-    result = list(cursor)
-    return cursor_to_object(result)
+    return raw_to_response(doAggregateRaw(coll, l_aggreg, guard), Restaurant)
 
 
 @point_router.post(
@@ -167,6 +163,8 @@ def get_restaurants_within(
         sort(SortParams{field:str, way:1|-1}): ascending order by default.\n
     """
     coll: Collection = request.app.db_restaurants
+    guard = doRequestGuard(request)
+    params = doCheckParams(params, guard)
     skip, limit, sort = httpParamsInterpreter(params)
     if params.filters and len(params.filters) > 0:
         query = Filter(**params.filters).make() if params.filters else {}
@@ -190,6 +188,171 @@ def get_restaurants_within(
     sort and l_aggreg.append({"$sort": sort})
     skip and l_aggreg.append({"$skip": skip})
     limit and l_aggreg.append({"$limit": limit})
-    cursor = coll.aggregate(l_aggreg)
-    result = list(cursor)
-    return cursor_to_object(result)
+    return raw_to_response(doAggregateRaw(coll, l_aggreg, guard), Restaurant)
+
+
+@point_router.post(
+    "/in_bbox",
+    response_description="get restaurants inside the current viewport.",
+    status_code=status.HTTP_200_OK,
+    response_model=BBoxResponse,
+)
+def get_restaurants_in_bbox(
+    request: Request,
+    bbox: Annotated[BBox, Body(embed=True)],
+    params: Annotated[HttpParams, Body(embed=True)] = HttpParams(
+        page_nbr=1, nbr=BBOX_MAX_RESULTS, filters={}
+    ),
+    zoom: Annotated[int, Body(embed=True, ge=0, le=24)] = None,
+):
+    """
+    Get the restaurants inside a bounding box (map viewport), with total count of matches.\n
+    Results are capped at BBOX_MAX_RESULTS. Under BBOX_SAMPLE_ZOOM, a random sample
+    spread over the viewport is returned instead of the first page.
+
+    @param bbox:\n
+        min_longitude, max_longitude <float[-180:180]>\n
+        min_latitude, max_latitude <float[-90:90]>\n
+
+    @param params:\n
+        nbr(int): number of items required (capped).\n
+        page_nbr(int): page number.\n
+        filters(Filter): filters for request ($geoNear not allowed).\n
+        sort(SortParams{field:str, way:1|-1}): ascending order by default.\n
+
+    @param zoom:\n
+        int <Optional>: map zoom level, used to switch to sampling.\n
+
+    @return:\n
+        {data: list[Restaurant], total: int, sampled: bool, page_nbr: int}
+    """
+    coll: Collection = request.app.db_restaurants
+    guard = doRequestGuard(request)
+    params = doCheckParams(params, guard, paginate=False)
+    skip, limit, sort = httpParamsInterpreter(params)
+    limit = min(limit or BBOX_MAX_RESULTS, BBOX_MAX_RESULTS)
+    l_match = {
+        "address.coord": {
+            "$geoWithin": {
+                "$geometry": doBuildBox(
+                    bbox.min_longitude, bbox.min_latitude, bbox.max_longitude, bbox.max_latitude
+                )
+            }
+        }
+    }
+    l_aggreg = [{"$match": l_match}]
+    if params.filters and len(params.filters) > 0:
+        query = Filter(**params.filters).make()
+        if any(OP_FIELD.GEONEAR.value in stage for stage in query):
+            raise HTTPException(
+                status_code=422,
+                detail={"valueError": "$geoNear filter can't be combined with bbox.", "field": "filters", "value": params.filters},
+            )
+        # keep filter stages, $project is applied on data facet
+        l_aggreg += [stage for stage in query if "$project" not in stage]
+
+    # low zoom: spread a sample over the viewport instead of the first page
+    sampled = zoom is not None and zoom < BBOX_SAMPLE_ZOOM
+    l_data = []
+    if sampled:
+        l_data.append({"$sample": {"size": limit}})
+    else:
+        sort and l_data.append({"$sort": sort})
+        skip and l_data.append({"$skip": skip})
+        l_data.append({"$limit": limit})
+    l_data.append({"$project": {"_id": 0}})
+    l_aggreg.append(
+        {"$facet": {"data": l_data, "total": [{"$count": "count"}]}}
+    )
+    result = list(doAggregate(coll, l_aggreg, guard))[0]
+    total = result["total"][0]["count"] if result["total"] else 0
+    return {
+        "data": result["data"],
+        "total": total,
+        "sampled": sampled and total > len(result["data"]),
+        "page_nbr": None if sampled else params.page_nbr,
+    }
+
+
+async def doLocateAsync(coll: Collection, index: GeoIndex, point: dict, guard) -> dict|None:
+    """
+    doLocate without blocking event loop: in-memory index inline, Mongo query in threadpool.
+    """
+    if index.ready:
+        return index.locate(*point["coordinates"])
+    return await run_in_threadpool(doLocate, coll, index, point, guard)
+
+
+@point_router.post(
+    "/context",
+    response_description="borough, neighborhood and nearest restaurants of a point.",
+    status_code=status.HTTP_200_OK,
+    response_model=PointContextResponse,
+)
+async def get_point_context(
+    request: Request,
+    coord: Annotated[Point, Body(embed=True)],
+    k: Annotated[int, Body(embed=True, ge=1)] = 20,
+    dist: Annotated[Distance, Body(embed=True)] = Distance(min=0, max=1000),
+    cuisine: Annotated[str, Body(embed=True)] = None,
+    grade: Annotated[str, Body(embed=True)] = None,
+    geometry: Annotated[bool, Body(embed=True)] = True,
+):
+    """
+    Location context of a map click, in one request: borough, neighborhood and the k nearest restaurants.\n
+    The three lookups run concurrently (boroughs and neighborhoods from in-memory indexes once built),
+    so the request costs the slowest of them instead of their sum.
+
+    @param coord:\n
+        longitude <float[-180:180]>\n
+        latitude <float[-90:90]>\n
+
+    @param k:\n
+        int: number of nearest restaurants (default 20, geo routes max nbr at most).\n
+
+    @param dist:\n
+        min <int> : distance in meters (default=0)\n
+        max <int> : distance in meters (default=1000)\n
+
+    @param cuisine:\n
+        str <Optional>: restaurants of this cuisine only.\n
+
+    @param grade:\n
+        str <Optional>: restaurants with this grade in their inspections only.\n
+
+    @param geometry:\n
+        bool: False to get borough and neighborhood without their geometry (lighter response).\n
+
+    @return:\n
+        {data: list[Restaurant], borough: Borough|null, neighborhood: Neighborhood|null}
+    """
+    guard = doRequestGuard(request)
+    doCheckParams(HttpParams(nbr=k), guard, paginate=False)
+    point = {"type": "Point", "coordinates": [coord.longitude, coord.latitude]}
+    l_query = {}
+    if cuisine:
+        l_query["cuisine"] = cuisine
+    if grade:
+        l_query["grades.grade"] = grade
+    l_aggreg = [
+        {
+            "$geoNear": {
+                "near": point,
+                "minDistance": dist.min,
+                "maxDistance": dist.max,
+                "distanceField": "dist.calculated",
+                "query": l_query,
+                "spherical": True,
+            }
+        },
+        {"$limit": k},
+    ]
+    borough, neighborhood, raw = await asyncio.gather(
+        doLocateAsync(request.app.db_boroughs, request.app.geo_boroughs, point, guard),
+        doLocateAsync(request.app.db_neighborhoods, request.app.geo_neighborhoods, point, guard),
+        run_in_threadpool(doAggregateRaw, request.app.db_restaurants, l_aggreg, guard),
+    )
+    if not geometry:
+        borough = borough and {key: value for key, value in borough.items() if key != "geometry"}
+        neighborhood = neighborhood and {key: value for key, value in neighborhood.items() if key != "geometry"}
+    return raw_to_response(raw, Restaurant, borough=borough, neighborhood=neighborhood)
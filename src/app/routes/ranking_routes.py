@@ -0,0 +1,68 @@
+from typing import Annotated
+from fastapi import APIRouter, HTTPException, Query, Request, status
+
+from ..config import RANKING_SIZE
+from ..middleware.guardrails import doRequestGuard
+from ..modules.rankings.rankings import RankingMetric, Rankings
+
+# RANKING_ROUTER - materialized top restaurants (see modules/rankings/rankings.py)
+ranking_router = APIRouter()
+
+
+@ranking_router.get(
+    "/rankings",
+    response_description="top restaurants of a cuisine and area",
+    status_code=status.HTTP_200_OK,
+)
+def get_rankings(
+    request: Request,
+    metric: Annotated[RankingMetric, Query()] = RankingMetric.latest_score,
+    cuisine: Annotated[str|None, Query()] = None,
+    borough: Annotated[str|None, Query()] = None,
+    neighborhood: Annotated[str|None, Query()] = None,
+    k: Annotated[int, Query(ge=1)] = 10,
+):
+    """
+    RANKINGS - top k restaurants of a cuisine in a borough, a neighborhood or the whole city.
+    Materialized, refreshed in background when restaurants change.
+
+    ex: /rankings?metric=avg_score&cuisine=Pizza&neighborhood=Williamsburg&k=5
+
+    @param metric:\n
+        latest_score (default) | avg_score: lowest score first (fewer violation points).\n
+        grade: best latest grade, most recently inspected first.\n
+
+    @param cuisine:\n
+        str <Optional>: every cuisine by default.\n
+
+    @param borough | neighborhood:\n
+        str <Optional>: borough name or neighborhood (spatial join tag), one of them at most. Whole city by default.\n
+
+    @param k:\n
+        int: number of restaurants (10 by default, RANKING_SIZE at most).\n
+
+    @return:\n
+        {data: list[{rank, restaurant_id, name, cuisine, borough, neighborhood, address, latest_grade, latest_score,
+        latest_inspection_date, avg_score, grade_count}], metric, cuisine, level<borough|neighborhood|null>, area, updated_at}
+    """
+    if borough is not None and neighborhood is not None:
+        raise HTTPException(
+            status_code=422,
+            detail={"guardrail": "One area at most.", "field": "borough, neighborhood", "value": [borough, neighborhood]},
+        )
+    if k > RANKING_SIZE:
+        raise HTTPException(
+            status_code=422,
+            detail={"guardrail": "Too many ranked restaurants.", "field": "k", "value": k, "max": RANKING_SIZE},
+        )
+    level, area = ("borough", borough) if borough is not None else ("neighborhood", neighborhood) if neighborhood is not None else (None, None)
+    rankings: Rankings = request.app.rankings
+    ranking = rankings.read(metric.value, cuisine, level, area, k, doRequestGuard(request)) or {}
+    return {
+        "data": [{"rank": rank, **restaurant} for rank, restaurant in enumerate(ranking.get("restaurants", []), start=1)],
+        "metric": metric.value,
+        "cuisine": cuisine,
+        "level": level,
+        "area": area,
+        "updated_at": ranking.get("updated_at"),
+    }
@@ -1,10 +1,22 @@
+import asyncio
 import json
 from typing import Annotated, Any, Dict, List
 from fastapi import APIRouter, Body, HTTPException, status, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
 from pymongo.collection import Collection
 
-from ..middleware.cursor_middleware import cursor_to_object
+from ..config import FACETS_CACHE_TTL
+from ..middleware.cursor_middleware import cursor_to_object, raw_to_response
+from ..database.write_behind import WriteBehindQueue, doFlushPending, doRestaurantId
+from ..database.query import doAggregate, doAggregateRaw, doInsertOne, doInvalidate, doUpdateOne, doWriteColl
+from ..middleware.guardrails import doCheckParams, doRequestGuard
+from ..modules.jobs.jobs import doReport
+from ..modules.grades.grades import SUMMARY_UPDATE, doGradeSummary, doPartialGrades, doSummaryChanges
+from ..modules.point.choropleth import TAGS_PROJECTION
+from ..modules.point.spatial_join import doChangedAddress, doRestaurantTags
+from ..modules.profiling.timed_route import TimedRoute
 
 
 from ..middleware.http_params import (
@@ -13,11 +25,12 @@ from ..middleware.http_params import (
     Filter,
     SortWay,
     httpParamsInterpreter,
+    makeFacets,
 )
 from ..models.models import ListResponse, Restaurant
 
 ### RESTAURANT_ROUTER
-rest_router = APIRouter()
+rest_router = APIRouter(route_class=TimedRoute)
 
 
 @rest_router.post(
@@ -44,6 +57,8 @@ def read_one_restaurant(
     """
     # gain autocompletion by strongly typing collection
     coll: Collection = request.app.db_restaurants
+    guard = doRequestGuard(request)
+    params = doCheckParams(params, guard, paginate=False)
     skip, limit, sort = httpParamsInterpreter(params)
     if params.filters and params.filters != {}:
         query = Filter(**params.filters).make()
@@ -55,7 +70,7 @@ def read_one_restaurant(
     sort and l_aggreg.append({"$sort": sort})
     skip and l_aggreg.append({"$skip": skip})
     l_aggreg.append({"$limit": 1})
-    cursor = coll.aggregate(l_aggreg)
+    cursor = doAggregate(coll, l_aggreg, guard)
     # Aggregation pipes return list
     return list(cursor)[0]
 
@@ -66,7 +81,7 @@ def read_one_restaurant(
     status_code=status.HTTP_200_OK,
     response_model=ListResponse,
 )
-def read_list_restaurants(
+async def read_list_restaurants(
     request: Request, params: Annotated[HttpParams, Body(embed=True)]
 ):
     """
@@ -77,11 +92,16 @@ def read_list_restaurants(
         page_nbr(int): page number.\n
         filters(Filter): filters for request.\n
         sort(SortParams{field:str, way:1|-1}): ascending order by default.\n
+        facets(list[borough|cuisine|grade|neighborhood]): counts of filtered restaurants by value of each facet.\n
 
     @return:\n
         list[Restaurant]: the requested list.\n
+        With facets: {data, page_nbr, facets: {<facet>: [{value, count}]}}, most frequent values first.
+        Facet counts and page are read by two aggregations run concurrently.
     """
     coll: Collection = request.app.db_restaurants
+    guard = doRequestGuard(request)
+    params = doCheckParams(params, guard)
     skip, limit, sort = httpParamsInterpreter(params)
     if params.filters and params.filters != {}:
         query = Filter(**params.filters).make()
@@ -92,11 +112,21 @@ def read_list_restaurants(
         l_aggreg = query
     except:
         pass
+    l_envelope = {"page_nbr": params.page_nbr}
+    # facet counts don't depend on page nor sort: cached once for every page of a filter
+    l_facets = params.facets and l_aggreg + makeFacets(params.facets)
     sort and l_aggreg.append({"$sort": sort})
     skip and l_aggreg.append({"$skip": skip})
     limit and l_aggreg.append({"$limit": limit})
-    cursor = coll.aggregate(l_aggreg)
-    return {"data": cursor, "page_nbr": params.page_nbr}
+    page = run_in_threadpool(doAggregateRaw, coll, l_aggreg, guard)
+    if l_facets:
+        l_envelope["facets"], raw = await asyncio.gather(
+            run_in_threadpool(lambda: list(doAggregate(coll, l_facets, guard.doOverride(cache_ttl=FACETS_CACHE_TTL)))[0]),
+            page,
+        )
+    else:
+        raw = await page
+    return raw_to_response(raw, Restaurant, **l_envelope)
 
 
 @rest_router.post(
@@ -121,6 +151,8 @@ def get_distinct_field(
         list[str]: a list of names<str>.\n
     """
     coll: Collection = request.app.db_restaurants
+    guard = doRequestGuard(request)
+    params = doCheckParams(params, guard)
     skip, limit, sort = httpParamsInterpreter(params)
     if params.filters and params.filters != {}:
         #  filters for distinct not working! TODO /!\
@@ -171,7 +203,7 @@ def get_distinct_field(
     skip and l_aggreg.append({"$skip": skip})
     limit and l_aggreg.append({"$limit": limit})
     l_aggreg.append({'$project': {'_id': 0}})
-    cursor = coll.aggregate(l_aggreg)
+    cursor = doAggregate(coll, l_aggreg, guard)
     return {"data": cursor, "page_nbr": params.page_nbr}
 
 
@@ -202,10 +234,17 @@ def create_restaurant(
         Restaurant: created restaurant.
     """
     coll: Collection = request.app.db_restaurants
-    restaurant = jsonable_encoder(restaurant)
-    new_restaurant = coll.insert_one(restaurant)
-    created_restaurant = coll.find_one({"_id": new_restaurant.inserted_id})
-    return created_restaurant
+    guard = doRequestGuard(request)
+    doc = jsonable_encoder(restaurant)
+    doc.update(doRestaurantTags(request.app, doc["address"], guard))
+    # validated grades and their summary: dates are kept dates
+    doc["grades"] = restaurant.model_dump()["grades"]
+    doc.update(doGradeSummary(doc["grades"]))
+    # inserted document is returned as sent, with its new _id
+    created = doInsertOne(coll, doc, guard)
+    request.app.stats.touch(created)
+    request.app.rankings.touchRestaurant(created["restaurant_id"])
+    return created
 
 
 @rest_router.put(
@@ -236,25 +275,45 @@ def update_restaurant(
         sort(SortParams{field:str, way:1|-1}): ascending order by default.\n
 
     @return:\n
-        Restaurant: the updated restaurant.
+        Restaurant: the updated restaurant.\n
+        With WRITE_BEHIND=on: 202 {restaurant_id, queued: changes} - changes are written within WRITE_BEHIND_FLUSH_MS.
     """
     coll: Collection = request.app.db_restaurants
-    result = coll.update_one({"restaurant_id": id}, {"$set": changes})
-    if result.matched_count == 0:
+    guard = doRequestGuard(request)
+    # new coord: neighborhood and borough tags follow
+    address = doChangedAddress(changes)
+    if address is not None:
+        changes = {**changes, **doRestaurantTags(request.app, address, guard)}
+        # previous neighborhood is unknown: every stats are refreshed
+        request.app.stats.touchAll()
+    changes = doSummaryChanges(changes)
+    partial_grades = doPartialGrades(changes)
+    queue: WriteBehindQueue = request.app.write_behind
+    if queue is not None:
+        # restaurant_id and grades elements changes are written at once: later updates target the new id,
+        # summary is read from stored grades
+        if "restaurant_id" not in changes and not partial_grades and queue.enqueue(doWriteColl(coll, guard), id, changes):
+            request.app.stats.touchRestaurant(id)
+            request.app.rankings.touchRestaurant(id)
+            return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content=jsonable_encoder({"restaurant_id": id, "queued": changes}))
+        queue.flush()
+    # updated document is returned by the same round trip, restaurant_id changes included
+    updated = doUpdateOne(coll, {"restaurant_id": id}, {"$set": changes}, guard)
+    if updated is None:
         raise HTTPException(
             status_code=404, detail=f"No match with restaurant_id {id}."
         )
-    confirm = coll.find_one(
-        {
-            "restaurant_id": (
-                changes["restaurant_id"] if hasattr(changes, "restaurant_id") else id
-            )
-        }
-    )
-    return confirm
+    if partial_grades:
+        # summary from stored grades, one more round trip
+        updated = doUpdateOne(coll, {"_id": updated["_id"]}, SUMMARY_UPDATE, guard) or updated
+    request.app.stats.touch(updated)
+    # previous id: rankings it was in
+    request.app.rankings.touchRestaurant(id)
+    request.app.rankings.touchRestaurant(updated["restaurant_id"])
+    return updated
 
 
-@rest_router.put("/update/field/name", response_description="change field name")
+@rest_router.put("/update/field/name", response_description="change field name", status_code=status.HTTP_202_ACCEPTED)
 def update_restaurants_field(
     request: Request,
     field: Annotated[str, Body(embed=True)],
@@ -277,32 +336,22 @@ def update_restaurants_field(
         sort(SortParams{field:str, way:1|-1}): ascending order by default.\n
 
     @return:\n
-        {field, new_field, nbr of items processed}.
+        Job: {id, status, total, processed, matched, modified, progress, eta_s} - update runs in background, follow it at /jobs/{id}.
     """
-    coll = request.app.db_restaurants
-    skip, limit, sort = httpParamsInterpreter(params)
-    # update_many(filter<{'name':'Wendys'}>, update<{field:{'$exists':True}},{"$rename": {field: new_field}})
-    if params.filters and len(params.filters) > 0:
-        query = Filter(**params.filters).make()
-    l_aggreg = [{field: {"$exists": True}}, {"$rename": {field: new_field}}]
-    query and l_aggreg.insert(0, query["$match"])
-    skip and l_aggreg.append(skip)
-    limit and l_aggreg.append(limit)
-    cursor = coll.update_many(*l_aggreg)
-    if cursor.modified_count > 0:
-        return {
-            "new_field": new_field,
-            "matched": cursor.matched_count,
-            "modified": cursor.modified_count,
-        }
-    else:
-        raise HTTPException(
-            status_code=404,
-            detail=f"No field modified for new field {new_field} and filters {params.filters}.",
-        )
+    guard = doRequestGuard(request)
+    match = Filter(**params.filters).makeMatch() if params.filters else {}
+    doFlushPending(request.app.write_behind)
+    job = request.app.jobs.create(
+        request.app.db_restaurants.name,
+        {"$and": [match, {field: {"$exists": True}}]},
+        {"$rename": {field: new_field}},
+        description=f'rename field {field} to {new_field}',
+        write_concern=guard.write_concern,
+    )
+    return doReport(job)
 
 
-@rest_router.put("/update/field/set", response_description="set field value")
+@rest_router.put("/update/field/set", response_description="set field value", status_code=status.HTTP_202_ACCEPTED)
 def update_restaurants_value(
     request: Request,
     new_item: Annotated[dict[str, Any], Body(embed=True)],
@@ -321,32 +370,40 @@ def update_restaurants_value(
         sort(SortParams{field:str, way:1|-1}): ascending order by default.\n
 
     @return:\n
-       {field: number of items processed}[]
+        Job: {id, status, total, processed, matched, modified, progress, eta_s} - update runs in background, follow it at /jobs/{id}.\n
+        With WRITE_BEHIND=on and a filter on one restaurant_id ($eq): 202 {restaurant_id, queued: new_item}, merged with pending /update changes
+        (no upsert: an unknown restaurant_id is ignored).
     """
-    coll: Collection = request.app.db_restaurants
-    skip, limit, sort = httpParamsInterpreter(params)
-    # update_many(filter<{'name':'Wendys'}>, update<{$set:{'cuisine':'BUDU'}}, upsert<Bool: insert if not present>>)
-    if params.filters and len(params.filters) > 0:
-        query = Filter(**params.filters).make()
-    l_aggreg = [{"$set": new_item}]
-    query and l_aggreg.insert(0, query["$match"])
-    skip and l_aggreg.append(skip)
-    limit and l_aggreg.append(limit)
-    cursor = coll.update_many(*l_aggreg, upsert=True)
-    if cursor.modified_count > 0:
-        return {
-            "new_value": new_item,
-            "matched": cursor.matched_count,
-            "modified": cursor.modified_count,
-        }
-    else:
-        raise HTTPException(
-            status_code=404,
-            detail=f"No item modified for new item {new_item} and filters {params.filters}.",
-        )
+    guard = doRequestGuard(request)
+    match = Filter(**params.filters).makeMatch() if params.filters else {}
+    # one coord set on every matched restaurant: same tags for all of them
+    address = doChangedAddress(new_item)
+    if address is not None:
+        new_item = {**new_item, **doRestaurantTags(request.app, address, guard)}
+        request.app.stats.touchAll()
+    # grades elements ("grades.0.score") can't be summarized here: run POST /admin/grade_summary afterwards
+    new_item = doSummaryChanges(new_item)
+    queue: WriteBehindQueue = request.app.write_behind
+    restaurant_id = doRestaurantId(match)
+    if queue is not None:
+        # one restaurant: merged with its pending /update changes, other filters are run as jobs after pending updates
+        if restaurant_id is not None and queue.enqueue(doWriteColl(request.app.db_restaurants, guard), restaurant_id, new_item):
+            request.app.stats.touchRestaurant(restaurant_id)
+            request.app.rankings.touchRestaurant(restaurant_id)
+            return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content=jsonable_encoder({"restaurant_id": restaurant_id, "queued": new_item}))
+        queue.flush()
+    job = request.app.jobs.create(
+        request.app.db_restaurants.name,
+        match,
+        {"$set": new_item},
+        upsert=True,
+        description=f'set {", ".join(new_item)}',
+        write_concern=guard.write_concern,
+    )
+    return doReport(job)
 
 
-@rest_router.delete("/update/field/unset", response_description="delete a field")
+@rest_router.delete("/update/field/unset", response_description="delete a field", status_code=status.HTTP_202_ACCEPTED)
 def delete_restaurant_field(
     request: Request,
     field: Annotated[str, Body(embed=True)],
@@ -365,29 +422,19 @@ def delete_restaurant_field(
         sort(SortParams{field:str, way:1|-1}): ascending order by default.\n
 
     @return:\n
-        {<field>: number_of_items_processed}
+        Job: {id, status, total, processed, matched, modified, progress, eta_s} - update runs in background, follow it at /jobs/{id}.
     """
-    coll = request.app.db_restaurants
-    skip, limit, sort = httpParamsInterpreter(params)
-    if params.filters and len(params.filters) > 0:
-        query = Filter(**params.filters).make()
-    l_aggreg = [{"$unset": {field: ""}}]
-    query and l_aggreg.insert(0, query["$match"])
-    skip and l_aggreg.append(skip)
-    limit and l_aggreg.append(limit)
-    # update_many(filter<{'name':'Wendys'}>, update<{$unset:{'cuisine':''}})
-    cursor = coll.update_many(*l_aggreg)
-    if cursor.modified_count > 0:
-        return {
-            "field": field,
-            "matched": cursor.matched_count,
-            "modified": cursor.modified_count,
-        }
-    else:
-        raise HTTPException(
-            status_code=404,
-            detail=f"No item modified for field {field} and filters {params.filters}.",
-        )
+    guard = doRequestGuard(request)
+    match = Filter(**params.filters).makeMatch() if params and params.filters else {}
+    doFlushPending(request.app.write_behind)
+    job = request.app.jobs.create(
+        request.app.db_restaurants.name,
+        {"$and": [match, {field: {"$exists": True}}]},
+        {"$unset": {field: ""}},
+        description=f'unset field {field}',
+        write_concern=guard.write_concern,
+    )
+    return doReport(job)
 
 
 @rest_router.delete(
@@ -415,8 +462,16 @@ def delete_restaurant(
     @return:\n
         {restaurant_id: str, deleted_nbr: int}
     """
-    coll: Collection = request.app.db_restaurants
+    coll: Collection = doWriteColl(request.app.db_restaurants, doRequestGuard(request))
+    # pending updates of the restaurant are written before it is deleted, not after
+    doFlushPending(request.app.write_behind)
+    # tags of deleted restaurants, for stats refresh
+    l_tags = list(coll.find({"restaurant_id": id}, TAGS_PROJECTION))
     result = coll.delete_many({"restaurant_id": id})
+    doInvalidate(coll)
+    for tags in l_tags:
+        request.app.stats.touch(tags)
+    request.app.rankings.touchRestaurant(id)
     if result.deleted_count > 0:
         return {"restaurant_id": id, "deleted_nbr": result.deleted_count}
     else:
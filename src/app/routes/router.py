@@ -4,6 +4,13 @@ from .restaurant_routes import rest_router as restaurant_router
 from .neighborhood_routes import neighb_router as neighborhood_router
 from .borough_routes import borough_router
 from .point_routes import point_router
+from .ranking_routes import ranking_router
+from .export_routes import export_router
+from .batch_routes import batch_router
+from .admin_routes import admin_router
+from .job_routes import job_router
+from .health_routes import health_router
+from .metrics_routes import metrics_router
 
 router = APIRouter()
 
@@ -11,4 +18,11 @@ router = APIRouter()
 router.include_router(restaurant_router)
 router.include_router(neighborhood_router)
 router.include_router(borough_router)
-router.include_router(point_router)
\ No newline at end of file
+router.include_router(point_router)
+router.include_router(ranking_router)
+router.include_router(export_router)
+router.include_router(batch_router)
+router.include_router(admin_router)
+router.include_router(job_router)
+router.include_router(health_router)
+router.include_router(metrics_router)
\ No newline at end of file
@@ -0,0 +1,29 @@
+"""
+SERVER ENTRY POINT -
+    MODE=prod: gunicorn master with WEB_CONCURRENCY uvicorn workers (see gunicorn_conf.py).
+    MODE=dev: single uvicorn process.
+
+From root of the project:
+    python -m src.app.server
+In docker image (PYTHONPATH=/app):
+    python -m app.server
+"""
+import os
+
+from .config import HOST, KEEP_ALIVE, MODE, PORT
+
+APP = f'{__package__}.main:app'
+
+
+def main():
+    if MODE == 'prod':
+        os.environ['APP_PACKAGE'] = __package__
+        conf = os.path.join(os.path.dirname(__file__), 'gunicorn_conf.py')
+        os.execvp('gunicorn', ['gunicorn', '-c', conf, APP])
+    else:
+        import uvicorn
+        uvicorn.run(APP, host=HOST, port=PORT, timeout_keep_alive=KEEP_ALIVE)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,32 @@
+import os
+import sys
+
+import mongomock
+import pytest
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+"""
+TESTS -
+Unit tests run against mongomock (no mongod needed), as benchmarks/load_test.py --backend inprocess:
+    pip install -r tests/requirements.txt
+    python -m pytest tests
+"""
+
+
+@pytest.fixture
+def mongo():
+    return mongomock.MongoClient()
+
+
+@pytest.fixture
+def client(mongo, monkeypatch):
+    """
+    Api client whose MongoClient is the mongomock client of the test (warmup tasks failing on
+    operators unsupported by mongomock are not critical).
+    """
+    import app.main as app_main
+    monkeypatch.setattr(app_main, "MongoClient", lambda *a, **k: mongo)
+    with TestClient(app_main.app) as client:
+        yield client
@@ -0,0 +1,32 @@
+import json
+
+import pytest
+
+from app.config import DB_NAME
+
+
+@pytest.fixture
+def restaurants(mongo):
+    l_docs = [{"restaurant_id": str(i), "name": f"R{i}", "borough": "Queens", "cuisine": "Pizza", "grades": []} for i in range(25)]
+    mongo[DB_NAME]["restaurants"].insert_many(l_docs)
+    return l_docs
+
+
+def doExported(response) -> list[dict]:
+    return [json.loads(line) for line in response.text.splitlines() if line.strip()]
+
+
+def test_export_reads_every_batch(client, restaurants, monkeypatch):
+    import app.routes.export_routes as export_routes
+    monkeypatch.setattr(export_routes, "EXPORT_BATCH_SIZE", 10)
+    response = client.post("/export/restaurants?format=ndjson")
+    assert response.status_code == 200
+    assert [doc["restaurant_id"] for doc in doExported(response)] == [doc["restaurant_id"] for doc in restaurants]
+
+
+def test_export_resumes_after_id(client, restaurants, monkeypatch):
+    import app.routes.export_routes as export_routes
+    monkeypatch.setattr(export_routes, "EXPORT_BATCH_SIZE", 10)
+    after = str(restaurants[11]["_id"])
+    response = client.post(f"/export/restaurants?format=ndjson&after={after}")
+    assert [doc["restaurant_id"] for doc in doExported(response)] == [doc["restaurant_id"] for doc in restaurants[12:]]
@@ -0,0 +1,14 @@
+from app.config import DB_NAME
+
+
+def test_distinct_without_nbr_returns_every_value(client, mongo):
+    names = [f"Restaurant {i:05d}" for i in range(12000)]
+    mongo[DB_NAME]["restaurants"].insert_many([{"name": name, "cuisine": "Pizza", "borough": "Manhattan"} for name in names])
+    response = client.post("/distinct", json={"params": {"sort": {"field": "name", "way": 1}}})
+    assert response.status_code == 200
+    assert [item["name"] for item in response.json()["data"]] == names
+
+
+def test_distinct_nbr_over_max_is_rejected(client):
+    response = client.post("/distinct", json={"params": {"nbr": 50001, "sort": {"field": "name", "way": 1}}})
+    assert response.status_code == 422
@@ -0,0 +1,128 @@
+import os
+from datetime import datetime
+
+from pydantic import TypeAdapter, constr
+from pymongo import UpdateOne
+
+from app.models.models import Restaurant
+from app.modules.importer import importer
+from app.modules.importer.importer import ImportFormat, doIterChunks, doParseChunk, doUpsertOps
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def doParseFile(path: str, fmt: ImportFormat, chunk_rows: int) -> list[dict]:
+    return [doParseChunk(records, fmt, fieldnames) for records, fieldnames in doIterChunks(path, fmt, chunk_rows)]
+
+
+def test_csv_records_with_newlines_are_not_split_between_chunks():
+    # record of lines 3-4 ends the first chunk, record of lines 6-8 starts the third one
+    results = doParseFile(os.path.join(FIXTURES, 'inspections_multiline.csv'), ImportFormat.CSV, chunk_rows=2)
+    assert [result["rows"] for result in results] == [2, 2, 2]
+    rejected = [reject for result in results for reject in result["rejected"]]
+    assert [(reject["line"], reject["reason"]) for reject in rejected] == [
+        (5, "invalid date '13/45/2023'"),
+        (9, "missing CAMIS (restaurant_id)"),
+        (10, "unreadable record"),
+    ]
+    docs = {doc["restaurant_id"]: doc for result in results for doc in result["docs"]}
+    assert sorted(docs) == ["40000001", "40000002"]
+    assert docs["40000002"]["grades"] == [{"date": datetime(2022, 6, 15), "grade": "B", "score": 25}]
+
+
+def test_chunk_size_does_not_change_parsing():
+    path = os.path.join(FIXTURES, 'inspections_multiline.csv')
+    for chunk_rows in (1, 2, 3, 100):
+        results = doParseFile(path, ImportFormat.CSV, chunk_rows)
+        assert sum(result["rows"] for result in results) == 6
+        assert sorted(reject["line"] for result in results for reject in result["rejected"]) == [5, 9, 10]
+
+
+CSV_HEADER = ["camis", "dba", "boro", "building", "street", "zipcode", "cuisine_description", "inspection_date", "score", "grade", "grade_date", "latitude", "longitude"]
+
+
+def doCsvRecords(*rows: list[str]) -> list[tuple[int, list[str]]]:
+    return [(line, row) for line, row in enumerate(rows, start=2)]
+
+
+def test_csv_rows_are_grouped_by_camis_with_grades_deduplicated():
+    result = doParseChunk(doCsvRecords(
+        # one inspection, two violations: one grade
+        ["50000001", "CAFE ONE", "Manhattan", "1", "BROADWAY", "10004", "Coffee", "03/01/2023", "10", "A", "03/01/2023", "40.70", "-74.01"],
+        ["50000001", "CAFE ONE", "Manhattan", "1", "BROADWAY", "10004", "Coffee", "03/01/2023", "10", "A", "03/01/2023", "40.70", "-74.01"],
+        # next inspection, restaurant renamed: last row wins
+        ["50000001", "CAFE 1", "Manhattan", "1", "BROADWAY", "10004", "Coffee", "09/12/2023", "", "B", "09/12/2023", "40.70", "-74.01"],
+        # not inspected yet: no grade, missing coordinates
+        ["50000002", "NEW BAGELS", "Queens", "5", "MAIN ST", "11354", "Bagels", "01/01/1900", "", "", "", "0", "0"],
+    ), ImportFormat.CSV, CSV_HEADER)
+    assert result["rows"] == 4 and result["rejected"] == [] and result["grades"] == 2
+    docs = {doc["restaurant_id"]: doc for doc in result["docs"]}
+    assert docs["50000001"]["name"] == "CAFE 1"
+    assert docs["50000001"]["address"] == {"building": "1", "coord": [-74.01, 40.70], "street": "BROADWAY", "zipcode": "10004"}
+    assert docs["50000001"]["grades"] == [
+        {"date": datetime(2023, 3, 1), "grade": "A", "score": 10},
+        {"date": datetime(2023, 9, 12), "grade": "B", "score": None},
+    ]
+    assert docs["50000002"]["grades"] == [] and docs["50000002"]["address"]["coord"] == []
+
+
+def test_ndjson_keys_are_normalized_and_bad_lines_rejected():
+    records = list(enumerate([
+        '{"camis": "50000003", "dba": "TACO PLACE", "boro": "Bronx", "building": "9", "street": "GRAND CONCOURSE", "zipcode": 10451, '
+        '"cuisine_description": "Mexican", "inspection_date": "2023-05-02T00:00:00.000", "score": "7", "grade": "A"}\n',
+        '{"CAMIS": "50000004", "DBA": "NOODLES", "BORO": "Brooklyn", "CUISINE DESCRIPTION": "Chinese", "INSPECTION DATE": "2023-05-03", "SCORE": "x"}\n',
+        'not json\n',
+        '["a", "list"]\n',
+    ], start=1))
+    result = doParseChunk(records, ImportFormat.NDJSON, None)
+    assert result["rows"] == 4
+    assert [(reject["line"], reject["reason"]) for reject in result["rejected"]] == [
+        (2, "could not convert string to float: 'x'"),
+        (3, "unreadable record"),
+        (4, "unreadable record"),
+    ]
+    assert [doc["restaurant_id"] for doc in result["docs"]] == ["50000003"]
+    doc = result["docs"][0]
+    assert doc["address"]["zipcode"] == "10451"
+    assert doc["grades"] == [{"date": datetime(2023, 5, 2), "grade": "A", "score": 7}]
+
+
+def test_invalid_restaurants_are_rejected_on_each_of_their_lines(monkeypatch):
+    # stricter model than Restaurant: every row of an invalid restaurant is rejected, others are kept
+    class NamedRestaurant(Restaurant):
+        name: constr(min_length=1)
+
+    monkeypatch.setattr(importer, "RESTAURANTS_ADAPTER", TypeAdapter(list[NamedRestaurant]))
+    result = doParseChunk(doCsvRecords(
+        ["50000005", "", "Bronx", "2", "ARTHUR AVE", "10458", "Italian", "04/04/2023", "12", "A", "04/04/2023", "", ""],
+        ["50000006", "DELI", "Bronx", "3", "ARTHUR AVE", "10458", "Deli", "04/04/2023", "20", "B", "04/04/2023", "", ""],
+        ["50000005", "", "Bronx", "2", "ARTHUR AVE", "10458", "Italian", "05/04/2023", "9", "A", "05/04/2023", "", ""],
+    ), ImportFormat.CSV, CSV_HEADER)
+    assert [doc["restaurant_id"] for doc in result["docs"]] == ["50000006"]
+    assert [reject["line"] for reject in result["rejected"]] == [2, 4]
+    assert all(reject["reason"].startswith("name: ") for reject in result["rejected"])
+    assert result["grades"] == 1
+
+
+def test_upserts_set_fields_and_merge_grades():
+    grade = {"date": datetime(2023, 3, 1), "grade": "A", "score": 10}
+    docs = [
+        {"restaurant_id": "1", "name": "A", "grades": [grade]},
+        {"restaurant_id": "2", "name": "B", "grades": []},
+    ]
+    ops = doUpsertOps(docs)
+    assert ops == [
+        UpdateOne({"restaurant_id": "1"}, {"$set": {"restaurant_id": "1", "name": "A"}, "$addToSet": {"grades": {"$each": [grade]}}}, upsert=True),
+        UpdateOne({"restaurant_id": "2"}, {"$set": {"restaurant_id": "2", "name": "B"}, "$setOnInsert": {"grades": []}}, upsert=True),
+    ]
+
+
+def test_import_twice_merges_grades(mongo):
+    coll = mongo["test"]["restaurants"]
+    grade_a = {"date": datetime(2023, 3, 1), "grade": "A", "score": 10}
+    grade_b = {"date": datetime(2023, 9, 1), "grade": "B", "score": 20}
+    coll.bulk_write(doUpsertOps([{"restaurant_id": "1", "name": "A", "grades": [grade_a]}]))
+    coll.bulk_write(doUpsertOps([{"restaurant_id": "1", "name": "A2", "grades": [grade_a, grade_b]}]))
+    coll.bulk_write(doUpsertOps([{"restaurant_id": "1", "name": "A3", "grades": []}]))
+    doc = coll.find_one({"restaurant_id": "1"}, {"_id": 0})
+    assert doc == {"restaurant_id": "1", "name": "A3", "grades": [grade_a, grade_b]}
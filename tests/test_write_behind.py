@@ -0,0 +1,95 @@
+import pytest
+from pymongo.errors import AutoReconnect
+
+from app.database.write_behind import WriteBehindQueue
+
+
+@pytest.fixture
+def coll(mongo):
+    coll = mongo["test"]["restaurants"]
+    coll.insert_many([{"restaurant_id": "1", "name": "A", "cuisine": "Pizza"}, {"restaurant_id": "2", "name": "B", "cuisine": "Thai"}])
+    return coll
+
+
+@pytest.fixture
+def writes(coll, monkeypatch):
+    """
+    Operations of each bulk_write of coll.
+    """
+    l_writes = []
+    bulk_write = coll.bulk_write
+
+    def doBulkWrite(requests, **kwargs):
+        l_writes.append(list(requests))
+        return bulk_write(requests, **kwargs)
+    monkeypatch.setattr(coll, "bulk_write", doBulkWrite)
+    return l_writes
+
+
+def doRestaurant(coll, restaurant_id: str) -> dict:
+    return coll.find_one({"restaurant_id": restaurant_id}, {"_id": 0})
+
+
+def test_updates_of_one_restaurant_are_merged_in_one_operation(coll, writes):
+    queue = WriteBehindQueue(flush_ms=60000)
+    assert queue.enqueue(coll, "1", {"name": "A1", "cuisine": "Bakery"})
+    assert queue.enqueue(coll, "1", {"name": "A2"})
+    assert queue.enqueue(coll, "2", {"name": "B1"})
+    queue.flush()
+    assert len(writes) == 1 and len(writes[0]) == 2
+    assert doRestaurant(coll, "1") == {"restaurant_id": "1", "name": "A2", "cuisine": "Bakery"}
+    assert doRestaurant(coll, "2") == {"restaurant_id": "2", "name": "B1", "cuisine": "Thai"}
+
+
+def test_failed_flush_is_queued_again_under_newer_updates(coll, monkeypatch):
+    queue = WriteBehindQueue(flush_ms=60000)
+    bulk_write = coll.bulk_write
+
+    def doUnreachable(requests, **kwargs):
+        # update accepted while the failing flush is in flight
+        queue.enqueue(coll, "1", {"name": "A3"})
+        raise AutoReconnect("connection refused")
+    monkeypatch.setattr(coll, "bulk_write", doUnreachable)
+    queue.enqueue(coll, "1", {"name": "A1", "cuisine": "Bakery"})
+    queue.flush()
+    assert doRestaurant(coll, "1")["name"] == "A"
+    assert len(queue.pending) == 1
+
+    monkeypatch.setattr(coll, "bulk_write", bulk_write)
+    queue.flush()
+    assert doRestaurant(coll, "1") == {"restaurant_id": "1", "name": "A3", "cuisine": "Bakery"}
+    assert len(queue.pending) == 0
+
+
+def test_unknown_restaurant_is_not_upserted(coll):
+    queue = WriteBehindQueue(flush_ms=60000)
+    queue.enqueue(coll, "3", {"name": "C"})
+    queue.flush()
+    assert doRestaurant(coll, "3") is None
+
+
+def test_close_drains_queue_and_refuses_updates(coll):
+    queue = WriteBehindQueue(flush_ms=60000)
+    queue.start()
+    queue.enqueue(coll, "1", {"name": "A1"})
+    queue.enqueue(coll, "2", {"name": "B1"})
+    queue.close()
+    assert not queue.thread.is_alive()
+    assert doRestaurant(coll, "1")["name"] == "A1" and doRestaurant(coll, "2")["name"] == "B1"
+    assert not queue.enqueue(coll, "1", {"name": "A2"})
+    assert doRestaurant(coll, "1")["name"] == "A1"
+
+
+def test_max_ops_flushes_before_flush_interval(coll):
+    queue = WriteBehindQueue(flush_ms=60000, max_ops=2)
+    queue.start()
+    try:
+        queue.enqueue(coll, "1", {"name": "A1"})
+        queue.enqueue(coll, "2", {"name": "B1"})
+        for _ in range(100):
+            if doRestaurant(coll, "2")["name"] == "B1":
+                break
+            queue.thread.join(0.01)
+        assert doRestaurant(coll, "1")["name"] == "A1" and doRestaurant(coll, "2")["name"] == "B1"
+    finally:
+        queue.close()